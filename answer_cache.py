@@ -0,0 +1,130 @@
+"""Semantic cache for RAG answers.
+
+A question is a hit when an earlier question asked with the same settings
+(doc_id filter, instruction, retrieval options, chat history) has a cosine
+similarity of at least `threshold`. Entries remember the documents their
+chunks came from, so changing or deleting one of them drops every answer
+that could depend on it; answers scoped to all documents are dropped on any
+change. It is thread-safe: in-process it is used from the event loop and
+worker threads, and in the vector service from every connection thread.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("vector", "scope", "doc_id", "doc_ids", "chunk_ids", "answer", "created")
+
+    def __init__(self, vector, scope, doc_id, doc_ids, chunk_ids, answer):
+        self.vector = vector
+        self.scope = scope
+        self.doc_id = doc_id
+        self.doc_ids = doc_ids
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.created = time.monotonic()
+
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # least recently used first
+        self._next_id = 0
+        # Bumped on every invalidation; answers computed across one are not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.RLock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _expire(self):
+        now = time.monotonic()
+        for entry_id in [i for i, e in self._entries.items() if now - e.created > self.ttl]:
+            del self._entries[entry_id]
+            self.evictions += 1
+
+    def get(self, vector, scope: tuple) -> Optional[dict]:
+        """Best cached answer for a question vector within `scope`, or None."""
+        with self._lock:
+            self._expire()
+            ids = [i for i, e in self._entries.items() if e.scope == scope]
+            if not ids:
+                self.misses += 1
+                return None
+
+            sims = np.stack([self._entries[i].vector for i in ids]) @ _unit(vector)
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(ids[best])
+            entry = self._entries[ids[best]]
+            self.hits += 1
+            return {"answer": entry.answer, "used_chunks": entry.chunk_ids,
+                    "similarity": round(float(sims[best]), 4)}
+
+    def lookup(self, vector, scope: tuple, use_cache: bool = True):
+        """(generation, hit) for a question: the generation to pass to `put`, and `get`'s answer or None."""
+        with self._lock:
+            generation = self.generation
+            hit = self.get(vector, scope) if use_cache and self.enabled else None
+            return generation, hit
+
+    def put(self, vector, scope: tuple, doc_id: Optional[str], chunk_ids: List[str], doc_ids: Iterable[str],
+            answer: str, generation: int):
+        """Store an answer computed while the cache was at `generation`."""
+        with self._lock:
+            if not self.enabled or generation != self.generation:
+                return
+            self._next_id += 1
+            self._entries[self._next_id] = _Entry(_unit(vector), scope, doc_id, frozenset(doc_ids), chunk_ids, answer)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_document(self, doc_id: str):
+        """Drop answers that used `doc_id`, were filtered to it, or searched all documents."""
+        with self._lock:
+            self.generation += 1
+            for entry_id, entry in list(self._entries.items()):
+                if entry.doc_id is None or entry.doc_id == doc_id or doc_id in entry.doc_ids:
+                    del self._entries[entry_id]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -1,19 +1,53 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
 print("Starting script...", flush=True)
+import asyncio
 import base64
-import io
+import functools
+import json
 import os
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
 import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Dict, List, Optional
 
 import numpy as np
 from fastapi import FastAPI, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import chromadb
-import fitz  # PyMuPDF
+# chromadb, PyMuPDF and the OpenAI SDK are imported on first use (or by the warm-up), not here
+
+from document_analysis import MapReduceAnalyzer
+from answer_cache import AnswerCache
+from embedding_cache import EmbeddingCache
+from embedding_engines import load_engine
+from embedding_service import EmbeddingBatcher
+from image_processing import DEFAULT_MAX_PIXELS, preprocess_image
+from ingestion import aiter_in_pool, aiter_pages, chunk_hash, file_hash, ingest_pages, iter_chunks, open_pages
+from uploads import BulkSource, SpoolWriter, SpooledFile, batch_images, clear_spool, resolve_directory
+from jobs import Job, JobQueue, RemoteJobQueue
+from llm_router import LLMRouter
+import metrics
+from metrics import MetricsMiddleware, record_llm, record_stage, stage
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from registry import DocumentRegistry
+from prompt_builder import PromptBuilder, TokenCounter, parse_budgets
+from reranking import CrossEncoderReranker, cosine_scores, mmr
+from result_cache import ResultCache, cache_key
+from startup import Startup
+from vector_store import open_store
+from vector_service import RemoteObject, ServiceClient, ServiceServer
 # from sentence_transformers import SentenceTransformer
 
+STARTUP = Startup(BOOT_STARTED)
+STARTUP.record("imports", time.perf_counter() - BOOT_STARTED)
 print("Imports done.", flush=True)
 
 # =========================
@@ -23,35 +57,366 @@ print("Imports done.", flush=True)
 # LM Studio server (OpenAI-compatible)
 LM_STUDIO_BASE_URL = os.getenv("LM_STUDIO_BASE_URL", "http://127.0.0.1:1234/v1")
 LM_STUDIO_API_KEY = os.getenv("LM_STUDIO_API_KEY", "lm-studio")  # dummy key, LM Studio ignores it
+# Comma-separated list of servers to load-balance across; defaults to LM_STUDIO_BASE_URL alone
+LM_STUDIO_BASE_URLS = [u.strip() for u in os.getenv("LM_STUDIO_BASE_URLS", LM_STUDIO_BASE_URL).split(",") if u.strip()]
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "3"))
+LLM_EJECT_AFTER = int(os.getenv("LLM_EJECT_AFTER", "3"))  # consecutive failures before a backend is ejected
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))  # keep-alive pool per backend
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
 
 # Model names as shown in LM Studio
 QWEN_VL_MODEL_NAME = os.getenv("QWEN_VL_MODEL_NAME", "qwen/qwen3-vl-4b-instruct")
 QWEN_CHAT_MODEL_NAME = os.getenv("QWEN_CHAT_MODEL_NAME", QWEN_VL_MODEL_NAME)
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+# "sentence-transformers" (PyTorch) or "onnx" (ONNX Runtime on CPU, never imports torch)
+EMBEDDING_ENGINE = os.getenv("EMBEDDING_ENGINE", "sentence-transformers")
+# ONNX file inside the model repo or directory; ONNX_QUANTIZE=1 converts a float32 export to int8 on first load
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE", "onnx/model_quint8_avx2.onnx")
+ONNX_QUANTIZE = os.getenv("ONNX_QUANTIZE", "0") == "1"
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 lets ONNX Runtime pick
 
-client = OpenAI(
-    base_url=LM_STUDIO_BASE_URL,
+LLM_ROUTER = LLMRouter(
+    LM_STUDIO_BASE_URLS,
     api_key=LM_STUDIO_API_KEY,
+    max_attempts=LLM_MAX_ATTEMPTS,
+    eject_after=LLM_EJECT_AFTER,
+    health_interval=LLM_HEALTH_INTERVAL,
+    max_connections=LLM_MAX_CONNECTIONS,
+    timeout=LLM_TIMEOUT,
 )
+# Same interface as AsyncOpenAI: client.chat.completions.create(...)
+client = LLM_ROUTER
+
+CHROMA_PATH = os.getenv("CHROMA_PATH", "./chroma_db")
+# Embeddings survive /rag/clear and restarts; lives next to Chroma so the Docker volume keeps it
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(CHROMA_PATH, "embedding_cache.sqlite3"))
+EMBED_CACHE_MAX_MB = int(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+REGISTRY_PATH = os.getenv("REGISTRY_PATH", os.path.join(CHROMA_PATH, "documents.sqlite3"))
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(CHROMA_PATH, "bm25_index.pkl"))
+BM25_SAVE_INTERVAL = float(os.getenv("BM25_SAVE_INTERVAL", "30"))
+
+# Where chunk vectors live: "chroma" (a Chroma collection under CHROMA_PATH) or "local", a
+# memory-mapped index under VECTOR_STORE_PATH. Engines don't share data; re-ingest after switching.
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", os.path.join(CHROMA_PATH, "vectors"))
+# Local engine only: stored precision ("float32", "float16" or "int8"), and the search index:
+# "exact", "ivf", or "auto" (IVF once the store holds VECTOR_ANN_MIN_CHUNKS chunks)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "auto")
+VECTOR_ANN_MIN_CHUNKS = int(os.getenv("VECTOR_ANN_MIN_CHUNKS", "50000"))
+VECTOR_ANN_PROBES = int(os.getenv("VECTOR_ANN_PROBES", "32"))  # IVF lists scanned per query
+
+# "vector", "bm25" or "hybrid" (reciprocal rank fusion of both); overridable per request
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))
+# Candidates are diversified with MMR down to RAG_TOP_K, optionally reranked, then packed
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+RERANKER = os.getenv("RERANKER", "none")  # "none", "embedding" or "cross-encoder"
+RERANKER_MODEL = os.getenv("RERANKER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Semantic answer cache for /rag/ask: a question this similar to an earlier one (same doc_id
+# filter and settings) reuses its answer until a document it depends on changes
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))  # 0 disables
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Prompts are sized in tokens. PROMPT_TOKENIZER names a locally available Hugging Face
+# tokenizer; when empty (or not found) an offline estimator is used instead.
+PROMPT_TOKENIZER = os.getenv("PROMPT_TOKENIZER", "")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "3000"))
+PROMPT_TOKEN_BUDGETS = parse_budgets(os.getenv("PROMPT_TOKEN_BUDGETS", ""))  # "model=tokens,..."
+PROMPT_HISTORY_SHARE = float(os.getenv("PROMPT_HISTORY_SHARE", "0.25"))
+
+# /analyze/document: "single" sends one (cut) prompt, "map-reduce" summarizes sections in
+# parallel and merges them, "auto" uses map-reduce only when the document doesn't fit
+ANALYZE_MODE = os.getenv("ANALYZE_MODE", "auto")
+ANALYZE_SECTION_CHARS = int(os.getenv("ANALYZE_SECTION_CHARS", "6000"))
+ANALYZE_CONCURRENCY = int(os.getenv("ANALYZE_CONCURRENCY", "4"))
+ANALYZE_CACHE_SIZE = int(os.getenv("ANALYZE_CACHE_SIZE", "2048"))  # cached section/merge results
+
+# /analyze/image: uploads are scaled down to the VL model's pixel budget and re-encoded
+# without metadata; answers are cached per (image, instruction, model)
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "1") == "1"
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(DEFAULT_MAX_PIXELS)))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", "256"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# /analyze/images/batch: parallel VL calls per batch (match LM Studio's parallel slots)
+IMAGE_BATCH_CONCURRENCY = int(os.getenv("IMAGE_BATCH_CONCURRENCY", "4"))
+IMAGE_BATCH_MAX_FILES = int(os.getenv("IMAGE_BATCH_MAX_FILES", "500"))
+# Size caps, uncompressed for images inside zips; batch uploads are spooled to disk, and
+# each image is read into memory only while it is being analyzed
+IMAGE_MAX_MB = int(os.getenv("IMAGE_MAX_MB", "50"))
+IMAGE_BATCH_MAX_MB = int(os.getenv("IMAGE_BATCH_MAX_MB", "2048"))
+
+# Worker pools for blocking work, so the event loop keeps serving requests.
+# Embedding runs in threads (torch releases the GIL and the model can't be
+# shared across processes); large PDFs are parsed on a process pool.
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "2"))
+VECTOR_WORKERS = int(os.getenv("VECTOR_WORKERS", "4"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+# PDFs with at least this many pages are split across the PDF worker processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# Concurrent encode requests are coalesced into one forward pass
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+
+# Uploads are embedded and written to the vector store this many chunks at a time
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+# Number of uploads processed at the same time by background workers
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
 
-# Global variable for lazy loading
+# Uploads are streamed to disk in chunks of this size instead of read into memory
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "zentro_uploads"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Bulk ingestion: files in flight per request, and a cap on documents per archive/directory
+BULK_INGEST_CONCURRENCY = int(os.getenv("BULK_INGEST_CONCURRENCY", "8"))
+BULK_INGEST_MAX_FILES = int(os.getenv("BULK_INGEST_MAX_FILES", "20000"))
+# Archive members are spooled uncompressed: a cap per document and for the whole archive
+BULK_INGEST_MAX_FILE_MB = int(os.getenv("BULK_INGEST_MAX_FILE_MB", "512"))
+BULK_INGEST_MAX_MB = int(os.getenv("BULK_INGEST_MAX_MB", "20480"))
+# Server-side directories that may be bulk-ingested (comma-separated); empty disables it
+BULK_INGEST_ROOTS = [p.strip() for p in os.getenv("BULK_INGEST_ROOTS", "").split(",") if p.strip()]
+
+# Per-stage timings are returned in a Server-Timing header; PROFILE_DIR enables
+# per-request cProfile reports for requests sent with `X-Profile: 1`
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "")
+
+# Open the vector store, load and test-encode the embedding model and create the LLM
+# clients in the background at startup; /ready answers 503 until they are done.
+# With WARMUP=0 each is loaded by the first request that needs it instead.
+WARMUP = os.getenv("WARMUP", "1") == "1"
+
+# `python backend.py` with WEB_WORKERS > 1 runs that many uvicorn workers plus one vector
+# service process that owns the embedding model, the vector store, BM25, the registry, the
+# caches and the ingest jobs. Workers find it through VECTOR_SERVICE (a Unix socket path); a process
+# started with VECTOR_SERVICE set is an HTTP worker of an already running service.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+VECTOR_SERVICE = os.getenv("VECTOR_SERVICE", "")
+VECTOR_SERVICE_TIMEOUT = float(os.getenv("VECTOR_SERVICE_TIMEOUT", "120"))  # seconds to wait for it at startup
+
+EMBED_POOL = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+VECTOR_POOL = ThreadPoolExecutor(max_workers=VECTOR_WORKERS, thread_name_prefix="vector")
+# PyMuPDF isn't thread-safe, so opening PDFs and reading small ones share one thread. Large PDFs are
+# extracted on the process pool and awaited on the event loop, so jobs don't queue behind each other here
+PDF_PAGE_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-pages")
+IMAGE_POOL = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image")
+# Spooling uploads to disk and reading bulk archives
+UPLOAD_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+_pdf_pool = None
+
+# The engine loads its model lazily; benchmarks may swap `_embedding_model` for a stand-in
+EMBEDDING_ENGINE_IMPL = load_engine(
+    EMBEDDING_ENGINE,
+    EMBEDDING_MODEL_NAME,
+    onnx_file=ONNX_MODEL_FILE,
+    onnx_quantize=ONNX_QUANTIZE,
+    onnx_threads=ONNX_THREADS,
+)
 _embedding_model = None
 
 def get_embedding_model():
     global _embedding_model
     if _embedding_model is None:
-        print("Lazy loading SentenceTransformer...", flush=True)
-        from sentence_transformers import SentenceTransformer
-        _embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        print("Lazy loaded.", flush=True)
+        _embedding_model = EMBEDDING_ENGINE_IMPL.load()
     return _embedding_model
 
-# Persistent Vector Store
-print("Initializing ChromaDB...", flush=True)
-CHROMA_CLIENT = chromadb.PersistentClient(path="./chroma_db")
-COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="zentro_docs")
-print("ChromaDB initialized.", flush=True)
 
-app = FastAPI(title="Qwen Backend")
+SERVICE = ServiceClient(VECTOR_SERVICE) if VECTOR_SERVICE else None
+# Set in the vector service process itself
+SERVING_VECTORS = False
+
+
+def shared(name: str, build):
+    """The global `name`: built here, or in an HTTP worker a proxy for the vector service's copy."""
+    return RemoteObject(SERVICE, name) if SERVICE is not None else build()
+
+
+def on_service(func):
+    """`func`, or in an HTTP worker a blocking stub that runs it in the vector service."""
+    if SERVICE is None:
+        return func
+    return functools.partial(SERVICE.call, "", func.__name__)
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    # Created on first use so importing the module doesn't fork workers
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pdf_pool
+
+
+async def run_in_pool(pool, func, *args, **kwargs):
+    """Run a blocking callable on the given executor without blocking the loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+
+# Persistent vector store (see vector_store.py), opened by `open_vector_store` on first use or by the warm-up
+STORE = shared("STORE", lambda: None)
+
+# Per-document metadata, so listing documents doesn't scan every chunk; opened with the vector store
+REGISTRY: Optional[DocumentRegistry] = shared("REGISTRY", lambda: None)
+
+# Lexical index for exact identifiers; rebuilt from the vector store if missing or out of sync
+BM25: Optional[BM25Index] = shared("BM25", lambda: None)
+
+
+def rebuild_bm25_index(page_size: int = 5000):
+    BM25.clear()
+    for batch in STORE.scan(page_size):
+        BM25.add([chunk_id for chunk_id, _, _ in batch], [text for _, text, _ in batch],
+                 [meta.get("doc_id", "") for _, _, meta in batch])
+    BM25.save()
+
+
+def load_vector_store():
+    """Open the vector store, the registry and the BM25 index, bringing the last two in line with the store (blocking)."""
+    global STORE, REGISTRY, BM25
+    print(f"Opening {VECTOR_STORE} vector store...", flush=True)
+    with STARTUP.timed(f"{VECTOR_STORE} store open"):
+        STORE = open_store(
+            VECTOR_STORE,
+            CHROMA_PATH if VECTOR_STORE == "chroma" else VECTOR_STORE_PATH,
+            dtype=VECTOR_DTYPE,
+            index=VECTOR_INDEX,
+            ann_min_chunks=VECTOR_ANN_MIN_CHUNKS,
+            ann_probes=VECTOR_ANN_PROBES,
+        )
+    print(f"Vector store has {STORE.count()} chunks.", flush=True)
+
+    with STARTUP.timed("registry open"):
+        REGISTRY = DocumentRegistry(REGISTRY_PATH)
+    if REGISTRY.count() == 0 and STORE.count() > 0:
+        print("Backfilling document registry from the vector store...", flush=True)
+        with STARTUP.timed("registry backfill"):
+            backfilled = REGISTRY.backfill(meta for batch in STORE.scan() for _, _, meta in batch)
+        print(f"Registered {backfilled} existing documents.", flush=True)
+
+    with STARTUP.timed("bm25 load"):
+        BM25 = BM25Index(BM25_INDEX_PATH)
+    if len(BM25) != STORE.count():
+        print("Rebuilding BM25 index from the vector store...", flush=True)
+        with STARTUP.timed("bm25 rebuild"):
+            rebuild_bm25_index()
+        print(f"BM25 index has {len(BM25)} chunks.", flush=True)
+
+
+def connect_vector_service():
+    """HTTP worker: wait until the vector service accepts connections and has loaded its store and model."""
+    with STARTUP.timed("vector service"):
+        SERVICE.wait(timeout=VECTOR_SERVICE_TIMEOUT)
+        SERVICE.call("", "service_ready")
+
+
+async def open_vector_store():
+    """Make sure STORE, REGISTRY and BM25 are open; the first caller (or the warm-up) opens them."""
+    await STARTUP.load("vector store", VECTOR_POOL, load_vector_store if SERVICE is None else connect_vector_service)
+
+
+async def service_ready():
+    """Called by each HTTP worker once: returns when the store is open and the model is loaded."""
+    await open_vector_store()
+    await STARTUP.load("embedding model", EMBED_POOL, load_embedding_model)
+
+
+def reset_vector_store():
+    """Empty the vector store, the registry and BM25 (blocking)."""
+    STORE.reset()
+    REGISTRY.clear()
+    BM25.clear()
+    BM25.save()
+
+
+def load_embedding_model():
+    with STARTUP.timed("embedding cache open"):
+        get_embed_cache()
+    with STARTUP.timed("embedding model load"):
+        model = get_embedding_model()
+    with STARTUP.timed("embedding test encode"):
+        model.encode(["warm-up"])
+
+
+def load_llm_clients():
+    with STARTUP.timed("openai import + clients"):
+        LLM_ROUTER.connect()
+
+
+async def save_bm25_periodically():
+    while True:
+        await asyncio.sleep(BM25_SAVE_INTERVAL)
+        if BM25 is not None:
+            await run_in_pool(VECTOR_POOL, BM25.save)
+
+
+async def warm_up():
+    if SERVICE is not None:
+        # HTTP worker: the vector service loads the store and the model
+        loaders = {"vector store": (VECTOR_POOL, connect_vector_service)}
+    else:
+        loaders = {
+            "vector store": (VECTOR_POOL, load_vector_store),
+            "embedding model": (EMBED_POOL, load_embedding_model),
+        }
+    if not SERVING_VECTORS:
+        loaders["llm clients"] = (None, load_llm_clients)
+    await STARTUP.warm_up(loaders)
+    print(STARTUP.report(), flush=True)
+    failed = [name for name, c in STARTUP.components.items() if c["state"] == "failed"]
+    print(f"Warm-up failed for {', '.join(failed)}; not ready" if failed else "Ready.", flush=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with STARTUP.timed("app startup"):
+        # With a vector service, it owns the spool, BM25 and the ingest jobs
+        local = SERVICE is None
+        if local:
+            stale = await run_in_pool(UPLOAD_POOL, clear_spool, UPLOAD_DIR)
+            if stale:
+                print(f"Removed {stale} spooled uploads left by a previous run", flush=True)
+        bm25_saver = asyncio.create_task(save_bm25_periodically()) if local else None
+        if not SERVING_VECTORS:
+            LLM_ROUTER.start()
+    STARTUP.serving = True
+    # /health answers straight away; the warm-up runs behind it and /ready follows it
+    warm_up_task = asyncio.create_task(warm_up()) if WARMUP else None
+    if not WARMUP:
+        STARTUP.record("boot to serving", time.perf_counter() - STARTUP.started)
+        print(STARTUP.report(), flush=True)
+    yield
+    STARTUP.serving = False
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if bm25_saver is not None:
+        bm25_saver.cancel()
+    await LLM_ROUTER.close()
+    if local and BM25 is not None:
+        BM25.save()
+    await INGEST_JOBS.close()
+    await EMBEDDER.close()
+    EMBED_POOL.shutdown(wait=True, cancel_futures=True)  # running encodes still write the cache
+    if local:
+        if EMBED_CACHE is not None:
+            EMBED_CACHE.close()
+        if REGISTRY is not None:
+            REGISTRY.close()
+        if STORE is not None:
+            STORE.close()
+    VECTOR_POOL.shutdown(wait=False, cancel_futures=True)
+    PDF_PAGE_POOL.shutdown(wait=False, cancel_futures=True)
+    IMAGE_POOL.shutdown(wait=False, cancel_futures=True)
+    UPLOAD_POOL.shutdown(wait=False, cancel_futures=True)
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Qwen Backend", lifespan=lifespan)
 
 # Allow Streamlit on localhost
 app.add_middleware(
@@ -61,6 +426,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING, profile_dir=PROFILE_DIR or None)
 
 # =========================
 # HELPERS
@@ -71,12 +437,37 @@ def encode_image_to_data_url(file_bytes: bytes, mime_type: str) -> str:
     return f"data:{mime_type};base64,{b64}"
 
 
-def extract_text_from_pdf(file_bytes: bytes) -> str:
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
+def open_document_pages(source, name: str):
+    """(page_count, page iterator) for PDF/TXT bytes or a path to the file; None if unsupported."""
+    return open_pages(
+        source,
+        name,
+        executor=get_pdf_pool(),
+        workers=PDF_WORKERS,
+        parallel_min_pages=PDF_PARALLEL_MIN_PAGES,
+    )
+
+
+def extract_document_text(source, name: str) -> str:
+    _, pages = open_document_pages(source, name)
+    return "".join(text for _, text in pages)
+
+
+async def spool_upload(file: UploadFile, max_bytes: Optional[int] = None) -> SpooledFile:
+    """Stream an upload to UPLOAD_DIR in UPLOAD_CHUNK_BYTES pieces, hashing it on the way."""
+    writer = await run_in_pool(UPLOAD_POOL, SpoolWriter, UPLOAD_DIR, file.filename or "upload")
+    try:
+        while True:
+            data = await file.read(UPLOAD_CHUNK_BYTES)
+            if not data:
+                break
+            if max_bytes is not None and writer.size + len(data) > max_bytes:
+                raise ValueError(f"{file.filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+            await run_in_pool(UPLOAD_POOL, writer.write, data)
+        return await run_in_pool(UPLOAD_POOL, writer.close)
+    except BaseException:
+        await run_in_pool(UPLOAD_POOL, writer.abort)
+        raise
 
 
 def guess_mime_type(file_name: str) -> str:
@@ -92,47 +483,208 @@ def guess_mime_type(file_name: str) -> str:
 
 def chunk_text(text: str, max_chars: int = 800) -> List[str]:
     """Simple chunker by characters with paragraph splitting."""
-    paragraphs = text.split("\n\n")
-    chunks: List[str] = []
-    current = ""
+    return [chunk for _, chunk in iter_chunks([(0, text)], max_chars)]
 
-    for para in paragraphs:
-        if len(current) + len(para) + 2 <= max_chars:
-            current += ("\n\n" + para) if current else para
-        else:
-            if current:
-                chunks.append(current)
-            current = para
 
-    if current:
-        chunks.append(current)
+# Opened by `get_embed_cache` on the first encode or by the warm-up, so importing the module creates no files
+EMBED_CACHE: Optional[EmbeddingCache] = shared("EMBED_CACHE", lambda: None)
+_embed_cache_lock = threading.Lock()
+
 
-    return chunks
+def get_embed_cache() -> EmbeddingCache:
+    global EMBED_CACHE
+    with _embed_cache_lock:
+        if EMBED_CACHE is None:
+            # Keyed by engine as well as model, so torch and ONNX vectors are never mixed up
+            EMBED_CACHE = EmbeddingCache(EMBED_CACHE_PATH, EMBEDDING_ENGINE_IMPL.cache_key,
+                                         max_bytes=EMBED_CACHE_MAX_MB * 1024 * 1024)
+    return EMBED_CACHE
 
 
-def call_qwen_chat(messages, model_name: Optional[str] = None, temperature: float = 0.2) -> str:
+def embed_cache_stats() -> dict:
+    return get_embed_cache().stats()
+
+
+def encode_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts, going to the model only for texts not in the on-disk cache."""
+    hashes = [chunk_hash(text) for text in texts]
+    cache = get_embed_cache()
+    vectors = cache.get_many(hashes)
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in vectors and h not in missing:
+            missing[h] = text
+    if missing:
+        model = get_embedding_model()
+        with stage("embed_model"):
+            fresh = dict(zip(missing.keys(), model.encode(list(missing.values())).tolist()))
+        cache.put_many(fresh)
+        vectors.update(fresh)
+    return [vectors[h] for h in hashes]
+
+
+# In an HTTP worker, batches go to the service's batcher, which also coalesces across workers
+EMBEDDER = EmbeddingBatcher(
+    encode_texts if SERVICE is None else RemoteObject(SERVICE, "EMBEDDER").encode,
+    EMBED_POOL,
+    max_batch_size=EMBED_BATCH_SIZE,
+    max_wait_ms=EMBED_BATCH_WAIT_MS,
+    max_concurrent_batches=EMBED_WORKERS,
+)
+
+
+async def extract_text(source, name: str) -> Optional[str]:
+    """Decode a TXT or extract a PDF (bytes or a path) off the event loop. None if unsupported."""
+    with stage("extract"):
+        if name.endswith(".txt"):
+            return await run_in_pool(UPLOAD_POOL, extract_document_text, source, name)
+        if name.endswith(".pdf"):
+            _, pages = await run_in_pool(PDF_PAGE_POOL, open_document_pages, source, name)
+            return "".join([text async for _, text in aiter_pages(PDF_PAGE_POOL, pages)])
+        return None
+
+
+async def call_qwen_chat(messages, model_name: Optional[str] = None, temperature: float = 0.2) -> str:
     model_name = model_name or QWEN_CHAT_MODEL_NAME
-    response = client.chat.completions.create(
+    start = time.perf_counter()
+    response = await client.chat.completions.create(
         model=model_name,
         messages=messages,
         temperature=temperature,
     )
+    usage = getattr(response, "usage", None)
+    record_llm(model_name, time.perf_counter() - start, getattr(usage, "completion_tokens", 0) or 0)
     return response.choices[0].message.content
 
+
+async def stream_qwen_chat(messages, model_name: Optional[str] = None, temperature: float = 0.2):
+    """Yield content deltas from LM Studio as they are generated."""
+    model_name = model_name or QWEN_CHAT_MODEL_NAME
+    start = time.perf_counter()
+    first_token_at = None
+    num_deltas = 0
+    stream = await client.chat.completions.create(
+        model=model_name,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            num_deltas += 1  # LM Studio sends about one token per delta
+            yield delta
+    ttft = first_token_at - start if first_token_at else None
+    record_llm(model_name, time.perf_counter() - start, num_deltas, ttft)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def answer_events(messages, model_name: Optional[str] = None, used_chunks: Optional[List[str]] = None,
+                        summary: Optional[dict] = None, on_answer=None):
+    """SSE events for an LLM answer: `chunks` (if any), `token`s, then `done` (merged with `summary`).
+
+    `on_answer` is called (or awaited) with the full text once the stream completes.
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    parts = []
+    if used_chunks is not None:
+        yield sse_event("chunks", {"used_chunks": used_chunks})
+    try:
+        async for delta in stream_qwen_chat(messages, model_name=model_name):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            parts.append(delta)
+            yield sse_event("token", {"text": delta})
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+        return
+    if on_answer:
+        result = on_answer("".join(parts))
+        if asyncio.iscoroutine(result):
+            await result
+    num_tokens = len(parts)
+    total = time.perf_counter() - start
+    yield sse_event("done", {
+        "num_tokens": num_tokens,
+        "ttft_ms": round((first_token_at - start) * 1000, 1) if first_token_at else None,
+        "total_ms": round(total * 1000, 1),
+        "used_chunks": used_chunks,
+        **(summary or {}),
+    })
+
+
+def sse_stream(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_response(messages, model_name: Optional[str] = None, used_chunks: Optional[List[str]] = None,
+                 summary: Optional[dict] = None, on_answer=None):
+    """Stream an LLM answer as SSE: `chunks` (if any), `token`s, then `done`."""
+    return sse_stream(answer_events(messages, model_name, used_chunks, summary, on_answer))
+
+
+def sse_error(message: str):
+    async def events():
+        yield sse_event("error", {"error": message})
+
+    return sse_stream(events())
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
+    """Liveness: the process is up and serving, even while it is still warming up."""
     return {"status": "ok"}
 
 
-@app.post("/analyze/image")
-async def analyze_image(
-    file: UploadFile = File(...),
-    instruction: str = Form("Describe this image in detail."),
-):
-    file_bytes = await file.read()
-    mime_type = guess_mime_type(file.filename)
+@app.get("/ready")
+async def ready():
+    """Readiness: 503 until the warm-up has loaded everything, with per-component state and boot timings."""
+    return JSONResponse(STARTUP.stats(), status_code=200 if STARTUP.ready else 503)
+
+
+IMAGE_CACHE = ResultCache(IMAGE_CACHE_SIZE)
+IMAGE_STATS = {"images": 0, "original_bytes": 0, "sent_bytes": 0}
 
-    data_url = encode_image_to_data_url(file_bytes, mime_type)
+
+def prepare_image(file_bytes: bytes, file_name: str):
+    """Returns (data_url, info). Images Pillow can't decode are sent unchanged."""
+    prepared = None
+    if IMAGE_PREPROCESS:
+        try:
+            prepared = preprocess_image(file_bytes, IMAGE_MAX_PIXELS, IMAGE_JPEG_QUALITY)
+        except Exception as e:
+            print(f"Image preprocessing skipped for {file_name}: {e}", flush=True)
+    if prepared is None:
+        size = len(file_bytes)
+        prepared = file_bytes, guess_mime_type(file_name), {"original_bytes": size, "sent_bytes": size, "bytes_saved": 0}
+    data, mime_type, info = prepared
+    return encode_image_to_data_url(data, mime_type), info
+
+
+async def build_image_messages(file_bytes: bytes, file_name: str, instruction: str):
+    """Returns (messages, image_info)."""
+    with stage("image_preprocess"):
+        data_url, info = await run_in_pool(IMAGE_POOL, prepare_image, file_bytes, file_name)
+    IMAGE_STATS["images"] += 1
+    IMAGE_STATS["original_bytes"] += info["original_bytes"]
+    IMAGE_STATS["sent_bytes"] += info["sent_bytes"]
 
     messages = [
         {
@@ -143,117 +695,798 @@ async def analyze_image(
             ],
         }
     ]
+    return messages, info
+
+
+async def image_cache_key(file_bytes: bytes, instruction: str) -> str:
+    return cache_key(await run_in_pool(IMAGE_POOL, file_hash, file_bytes), instruction, QWEN_VL_MODEL_NAME)
+
+
+@app.get("/llm/stats")
+async def llm_stats():
+    return LLM_ROUTER.stats()
+
+
+@app.get("/embeddings/stats")
+async def embeddings_stats():
+    cache = await run_in_pool(VECTOR_POOL, on_service(embed_cache_stats))
+    return {"engine": EMBEDDING_ENGINE, "cache": cache, "batcher": EMBEDDER.stats, "service": VECTOR_SERVICE or None}
+
+
+async def analyze_image_bytes(file_bytes: bytes, file_name: str, instruction: str, key: Optional[str] = None) -> dict:
+    key = key or await image_cache_key(file_bytes, instruction)
+    cached = IMAGE_CACHE.get(key)
+    if cached is not None:
+        return {"result": cached, "cached": True}
+
+    messages, image_info = await build_image_messages(file_bytes, file_name, instruction)
+    result = await call_qwen_chat(messages, model_name=QWEN_VL_MODEL_NAME)
+    IMAGE_CACHE.put(key, result)
+    return {"result": result, "cached": False, "image": image_info}
 
+
+@app.post("/analyze/image")
+async def analyze_image(
+    file: UploadFile = File(...),
+    instruction: str = Form("Describe this image in detail."),
+):
+    upload = None
     try:
-        result = call_qwen_chat(messages, model_name=QWEN_VL_MODEL_NAME)
-        return {"result": result}
+        upload = await spool_upload(file, IMAGE_MAX_MB * 1024 * 1024)
+        # The upload was hashed while it was spooled, so a cached answer never reads it back
+        key = cache_key(upload.sha256, instruction, QWEN_VL_MODEL_NAME)
+        cached = IMAGE_CACHE.get(key)
+        if cached is not None:
+            return {"result": cached, "cached": True}
+        file_bytes = await run_in_pool(UPLOAD_POOL, upload.read)
+        return await analyze_image_bytes(file_bytes, file.filename, instruction, key)
     except Exception as e:
         return {"error": str(e)}
+    finally:
+        if upload is not None:
+            await run_in_pool(UPLOAD_POOL, upload.remove)
 
 
-@app.post("/analyze/document")
-async def analyze_document(
+@app.post("/analyze/image/stream")
+async def analyze_image_stream(
     file: UploadFile = File(...),
-    instruction: str = Form("Summarize this document and extract key points, entities, and dates."),
+    instruction: str = Form("Describe this image in detail."),
 ):
-    file_bytes = await file.read()
-    name = file.filename.lower()
+    upload = None
+    try:
+        upload = await spool_upload(file, IMAGE_MAX_MB * 1024 * 1024)
+        key = cache_key(upload.sha256, instruction, QWEN_VL_MODEL_NAME)
+        cached = IMAGE_CACHE.get(key)
+        if cached is None:
+            file_bytes = await run_in_pool(UPLOAD_POOL, upload.read)
+            messages, image_info = await build_image_messages(file_bytes, file.filename, instruction)
+            del file_bytes
+    except Exception as e:
+        return sse_error(str(e))
+    finally:
+        if upload is not None:
+            await run_in_pool(UPLOAD_POOL, upload.remove)
+
+    if cached is not None:
+        async def cached_events():
+            yield sse_event("token", {"text": cached})
+            yield sse_event("done", {"num_tokens": 1, "ttft_ms": 0.0, "total_ms": 0.0, "used_chunks": None, "cached": True})
+
+        return sse_stream(cached_events())
+
+    return sse_response(
+        messages,
+        model_name=QWEN_VL_MODEL_NAME,
+        summary={"cached": False, "image": image_info},
+        on_answer=lambda answer: IMAGE_CACHE.put(key, answer),
+    )
+
+
+@app.post("/analyze/images/batch")
+async def analyze_images_batch(
+    files: List[UploadFile] = File(...),
+    instruction: str = Form("Describe this image in detail."),
+    concurrency: Optional[int] = Form(None),
+):
+    """Analyze many images (or zips of images) with one instruction.
+
+    Streams SSE: `start` with the image count, one `result` or `error` per image
+    in completion order, then `done`.
+    """
+    max_image_bytes, max_total_bytes = IMAGE_MAX_MB * 1024 * 1024, IMAGE_BATCH_MAX_MB * 1024 * 1024
+    uploads: List[SpooledFile] = []
+
+    async def remove_uploads():
+        for upload in uploads:
+            await run_in_pool(UPLOAD_POOL, upload.remove)
 
-    if name.endswith(".txt"):
+    try:
+        for file in files:
+            room = max_total_bytes - sum(upload.size for upload in uploads)
+            is_zip = (file.filename or "").lower().endswith(".zip")
+            uploads.append(await spool_upload(file, room if is_zip else min(room, max_image_bytes)))
+        images = await run_in_pool(
+            UPLOAD_POOL, batch_images, uploads, IMAGE_BATCH_MAX_FILES, max_image_bytes, max_total_bytes
+        )
+    except Exception as e:
+        await remove_uploads()
+        return sse_error(str(e))
+    limit = max(1, min(concurrency or IMAGE_BATCH_CONCURRENCY, IMAGE_BATCH_CONCURRENCY))
+
+    async def events():
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(limit)
+
+        async def analyze(index, image):
+            async with semaphore:
+                try:
+                    data = await run_in_pool(UPLOAD_POOL, image.read)
+                    return index, image.name, await analyze_image_bytes(data, image.name, instruction)
+                except Exception as e:
+                    return index, image.name, {"error": str(e)}
+
+        tasks = []
+        failed = cached = 0
         try:
-            text = file_bytes.decode("utf-8", errors="ignore")
-        except Exception:
-            text = file_bytes.decode("latin-1", errors="ignore")
-    elif name.endswith(".pdf"):
-        text = extract_text_from_pdf(file_bytes)
-    else:
-        return {"error": "Unsupported file type. Use PDF or TXT."}
+            yield sse_event("start", {"total": len(images), "concurrency": limit})
+            tasks = [asyncio.create_task(analyze(i, image)) for i, image in enumerate(images)]
+            for finished in asyncio.as_completed(tasks):
+                index, name, outcome = await finished
+                if "error" in outcome:
+                    failed += 1
+                    yield sse_event("error", {"index": index, "filename": name, **outcome})
+                else:
+                    cached += outcome["cached"]
+                    yield sse_event("result", {"index": index, "filename": name, **outcome})
+        finally:
+            # Client went away: stop the images still waiting for a slot
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await remove_uploads()
+        elapsed = time.perf_counter() - start
+        yield sse_event("done", {
+            "total": len(images),
+            "succeeded": len(images) - failed,
+            "failed": failed,
+            "cached": cached,
+            "total_ms": round(elapsed * 1000, 1),
+            "images_per_second": round(len(images) / elapsed, 2) if elapsed else None,
+        })
+
+    return sse_stream(events())
+
+
+PROMPTS = PromptBuilder(
+    TokenCounter(PROMPT_TOKENIZER),
+    default_budget=PROMPT_TOKEN_BUDGET,
+    budgets=PROMPT_TOKEN_BUDGETS,
+    history_share=PROMPT_HISTORY_SHARE,
+)
+
+
+DOCUMENT_ANALYZER = MapReduceAnalyzer(
+    call_qwen_chat,
+    PROMPTS,
+    split=lambda text: chunk_text(text, max_chars=ANALYZE_SECTION_CHARS),
+    cache=ResultCache(ANALYZE_CACHE_SIZE),
+    concurrency=ANALYZE_CONCURRENCY,
+)
+
+
+@app.get("/analyze/stats")
+async def analyze_stats():
+    return {
+        "image_cache": IMAGE_CACHE.stats(),
+        "images": {**IMAGE_STATS, "bytes_saved": IMAGE_STATS["original_bytes"] - IMAGE_STATS["sent_bytes"]},
+        "document_cache": DOCUMENT_ANALYZER.cache.stats(),
+    }
+
+
+async def read_document(file: UploadFile):
+    """Returns (text, error); error is None on success."""
+    upload = await spool_upload(file)
+    try:
+        text = await extract_text(upload.path, file.filename.lower())
+    finally:
+        await run_in_pool(UPLOAD_POOL, upload.remove)
+    if text is None:
+        return None, "Unsupported file type. Use PDF or TXT."
 
     if not text.strip():
-        return {"error": "No text extracted from document."}
+        return None, "No text extracted from document."
+    return text, None
 
-    truncated = text[:4000]
 
-    prompt = (
-        f"You are an AI assistant analyzing a document.\n\n"
-        f"USER INSTRUCTION:\n{instruction}\n\n"
-        f"DOCUMENT CONTENT (possibly truncated):\n{truncated}"
-    )
+async def build_document_messages(text: str, instruction: str, mode: Optional[str], on_progress=None):
+    """Returns (messages, summary) for the final call, running the map-reduce stages first if needed."""
+    mode = mode or ANALYZE_MODE
+    if mode not in ("auto", "single", "map-reduce"):
+        raise ValueError(f"Unknown mode: {mode}")
+
+    if mode != "map-reduce":
+        # Counting a long document is CPU work, so keep it off the event loop
+        with stage("prompt_build"):
+            messages, prompt_tokens = await run_in_pool(
+                VECTOR_POOL, PROMPTS.document, QWEN_CHAT_MODEL_NAME, instruction, text
+            )
+        if mode == "single" or not prompt_tokens["document_truncated"]:
+            return messages, {"mode": "single", "prompt_tokens": prompt_tokens}
+
+    messages, stats = await DOCUMENT_ANALYZER.run(QWEN_CHAT_MODEL_NAME, instruction, text, on_progress)
+    return messages, {"mode": "map-reduce", "map_reduce": stats}
 
-    messages = [{"role": "user", "content": prompt}]
+
+@app.post("/analyze/document")
+async def analyze_document(
+    file: UploadFile = File(...),
+    instruction: str = Form("Summarize this document and extract key points, entities, and dates."),
+    mode: Optional[str] = Form(None),  # "auto", "single" or "map-reduce"; defaults to ANALYZE_MODE
+):
+    text, error = await read_document(file)
+    if error:
+        return {"error": error}
 
     try:
-        result = call_qwen_chat(messages)
-        return {"result": result}
+        messages, summary = await build_document_messages(text, instruction, mode)
+        result = await call_qwen_chat(messages)
+        return {"result": result, **summary}
     except Exception as e:
         return {"error": str(e)}
 
 
-@app.post("/rag/upload")
-async def rag_upload(
+@app.post("/analyze/document/stream")
+async def analyze_document_stream(
     file: UploadFile = File(...),
+    instruction: str = Form("Summarize this document and extract key points, entities, and dates."),
+    mode: Optional[str] = Form(None),
 ):
+    text, error = await read_document(file)
+    if error:
+        return sse_error(error)
+
+    async def events():
+        # Map-reduce stages report `progress` events before the final answer streams
+        progress = asyncio.Queue()
+        task = asyncio.create_task(build_document_messages(text, instruction, mode, on_progress=progress.put_nowait))
+        task.add_done_callback(lambda _: progress.put_nowait(None))
+        try:
+            while (update := await progress.get()) is not None:
+                yield sse_event("progress", update)
+            messages, summary = task.result()
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            task.cancel()
+        async for event in answer_events(messages, summary=summary):
+            yield event
+
+    return sse_stream(events())
+
+
+def record_ingest_stages(stats: dict):
+    record_stage("extract", stats["extract_seconds"])
+    record_stage("chunk", stats["chunk_seconds"])
+
+
+async def embed_with_reuse(texts: List[str], dedup: dict) -> List[List[float]]:
+    """Embed only chunks whose text isn't already stored; reuse the stored vectors otherwise."""
+    hashes = [chunk_hash(text) for text in texts]
+    with stage("dedup_lookup"):
+        known = await lookup_chunk_vectors(hashes)
+    missing = {}
+    for h, text in zip(hashes, texts):
+        if h not in known and h not in missing:
+            missing[h] = text
+    if missing:
+        with stage("embed"):
+            fresh = await EMBEDDER.encode(list(missing.values()))
+        known.update(zip(missing.keys(), fresh))
+    dedup["chunks_total"] += len(texts)
+    dedup["chunks_reused"] += len(texts) - len(missing)
+    return [known[h] for h in hashes]
+
+
+def chunk_metadata(doc_id: str, filename: str, digest: str, index: int, page_no: int, chunk: str) -> dict:
+    return {
+        "doc_id": doc_id,
+        "filename": filename,
+        "chunk_index": index,
+        "page": page_no,
+        "file_hash": digest,
+        "chunk_hash": chunk_hash(chunk),
+    }
+
+
+def progress_logger(job: Job, label: str):
+    logged_pages = -1
+
+    def on_progress(stats):
+        nonlocal logged_pages
+        job.update(stats)
+        pages_done = stats["pages_done"]
+        if pages_done != logged_pages and (pages_done == job.total_pages or pages_done % 50 == 0):
+            logged_pages = pages_done
+            print(
+                f"{label} {job.filename}: extracted page {pages_done}/{job.total_pages}, "
+                f"{stats['chunks_written']} chunks indexed so far",
+                flush=True,
+            )
+
+    return on_progress
+
+
+async def open_job_pages(job: Job):
+    job.stage = "opening"
+    name = job.filename.lower()
+    # TXT files are plain Python reads and stay off the PDF thread
+    pool = PDF_PAGE_POOL if name.endswith(".pdf") else UPLOAD_POOL
+    opened = await run_in_pool(pool, open_document_pages, job.payload["upload"].path, name)
+    if opened is None:
+        raise ValueError("Unsupported file type. Use PDF or TXT.")
+    job.total_pages, page_iter = opened
+    return aiter_pages(pool, page_iter)
+
+
+async def ingest_job(job: Job) -> dict:
+    """Extract, chunk, embed and index one upload; rolls back its chunks on failure."""
+    upload = job.payload["upload"]
+    digest = upload.sha256
+    filename = job.filename
+    doc_id = job.doc_id
+    dedup = {"chunks_total": 0, "chunks_reused": 0}
+
+    await open_vector_store()
+    pages = await open_job_pages(job)
+
+    async def write_batch(first_index, batch, embeddings):
+        with stage("vector_write"):
+            await run_in_pool(
+                VECTOR_POOL,
+                STORE.add,
+                ids=[f"{doc_id}_{first_index + i}" for i in range(len(batch))],
+                documents=[chunk for _, chunk in batch],
+                embeddings=embeddings,
+                metadatas=[
+                    chunk_metadata(doc_id, filename, digest, first_index + i, page_no, chunk)
+                    for i, (page_no, chunk) in enumerate(batch)
+                ],
+            )
+            await run_in_pool(
+                VECTOR_POOL,
+                BM25.add,
+                [f"{doc_id}_{first_index + i}" for i in range(len(batch))],
+                [chunk for _, chunk in batch],
+                [doc_id] * len(batch),
+            )
+
+    job.stage = "ingesting"
     try:
-        file_bytes = await file.read()
-        name = file.filename.lower()
+        stats = await ingest_pages(
+            pages,
+            job.total_pages,
+            embed=lambda texts: embed_with_reuse(texts, dedup),
+            write=write_batch,
+            batch_size=INGEST_BATCH_SIZE,
+            max_chars=800,
+            page_aligned=True,
+            on_progress=progress_logger(job, "rag_upload"),
+        )
+        record_ingest_stages(stats)
+        if not stats["chunks_written"]:
+            raise ValueError("No text extracted from document.")
+        # The document only becomes visible once all of its chunks are written
+        await run_in_pool(
+            VECTOR_POOL,
+            REGISTRY.add,
+            doc_id,
+            filename,
+            digest,
+            num_chunks=stats["chunks_written"],
+            num_pages=job.total_pages,
+            size_bytes=upload.size,
+            page_hashes=stats["page_hashes"],
+        )
+    except BaseException:
+        # Don't leave a half-indexed document behind
+        job.stage = "rolling_back"
+        await run_in_pool(VECTOR_POOL, STORE.delete_document, doc_id)
+        await run_in_pool(VECTOR_POOL, BM25.remove_document, doc_id)
+        job.chunks_written = 0
+        raise
 
-        if name.endswith(".txt"):
-            try:
-                text = file_bytes.decode("utf-8", errors="ignore")
-            except Exception:
-                text = file_bytes.decode("latin-1", errors="ignore")
-        elif name.endswith(".pdf"):
-            text = extract_text_from_pdf(file_bytes)
-        else:
-            return {"error": "Unsupported file type. Use PDF or TXT."}
+    print(
+        f"rag_upload {filename}: indexed {stats['chunks_written']} chunks "
+        f"({dedup['chunks_reused']} reused existing vectors)",
+        flush=True,
+    )
 
-        if not text.strip():
-            return {"error": "No text extracted from document."}
+    return {
+        "doc_id": doc_id,
+        "num_chunks": stats["chunks_written"],
+        "num_pages": job.total_pages,
+        "file_name": filename,
+        "preview": stats["preview"],
+        "dedup": dedup_report(dedup["chunks_total"], dedup["chunks_reused"]),
+    }
 
-        chunks = chunk_text(text, max_chars=800)
-        
-        # Generate IDs and Metadata
-        doc_id = str(uuid.uuid4())
-        ids = [f"{doc_id}_{i}" for i in range(len(chunks))]
-        metadatas = [{"doc_id": doc_id, "filename": file.filename, "chunk_index": i} for i in range(len(chunks))]
 
-        # Add to ChromaDB (it handles embeddings if we don't provide them, but we have a model)
-        # We will use our own embeddings to be consistent
-        model = get_embedding_model()
-        embeddings = model.encode(chunks).tolist()
-        
-        COLLECTION.add(
-            ids=ids,
-            documents=chunks,
-            embeddings=embeddings,
-            metadatas=metadatas
+async def reindex_job(job: Job) -> dict:
+    """Replace a document with a new version, embedding only chunks that changed.
+
+    Chunks whose text is unchanged keep their vectors and ids (only their
+    metadata is refreshed); new chunks are added, and chunks that no longer
+    appear are removed at the end. On failure only the newly added chunks are
+    dropped, so the previous version stays intact.
+    """
+    upload = job.payload["upload"]
+    digest = upload.sha256
+    filename = job.filename
+    doc_id = job.doc_id
+    dedup = {"chunks_total": 0, "chunks_reused": 0}
+
+    await open_vector_store()
+    # Jobs for one document run in turn, so this is the version the previous job left behind
+    if await run_in_pool(VECTOR_POOL, REGISTRY.get, doc_id) is None:
+        raise ValueError(f"Document {doc_id} was deleted before it could be re-indexed")
+    old_page_hashes = await run_in_pool(VECTOR_POOL, REGISTRY.get_page_hashes, doc_id)
+    old = await run_in_pool(VECTOR_POOL, STORE.document_chunks, doc_id)
+    old_ids_by_hash: Dict[str, List[str]] = {}
+    for chunk_id, meta in old:
+        old_ids_by_hash.setdefault(meta.get("chunk_hash", ""), []).append(chunk_id)
+
+    pages = await open_job_pages(job)
+
+    added_ids: List[str] = []
+    kept_ids: List[str] = []
+    kept_metadatas: List[dict] = []
+
+    async def write_batch(first_index, batch, _):
+        new_chunks = []
+        for i, (page_no, chunk) in enumerate(batch):
+            meta = chunk_metadata(doc_id, filename, digest, first_index + i, page_no, chunk)
+            same = old_ids_by_hash.get(meta["chunk_hash"])
+            if same:
+                kept_ids.append(same.pop())
+                kept_metadatas.append(meta)
+            else:
+                new_chunks.append((meta, chunk))
+        dedup["chunks_total"] += len(batch) - len(new_chunks)
+        dedup["chunks_reused"] += len(batch) - len(new_chunks)
+        if not new_chunks:
+            return
+        embeddings = await embed_with_reuse([chunk for _, chunk in new_chunks], dedup)
+        ids = [f"{doc_id}_{uuid.uuid4().hex[:12]}" for _ in new_chunks]
+        with stage("vector_write"):
+            await run_in_pool(
+                VECTOR_POOL,
+                STORE.add,
+                ids=ids,
+                documents=[chunk for _, chunk in new_chunks],
+                embeddings=embeddings,
+                metadatas=[meta for meta, _ in new_chunks],
+            )
+            await run_in_pool(VECTOR_POOL, BM25.add, ids, [chunk for _, chunk in new_chunks], [doc_id] * len(ids))
+        added_ids.extend(ids)
+
+    job.stage = "ingesting"
+    try:
+        stats = await ingest_pages(
+            pages,
+            job.total_pages,
+            embed=None,
+            write=write_batch,
+            batch_size=INGEST_BATCH_SIZE,
+            max_chars=800,
+            page_aligned=True,
+            on_progress=progress_logger(job, "rag_reindex"),
         )
+        record_ingest_stages(stats)
+        if not stats["chunks_written"]:
+            raise ValueError("No text extracted from document.")
+    except BaseException:
+        job.stage = "rolling_back"
+        await run_in_pool(VECTOR_POOL, STORE.delete, added_ids)
+        await run_in_pool(VECTOR_POOL, BM25.remove_chunks, added_ids)
+        job.chunks_written = 0
+        raise
 
-        preview = text[:1000]
+    job.stage = "finalizing"
+    removed_ids = [chunk_id for ids in old_ids_by_hash.values() for chunk_id in ids]
+    await run_in_pool(VECTOR_POOL, STORE.update_metadata, kept_ids, kept_metadatas)
+    await run_in_pool(VECTOR_POOL, STORE.delete, removed_ids)
+    await run_in_pool(VECTOR_POOL, BM25.remove_chunks, removed_ids)
+    await run_in_pool(
+        VECTOR_POOL,
+        REGISTRY.add,
+        doc_id,
+        filename,
+        digest,
+        num_chunks=stats["chunks_written"],
+        num_pages=job.total_pages,
+        size_bytes=upload.size,
+        page_hashes=stats["page_hashes"],
+    )
 
-        return {
-            "doc_id": doc_id,
-            "num_chunks": len(chunks),
-            "file_name": file.filename,
-            "preview": preview,
-        }
+    new_page_hashes = stats["page_hashes"]
+    changed_pages = [
+        page for page in range(max(len(old_page_hashes), len(new_page_hashes)))
+        if page >= len(old_page_hashes) or page >= len(new_page_hashes)
+        or old_page_hashes[page] != new_page_hashes[page]
+    ]
+    print(
+        f"rag_reindex {filename}: {len(changed_pages)} changed pages, {len(added_ids)} chunks added, "
+        f"{len(kept_ids)} kept, {len(removed_ids)} removed",
+        flush=True,
+    )
+
+    return {
+        "doc_id": doc_id,
+        "num_chunks": stats["chunks_written"],
+        "num_pages": job.total_pages,
+        "file_name": filename,
+        "changed_pages": len(changed_pages),
+        "chunks_added": len(added_ids),
+        "chunks_kept": len(kept_ids),
+        "chunks_removed": len(removed_ids),
+        "dedup": dedup_report(dedup["chunks_total"], dedup["chunks_reused"]),
+    }
+
+
+async def delete_job(job: Job) -> dict:
+    """Remove a document's chunks, registry entry and BM25 postings."""
+    doc_id = job.doc_id
+    await open_vector_store()
+    doc = await run_in_pool(VECTOR_POOL, REGISTRY.get, doc_id)
+    if doc is None:
+        raise ValueError(f"Unknown document: {doc_id}")
+    await run_in_pool(VECTOR_POOL, STORE.delete_document, doc_id)
+    await run_in_pool(VECTOR_POOL, REGISTRY.delete, doc_id)
+    await run_in_pool(VECTOR_POOL, BM25.remove_document, doc_id)
+    return {"doc_id": doc_id, "deleted_chunks": doc["num_chunks"]}
+
+
+def dedup_report(chunks_total: int, chunks_reused: int, duplicate_file: bool = False) -> dict:
+    return {
+        "duplicate_file": duplicate_file,
+        "chunks_total": chunks_total,
+        "chunks_reused": chunks_reused,
+        "hit_rate": round(chunks_reused / chunks_total, 3) if chunks_total else (1.0 if duplicate_file else 0.0),
+    }
+
+
+async def lookup_chunk_vectors(hashes: List[str]) -> Dict[str, List[float]]:
+    """Stored embeddings for any of the given chunk hashes."""
+    return await run_in_pool(VECTOR_POOL, STORE.vectors_by_hash, hashes)
+
+
+ANSWER_CACHE = shared(
+    "ANSWER_CACHE",
+    lambda: AnswerCache(ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL, threshold=ANSWER_CACHE_THRESHOLD),
+)
+
+
+def invalidates_answers(handler):
+    """Wrap a job handler so cached answers that may depend on its document are dropped.
+
+    Runs before the job (its chunks become searchable as they are written) and
+    after it (answers computed meanwhile may have seen a partial document).
+    """
+
+    @functools.wraps(handler)
+    async def run(job: Job):
+        ANSWER_CACHE.invalidate_document(job.doc_id)
+        try:
+            return await handler(job)
+        finally:
+            ANSWER_CACHE.invalidate_document(job.doc_id)
+
+    return run
+
+
+def discards_upload(handler):
+    """Wrap a job handler so its spooled upload is deleted once the job ends."""
+
+    @functools.wraps(handler)
+    async def run(job: Job):
+        try:
+            return await handler(job)
+        finally:
+            await run_in_pool(UPLOAD_POOL, job.payload["upload"].remove)
+
+    return run
+
+
+# Jobs run where the vector store lives; HTTP workers submit them to the service and poll it
+INGEST_JOBS = JobQueue(
+    {
+        "ingest": discards_upload(invalidates_answers(ingest_job)),
+        "reindex": discards_upload(invalidates_answers(reindex_job)),
+        "delete": invalidates_answers(delete_job),
+    },
+    concurrency=INGEST_CONCURRENCY,
+) if SERVICE is None else RemoteJobQueue(RemoteObject(SERVICE, "INGEST_JOBS"), VECTOR_POOL)
+
+
+async def jobs_call(method: str, *args, **kwargs):
+    """INGEST_JOBS.<method>(...): on the loop in-process, off it when that means a call to the vector service."""
+    func = getattr(INGEST_JOBS, method)
+    if SERVICE is None:
+        return func(*args, **kwargs)
+    return await run_in_pool(VECTOR_POOL, func, *args, **kwargs)
+
+
+async def queue_upload(upload: SpooledFile, filename: str):
+    """Queue a spooled document for indexing.
+
+    Returns (job, existing): `existing` is the registry entry when the same
+    file is already indexed. No job is queued then, and the spool file is
+    deleted, as it is when an identical upload already has a job (the file
+    hash is the job key, so both uploads share that job).
+    """
+    try:
+        await open_vector_store()
+        existing = await run_in_pool(VECTOR_POOL, REGISTRY.find_by_hash, upload.sha256)
+    except BaseException:
+        upload.remove()
+        raise
+    if existing:
+        await run_in_pool(UPLOAD_POOL, upload.remove)
+        return None, existing
+
+    job, submitted = await jobs_call("submit_once", upload.sha256, filename, doc_id=str(uuid.uuid4()), upload=upload)
+    if not submitted:
+        await run_in_pool(UPLOAD_POOL, upload.remove)
+    return job, None
+
+
+def duplicate_file_result(existing: dict) -> dict:
+    return {
+        "job_id": None,
+        "doc_id": existing["doc_id"],
+        "stage": "done",
+        "file_name": existing["filename"],
+        "dedup": dedup_report(0, 0, duplicate_file=True),
+    }
+
+
+@app.post("/rag/upload")
+async def rag_upload(
+    file: UploadFile = File(...),
+    wait: bool = False,
+):
+    """Queue a document for indexing. Poll /rag/jobs/{job_id}, or pass ?wait=true to block."""
+    try:
+        upload = await spool_upload(file)
+        job, existing = await queue_upload(upload, file.filename)
+        # Identical file already indexed: nothing to do
+        if existing:
+            return duplicate_file_result(existing)
+
+        if wait:
+            await INGEST_JOBS.wait(job)
+            if job.error:
+                return {"error": job.error, "job_id": job.id}
+            return {"job_id": job.id, **job.result}
+
+        return {"job_id": job.id, "doc_id": job.doc_id, "stage": job.stage, "file_name": file.filename}
     except Exception as e:
         print(f"Error in rag_upload: {e}", flush=True)
         return {"error": str(e)}
 
 
+@app.post("/rag/ingest/bulk")
+async def rag_ingest_bulk(
+    file: Optional[UploadFile] = File(None),
+    directory: Optional[str] = Form(None),
+    concurrency: Optional[int] = Form(None),
+):
+    """Index every PDF/TXT in an uploaded zip/tar archive or a server-side directory.
+
+    Directories must be inside BULK_INGEST_ROOTS. Streams SSE: `start` with
+    the document count, one `result` (indexed or duplicate) or `error` per
+    document in completion order, then `done`. Files already indexed are
+    reported as duplicates, so re-running an interrupted import resumes it.
+    """
+    if (file is None) == (directory is None):
+        return sse_error("Send either an archive file or a directory.")
+    archive = None
+    try:
+        if file is not None:
+            archive = await spool_upload(file)
+            path = archive.path
+        else:
+            path = resolve_directory(directory, BULK_INGEST_ROOTS)
+        source = await run_in_pool(
+            UPLOAD_POOL, BulkSource, path, UPLOAD_DIR, BULK_INGEST_MAX_FILES, UPLOAD_CHUNK_BYTES,
+            max_file_bytes=BULK_INGEST_MAX_FILE_MB * 1024 * 1024,
+            max_total_bytes=BULK_INGEST_MAX_MB * 1024 * 1024,
+        )
+    except Exception as e:
+        if archive is not None:
+            await run_in_pool(UPLOAD_POOL, archive.remove)
+        return sse_error(str(e))
+    limit = max(1, min(concurrency or BULK_INGEST_CONCURRENCY, BULK_INGEST_CONCURRENCY))
+
+    async def ingest_one(index, name, upload):
+        try:
+            job, existing = await queue_upload(upload, name)
+            if existing:
+                return index, name, {**duplicate_file_result(existing), "status": "duplicate"}
+            await INGEST_JOBS.wait(job)
+            if job.error:
+                return index, name, {"error": job.error, "job_id": job.id}
+            return index, name, {"job_id": job.id, **job.result, "status": "indexed"}
+        except Exception as e:
+            return index, name, {"error": str(e)}
+
+    async def events():
+        start = time.perf_counter()
+        total = len(source.names)
+        counts = {"indexed": 0, "duplicate": 0, "failed": 0, "chunks": 0}
+
+        def result_event(index, name, outcome):
+            if "error" in outcome:
+                counts["failed"] += 1
+                return sse_event("error", {"index": index, "filename": name, **outcome})
+            counts[outcome["status"]] += 1
+            counts["chunks"] += outcome.get("num_chunks", 0)
+            return sse_event("result", {"index": index, "filename": name, **outcome})
+
+        yield sse_event("start", {"total": total, "source": source.kind, "concurrency": limit})
+        running = set()
+        index = 0
+        try:
+            async for name, upload, error in aiter_in_pool(UPLOAD_POOL, source.iter_files(), step=1):
+                if error:
+                    yield result_event(index, name, {"error": error})
+                else:
+                    running.add(asyncio.create_task(ingest_one(index, name, upload)))
+                index += 1
+                # Spool the next file only once a slot frees up
+                while len(running) >= limit or (running and index == total):
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for finished in done:
+                        yield result_event(*finished.result())
+        finally:
+            # Client went away: jobs already queued still finish, the remaining files are skipped
+            for task in running:
+                task.cancel()
+            await run_in_pool(UPLOAD_POOL, source.close)
+            if archive is not None:
+                await run_in_pool(UPLOAD_POOL, archive.remove)
+        elapsed = time.perf_counter() - start
+        yield sse_event("done", {
+            "total": total,
+            **counts,
+            "total_ms": round(elapsed * 1000, 1),
+            "files_per_second": round(total / elapsed, 2) if elapsed else None,
+        })
+
+    return sse_stream(events())
+
+
+@app.get("/rag/jobs")
+async def rag_jobs():
+    return {"jobs": [job.to_dict() for job in await jobs_call("list")]}
+
+
+@app.get("/rag/jobs/{job_id}")
+async def rag_job_status(job_id: str):
+    job = await jobs_call("get", job_id)
+    if job is None:
+        return {"error": f"Unknown job id: {job_id}"}
+    return job.to_dict()
+
+
 @app.get("/rag/list")
-async def rag_list():
+async def rag_list(offset: int = 0, limit: int = 100):
     try:
-        # Get all metadata to find unique documents
-        # In a real app, you'd have a separate SQL db for metadata, but this works for now
-        data = COLLECTION.get(include=["metadatas"])
-        docs = {}
-        if data["metadatas"]:
-            for meta in data["metadatas"]:
-                if meta:
-                    docs[meta["doc_id"]] = meta["filename"]
-        return {"documents": [{"doc_id": k, "filename": v} for k, v in docs.items()]}
+        await open_vector_store()
+        limit = max(1, min(limit, 1000))
+        docs, total = await run_in_pool(VECTOR_POOL, REGISTRY.list, max(0, offset), limit)
+        return {"documents": docs, "total": total, "offset": offset, "limit": limit}
     except Exception as e:
         return {"error": str(e)}
 
@@ -261,88 +1494,330 @@ async def rag_list():
 @app.post("/rag/clear")
 async def rag_clear():
     try:
-        # Delete and recreate the collection
-        CHROMA_CLIENT.delete_collection("zentro_docs")
-        global COLLECTION
-        COLLECTION = CHROMA_CLIENT.get_or_create_collection(name="zentro_docs")
+        await open_vector_store()
+        # Runs where the collection lives, so every worker sees the new one
+        await run_in_pool(VECTOR_POOL, on_service(reset_vector_store))
+        await run_in_pool(VECTOR_POOL, ANSWER_CACHE.clear)
         return {"status": "success", "message": "Knowledge base cleared."}
     except Exception as e:
         return {"error": str(e)}
 
 
+@app.delete("/rag/documents/{doc_id}")
+async def rag_delete_document(doc_id: str):
+    try:
+        await open_vector_store()
+        doc = await run_in_pool(VECTOR_POOL, REGISTRY.get, doc_id)
+        if doc is None:
+            return {"error": f"Unknown document: {doc_id}"}
+        # Runs as a job so it waits for any re-index of this document instead of racing it
+        job = await INGEST_JOBS.run(doc["filename"], "delete", doc_id=doc_id)
+        if job.error:
+            return {"error": job.error}
+        return {"status": "success", **job.result}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+@app.post("/rag/documents/{doc_id}/reindex")
+async def rag_reindex_document(
+    doc_id: str,
+    file: UploadFile = File(...),
+    wait: bool = False,
+):
+    """Replace a document with a new version, re-embedding only the chunks that changed."""
+    try:
+        await open_vector_store()
+        doc = await run_in_pool(VECTOR_POOL, REGISTRY.get, doc_id)
+        if doc is None:
+            return {"error": f"Unknown document: {doc_id}"}
+
+        upload = await spool_upload(file)
+        if upload.sha256 == doc["file_hash"]:
+            await run_in_pool(UPLOAD_POOL, upload.remove)
+            return {"job_id": None, "doc_id": doc_id, "stage": "done", "file_name": doc["filename"], "unchanged": True}
+
+        job = await jobs_call("submit", file.filename, kind="reindex", doc_id=doc_id, upload=upload)
+
+        if wait:
+            await INGEST_JOBS.wait(job)
+            if job.error:
+                return {"error": job.error, "job_id": job.id}
+            return {"job_id": job.id, **job.result}
+
+        return {"job_id": job.id, "doc_id": doc_id, "stage": job.stage, "file_name": file.filename}
+    except Exception as e:
+        print(f"Error in rag_reindex_document: {e}", flush=True)
+        return {"error": str(e)}
+
+
 class RAGQuestion(BaseModel):
     doc_id: Optional[str] = None
     question: str
     instruction: Optional[str] = None
     chat_history: List[Dict[str, str]] = []
+    retrieval_mode: Optional[str] = None  # "vector", "bm25" or "hybrid"; defaults to RETRIEVAL_MODE
+    top_k: Optional[int] = None  # chunks kept after MMR; defaults to RAG_TOP_K
+    reranker: Optional[str] = None  # "none", "embedding" or "cross-encoder"; defaults to RERANKER
+    use_cache: bool = True  # set False to always generate a fresh answer
 
 
-@app.post("/rag/ask")
-async def rag_ask(body: RAGQuestion):
-    try:
-        # Search in ChromaDB
-        # If doc_id is provided, filter by it. Otherwise search all.
-        where_filter = {"doc_id": body.doc_id} if body.doc_id else None
-        
-        model = get_embedding_model()
-        q_vec = model.encode([body.question]).tolist()
-        
-        results = COLLECTION.query(
-            query_embeddings=q_vec,
-            n_results=2,
-            where=where_filter
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the documents."
+
+
+async def retrieve_candidates(question: str, q_vec, doc_id: Optional[str], mode: str, k: int):
+    """Ranked candidates from the vector store, BM25, or both fused with RRF: [(chunk_id, text, embedding), ...]."""
+    vector_ids, found = [], {}
+    await open_vector_store()
+    if mode in ("vector", "hybrid"):
+        # If doc_id is provided, only that document is searched
+        with stage("vector_query"):
+            hits = await run_in_pool(VECTOR_POOL, STORE.query, q_vec, k, doc_id)
+        vector_ids = [chunk_id for chunk_id, _, _ in hits]
+        found.update((chunk_id, (text, embedding)) for chunk_id, text, embedding in hits)
+
+    lexical_ids = []
+    if mode in ("bm25", "hybrid"):
+        with stage("bm25_query"):
+            hits = await run_in_pool(VECTOR_POOL, BM25.search, question, k, doc_id)
+        lexical_ids = [chunk_id for chunk_id, _ in hits]
+
+    if mode == "vector":
+        ranked = vector_ids
+    elif mode == "bm25":
+        ranked = lexical_ids
+    else:
+        ranked = reciprocal_rank_fusion([vector_ids, lexical_ids])
+
+    missing = [chunk_id for chunk_id in ranked if chunk_id not in found]
+    if missing:
+        with stage("vector_query"):
+            chunks = await run_in_pool(VECTOR_POOL, STORE.get, missing)
+        found.update((chunk_id, (text, embedding)) for chunk_id, text, embedding in chunks)
+    return [(chunk_id, *found[chunk_id]) for chunk_id in ranked if chunk_id in found]
+
+
+_cross_encoder = CrossEncoderReranker(RERANKER_MODEL)
+
+
+async def select_chunks(question: str, q_vec, candidates, top_k: int, reranker: str):
+    """Dedupe, diversify (MMR) and optionally rerank candidates. Returns [(chunk_id, text)]."""
+    # Identical chunks from different documents would otherwise take several slots
+    unique, seen = [], set()
+    for candidate in candidates:
+        h = chunk_hash(candidate[1])
+        if h not in seen:
+            seen.add(h)
+            unique.append(candidate)
+
+    picked = [unique[i] for i in mmr([emb for _, _, emb in unique], top_k, MMR_LAMBDA)]
+
+    if reranker == "embedding":
+        scores = cosine_scores(q_vec, [emb for _, _, emb in picked])
+    elif reranker == "cross-encoder":
+        scores = await run_in_pool(EMBED_POOL, _cross_encoder.score, question, [text for _, text, _ in picked])
+    elif reranker == "none":
+        scores = None
+    else:
+        raise ValueError(f"Unknown reranker: {reranker}")
+    if scores is not None:
+        picked = [c for _, c in sorted(zip(scores, picked), key=lambda pair: pair[0], reverse=True)]
+
+    return [(chunk_id, text) for chunk_id, text, _ in picked]
+
+
+def answer_scope(body: RAGQuestion) -> tuple:
+    """Everything besides the question that shapes a RAG answer; cache hits must match it exactly."""
+    history = json.dumps(body.chat_history, sort_keys=True)
+    return (
+        body.doc_id, body.instruction, body.retrieval_mode or RETRIEVAL_MODE, body.top_k or RAG_TOP_K,
+        body.reranker or RERANKER, history, QWEN_CHAT_MODEL_NAME,
+    )
+
+
+async def cache_answer(body: RAGQuestion, q_vec, used_chunks: List[str], answer: str, generation: int):
+    doc_ids = {chunk_id.rsplit("_", 1)[0] for chunk_id in used_chunks}
+    await run_in_pool(
+        VECTOR_POOL, ANSWER_CACHE.put, q_vec, answer_scope(body), body.doc_id, used_chunks, doc_ids, answer, generation
+    )
+
+
+async def build_rag_messages(body: RAGQuestion, q_vec):
+    """Retrieve context for a question.
+
+    Returns (messages, used_chunk_ids, prompt_tokens), or (None, None, None) if nothing matched.
+    """
+    mode = body.retrieval_mode or RETRIEVAL_MODE
+    if mode not in ("vector", "bm25", "hybrid"):
+        raise ValueError(f"Unknown retrieval_mode: {mode}")
+
+    candidates = await retrieve_candidates(body.question, q_vec, body.doc_id, mode, RETRIEVAL_CANDIDATES)
+    if not candidates:
+        return None, None, None
+
+    with stage("rerank"):
+        selected = await select_chunks(
+            body.question, q_vec, candidates, body.top_k or RAG_TOP_K, body.reranker or RERANKER
         )
-        
-        if not results["documents"] or not results["documents"][0]:
-            return {"answer": "I couldn't find any relevant information in the documents."}
 
-        retrieved_chunks = results["documents"][0]
-        
-        context_text = "\n\n".join(retrieved_chunks)
+    instruction = body.instruction or (
+        "Using only the context chunks below, answer the user's question. "
+        "If the answer is not clearly in the context, say you don't know."
+    )
 
-        instruction = body.instruction or (
-            "Using only the context chunks below, answer the user's question. "
-            "If the answer is not clearly in the context, say you don't know."
+    # The question is always sent whole; chunks and history messages are kept whole or dropped
+    with stage("prompt_build"):
+        messages, packed, prompt_tokens = PROMPTS.rag(
+            QWEN_CHAT_MODEL_NAME,
+            instruction,
+            body.question,
+            [text for _, text in selected],
+            body.chat_history,
         )
-        
-        # Construct History
-        # Convert chat_history to the format expected by the LLM (if needed)
-        # Here we just append the new prompt
-        
-        messages = []
-        if body.chat_history:
-            # Limit history to last 4 messages and truncate content
-            for msg in body.chat_history[-4:]:
-                content = msg.get("content", "")
-                if len(content) > 500:
-                    content = content[:500] + "..."
-                messages.append({"role": msg["role"], "content": content})
-
-        prompt = (
-            f"{instruction}\n\n"
-            f"CONTEXT CHUNKS:\n{context_text}\n\n"
-            f"USER QUESTION:\n{body.question}"
+    return messages, [selected[i][0] for i in packed], prompt_tokens
+
+
+async def cached_rag_answer(body: RAGQuestion):
+    """Returns (question_vector, cache_generation, hit); hit is None on a miss."""
+    with stage("embed"):
+        q_vec = (await EMBEDDER.encode([body.question]))[0]
+    with stage("answer_cache"):
+        generation, hit = await run_in_pool(
+            VECTOR_POOL, ANSWER_CACHE.lookup, q_vec, answer_scope(body), body.use_cache
         )
-        
-        # Hard limit on prompt length (approx 3500 chars ~ 1000 tokens)
-        if len(prompt) > 3500:
-            prompt = prompt[:3500] + "... [TRUNCATED]"
-        
-        messages.append({"role": "user", "content": prompt})
-
-        answer = call_qwen_chat(messages)
+    return q_vec, generation, hit
+
+
+@app.post("/rag/ask")
+async def rag_ask(body: RAGQuestion):
+    try:
+        q_vec, generation, hit = await cached_rag_answer(body)
+        if hit is not None:
+            return {**hit, "cached": True}
+
+        messages, used_chunks, prompt_tokens = await build_rag_messages(body, q_vec)
+        if messages is None:
+            return {"answer": NO_CONTEXT_ANSWER}
+
+        answer = await call_qwen_chat(messages)
+        await cache_answer(body, q_vec, used_chunks, answer, generation)
         return {
             "answer": answer,
-            "used_chunks": results["ids"][0],
+            "used_chunks": used_chunks,
+            "prompt_tokens": prompt_tokens,
+            "cached": False,
         }
     except Exception as e:
         print(f"Error in rag_ask: {e}", flush=True)
         return {"error": str(e)}
 
 
+@app.post("/rag/ask/stream")
+async def rag_ask_stream(body: RAGQuestion):
+    try:
+        q_vec, generation, hit = await cached_rag_answer(body)
+        if hit is None:
+            messages, used_chunks, prompt_tokens = await build_rag_messages(body, q_vec)
+    except Exception as e:
+        print(f"Error in rag_ask_stream: {e}", flush=True)
+        return sse_error(str(e))
+
+    if hit is not None:
+        async def cached_events():
+            yield sse_event("chunks", {"used_chunks": hit["used_chunks"]})
+            yield sse_event("token", {"text": hit["answer"]})
+            yield sse_event("done", {
+                "num_tokens": 1, "ttft_ms": 0.0, "total_ms": 0.0, "used_chunks": hit["used_chunks"],
+                "cached": True, "similarity": hit["similarity"],
+            })
+
+        return sse_stream(cached_events())
+
+    if messages is None:
+        async def no_context():
+            yield sse_event("chunks", {"used_chunks": []})
+            yield sse_event("token", {"text": NO_CONTEXT_ANSWER})
+            yield sse_event("done", {"num_tokens": 1, "ttft_ms": None, "total_ms": 0.0, "used_chunks": []})
+
+        return sse_stream(no_context())
+
+    return sse_response(
+        messages,
+        used_chunks=used_chunks,
+        summary={"prompt_tokens": prompt_tokens, "cached": False},
+        on_answer=lambda answer: cache_answer(body, q_vec, used_chunks, answer, generation),
+    )
+
+
+@app.get("/rag/cache/stats")
+async def rag_cache_stats():
+    return await run_in_pool(VECTOR_POOL, ANSWER_CACHE.stats)
+
+
+@app.get("/rag/store/stats")
+async def rag_store_stats():
+    try:
+        await open_vector_store()
+        return await run_in_pool(VECTOR_POOL, STORE.stats)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def serve_vector_service(path: str):
+    """Run this process as the vector service for HTTP workers started with VECTOR_SERVICE=path.
+
+    It goes through the same lifespan as the web app (spool cleanup, BM25
+    saves, warm-up, orderly shutdown) and serves this module's globals on
+    `path` until SIGTERM or SIGINT.
+    """
+    global SERVING_VECTORS
+    SERVING_VECTORS = True
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        # The job queue must be driven from the event loop; everything else is thread-safe
+        server = ServiceServer(path, sys.modules[__name__], loop, on_loop={"INGEST_JOBS"})
+        async with lifespan(app):
+            server.start()
+            print(f"Vector service listening on {path}", flush=True)
+            await stop.wait()
+            server.close()
+
+    asyncio.run(main())
+
+
+def start_vector_service(path: str) -> subprocess.Popen:
+    env = {key: value for key, value in os.environ.items() if key != "VECTOR_SERVICE"}
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--vector-service", path], env=env)
+    try:
+        ServiceClient(path).wait(timeout=VECTOR_SERVICE_TIMEOUT)
+    except ConnectionError:
+        process.terminate()
+        raise
+    return process
+
+
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["--vector-service"]:
+        serve_vector_service(sys.argv[2])
+        sys.exit(0)
+
     print("Starting backend...", flush=True)
     import uvicorn
     print("Imported uvicorn", flush=True)
     host = os.getenv("HOST", "127.0.0.1")
-    uvicorn.run(app, host=host, port=8000)
+    if WEB_WORKERS > 1 and not VECTOR_SERVICE:
+        # One service process keeps the model and the stores; the workers only handle HTTP
+        socket_path = os.path.join(tempfile.gettempdir(), f"zentro-vector-{os.getpid()}.sock")
+        service = start_vector_service(socket_path)
+        os.environ["VECTOR_SERVICE"] = socket_path
+        try:
+            uvicorn.run("backend:app", host=host, port=8000, workers=WEB_WORKERS)
+        finally:
+            service.terminate()
+            service.wait()
+    else:
+        uvicorn.run("backend:app" if WEB_WORKERS > 1 else app, host=host, port=8000, workers=WEB_WORKERS)
@@ -0,0 +1,208 @@
+"""Shared stand-ins for the benchmark scripts.
+
+Everything here runs offline: a fake LM Studio client with configurable
+latency, stub OpenAI-compatible HTTP servers, a helper that serves an app
+over real HTTP, and a deterministic embedding
+model that never loads torch.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_backend(**env):
+    """Import backend.py against a throwaway Chroma directory."""
+    os.environ.setdefault("CHROMA_PATH", tempfile.mkdtemp(prefix="zentro_bench_"))
+    for key, value in env.items():
+        os.environ[key] = str(value)
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import backend
+    return backend
+
+
+class FakeEmbeddingModel:
+    """Deterministic stand-in for the SentenceTransformer.
+
+    Vectors are feature-hashed bags of words and character trigrams, so texts
+    that share vocabulary land close together and retrieval behaves plausibly.
+    `cost` seconds per call plus `per_item` seconds per text of blocking work
+    mimic the model's forward pass.
+    """
+
+    def __init__(self, dim: int = 384, cost: float = 0.0, per_item: float = 0.0):
+        self.dim = dim
+        self.cost = cost
+        self.per_item = per_item
+        self.calls = 0
+
+    def _features(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        for word in words:
+            yield word, 1.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.3
+
+    def encode(self, texts, **kwargs):
+        self.calls += 1
+        if self.cost or self.per_item:
+            time.sleep(self.cost + self.per_item * len(texts))
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                slot = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                out[i, slot] += sign * weight
+            norm = np.linalg.norm(out[i])
+            out[i] = out[i] / norm if norm else out[i]
+        return out
+
+
+class FakeChatClient:
+    """Mimics `AsyncOpenAI().chat.completions.create` with a fixed latency.
+
+    `latency` is the time to first token; with `stream=True` the remaining
+    words of `answer` follow at `tokens_per_second`.
+    """
+
+    def __init__(self, latency: float = 0.5, answer: str = "stub answer", tokens_per_second: float = 200.0):
+        self.latency = latency
+        self.answer = answer
+        self.tokens_per_second = tokens_per_second
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, stream=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        if stream:
+            return self._stream()
+        message = SimpleNamespace(content=self.answer)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self):
+        for i, word in enumerate(self.answer.split(" ")):
+            if i:
+                await asyncio.sleep(1.0 / self.tokens_per_second)
+            delta = SimpleNamespace(content=word if i == 0 else " " + word)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+
+class ThreadedServer:
+    """Serves an ASGI app over real HTTP on localhost with uvicorn in a daemon thread.
+
+    Unlike httpx's ASGITransport this streams responses as they are produced,
+    and it runs the app's lifespan.
+    """
+
+    def __init__(self, app, port: int = 0):
+        import socket
+        import threading
+
+        import uvicorn
+
+        if not port:
+            with socket.socket() as s:
+                s.bind(("127.0.0.1", 0))
+                port = s.getsockname()[1]
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}"
+        config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("server failed to start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+class StubLLMServer:
+    """A real OpenAI-compatible HTTP server on localhost, run by uvicorn in a thread.
+
+    Serves `GET /v1/models` and `POST /v1/chat/completions` (plain and
+    streamed). `latency` is the time to first token; the words of `answer`
+    then follow at `tokens_per_second` (0 sends them all at once). Set
+    `fail = True` to answer 500s, or call `stop()` to refuse connections
+    altogether.
+    """
+
+    def __init__(self, latency: float = 0.2, answer: str = "stub answer", port: int = 0,
+                 tokens_per_second: float = 0.0):
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse, StreamingResponse
+
+        self.latency = latency
+        self.answer = answer
+        self.tokens_per_second = tokens_per_second
+        self.fail = False
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        app = FastAPI()
+
+        @app.get("/v1/models")
+        async def models():
+            if self.fail:
+                return JSONResponse({"error": "unavailable"}, status_code=503)
+            return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
+
+        @app.post("/v1/chat/completions")
+        async def completions(request: Request):
+            body = await request.json()
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                await asyncio.sleep(self.latency)
+                if self.fail:
+                    return JSONResponse({"error": {"message": "stub failure"}}, status_code=500)
+                base = {"id": "stub", "created": int(time.time()), "model": body.get("model", "stub")}
+                words = self.answer.split(" ")
+                gap = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+                if not body.get("stream"):
+                    await asyncio.sleep(gap * (len(words) - 1))
+                    prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+                    return {
+                        **base,
+                        "object": "chat.completion",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": self.answer}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(words),
+                                  "total_tokens": prompt_tokens + len(words)},
+                    }
+            finally:
+                self.in_flight -= 1
+
+            async def chunks():
+                for i, word in enumerate(words):
+                    if i and gap:
+                        await asyncio.sleep(gap)
+                    delta = {"content": word if i == 0 else " " + word}
+                    chunk = {**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        self._server = ThreadedServer(app, port)
+        self.port = self._server.port
+        self.base_url = f"{self._server.url}/v1"
+
+    def stop(self):
+        self._server.stop()
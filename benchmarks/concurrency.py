@@ -0,0 +1,66 @@
+"""Check that concurrent requests overlap instead of queueing.
+
+Fires N parallel /rag/ask calls against a stub LLM with a fixed latency
+while polling /health. With a blocking backend the wall time is roughly
+N * latency and /health stalls; with the async backend both stay near a
+single request's latency.
+
+    python benchmarks/concurrency.py --requests 16 --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from common import FakeChatClient, FakeEmbeddingModel, load_backend
+
+
+async def main(args):
+    backend = load_backend()
+    backend.client = FakeChatClient(latency=args.latency)
+    backend._embedding_model = FakeEmbeddingModel(cost=args.embed_cost)
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+        files = {"file": ("seed.txt", b"Zentro stores documents.\n\nIt answers questions.", "text/plain")}
+        await http.post("/rag/upload", params={"wait": "true"}, files=files)
+
+        health_latencies = []
+        done = asyncio.Event()
+
+        async def poll_health():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await http.get("/health")
+                await asyncio.sleep(0.02)
+                # Includes the pause, so a loop stalled between polls counts as well
+                health_latencies.append(time.perf_counter() - t0 - 0.02)
+
+        async def ask(i):
+            r = await http.post("/rag/ask", json={"question": f"question {i}"})
+            return r.json()
+
+        poller = asyncio.create_task(poll_health())
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(ask(i) for i in range(args.requests)))
+        wall = time.perf_counter() - t0
+        done.set()
+        await poller
+
+    errors = [r for r in results if "error" in r]
+    serial = args.requests * args.latency
+    print(f"requests={args.requests} latency={args.latency:.2f}s wall={wall:.2f}s serial_estimate={serial:.2f}s")
+    print(f"speedup={serial / wall:.1f}x  health_max={max(health_latencies) * 1000:.1f}ms  errors={len(errors)}")
+
+    assert not errors, errors[0]
+    assert wall < serial / 2, "requests were serialized"
+    assert max(health_latencies) < args.latency, "/health was blocked by in-flight requests"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--embed-cost", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
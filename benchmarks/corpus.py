@@ -0,0 +1,120 @@
+"""Deterministic synthetic PDF/TXT corpus for the benchmarks.
+
+Documents are built from a fixed vocabulary with a seeded RNG, so the same
+arguments always produce byte-identical files. Each document has its own
+topic words, which gives retrieval something to find, and `questions()`
+returns queries that mention them.
+
+    python benchmarks/corpus.py --out /tmp/zentro_corpus --docs 200 --pages 5
+"""
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+import fitz  # PyMuPDF
+
+_SYLLABLES = ["ka", "lo", "mer", "tin", "sa", "ve", "dor", "pri", "nu", "zel", "qua", "ri", "bo", "chen", "fa", "gu"]
+_FILLER = (
+    "the a of and to in is for with that on by as are from this system report "
+    "results data process value team during after each before which between"
+).split()
+
+
+def _vocabulary(rng: random.Random, size: int) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _topic(doc_index: int, vocabulary: List[str], seed: int) -> List[str]:
+    rng = random.Random(f"topic-{seed}-{doc_index}")
+    return rng.sample(vocabulary, 3)
+
+
+def _sentence(rng: random.Random, vocabulary: List[str], topic: List[str]) -> str:
+    words = []
+    for _ in range(rng.randint(8, 18)):
+        roll = rng.random()
+        if roll < 0.15:
+            words.append(rng.choice(topic))
+        elif roll < 0.55:
+            words.append(rng.choice(_FILLER))
+        else:
+            words.append(rng.choice(vocabulary))
+    if rng.random() < 0.2:
+        words.append(str(rng.randint(1, 99999)))
+    return " ".join(words).capitalize() + "."
+
+
+def document_pages(doc_index: int, pages: int, paragraphs: int = 4, seed: int = 0) -> List[str]:
+    """Text of each page of document `doc_index`."""
+    vocabulary = _vocabulary(random.Random(seed), 2000)
+    topic = _topic(doc_index, vocabulary, seed)
+    rng = random.Random(f"{seed}-{doc_index}")
+    out = []
+    for page in range(pages):
+        body = [f"Document {doc_index} section {page + 1}: {' '.join(topic)}"]
+        for _ in range(paragraphs):
+            body.append(" ".join(_sentence(rng, vocabulary, topic) for _ in range(rng.randint(3, 6))))
+        out.append("\n\n".join(body))
+    return out
+
+
+def render_pdf(pages: List[str]) -> bytes:
+    doc = fitz.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), text, fontsize=9)
+    # Fixed metadata keeps the bytes reproducible
+    doc.set_metadata({"creationDate": "D:20240101000000", "modDate": "D:20240101000000", "producer": "zentro-bench"})
+    data = doc.tobytes(garbage=3, deflate=True, no_new_id=True)
+    doc.close()
+    return data
+
+
+def generate(docs: int, pages: int = 5, paragraphs: int = 4, pdf_share: float = 0.5,
+             seed: int = 0) -> List[Tuple[str, bytes]]:
+    """Returns [(file_name, file_bytes)], with PDFs spread evenly at `pdf_share`."""
+    files = []
+    for i in range(docs):
+        page_texts = document_pages(i, pages, paragraphs, seed)
+        if int((i + 1) * pdf_share) > int(i * pdf_share):
+            files.append((f"doc_{i:05d}.pdf", render_pdf(page_texts)))
+        else:
+            files.append((f"doc_{i:05d}.txt", "\n\n".join(page_texts).encode("utf-8")))
+    return files
+
+
+def questions(docs: int, count: int, seed: int = 0) -> List[str]:
+    """Questions that each target one document's topic words."""
+    vocabulary = _vocabulary(random.Random(seed), 2000)
+    rng = random.Random(f"questions-{seed}")
+    out = []
+    for _ in range(count):
+        topic = _topic(rng.randrange(docs), vocabulary, seed)
+        out.append(f"What does the report say about {topic[0]} and {topic[1]}?")
+    return out
+
+
+def write(out_dir: str, files: List[Tuple[str, bytes]]):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, data in files:
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=4)
+    parser.add_argument("--pdf-share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    corpus = generate(args.docs, args.pages, args.paragraphs, args.pdf_share, args.seed)
+    write(args.out, corpus)
+    total = sum(len(data) for _, data in corpus)
+    print(f"wrote {len(corpus)} files ({total / 1e6:.1f} MB) to {args.out}")
@@ -0,0 +1,146 @@
+"""Consistency check: concurrent re-indexes and deletes of one document.
+
+Serves the real backend from this process (uvicorn in a thread, fake
+embedding model) and, for each vector store engine, races writes to the same
+document:
+
+- several `?wait=true` re-indexes with different content at once;
+- a re-index immediately followed by a delete;
+- a delete racing a re-index submitted right after it.
+
+After each round the vector store, the registry and BM25 must agree: the same
+chunk count for the document, or no trace of it once it is deleted. Each
+engine runs in its own subprocess, since the backend reads VECTOR_STORE at
+import.
+
+    python benchmarks/document_consistency.py --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+import corpus
+from common import FakeEmbeddingModel, ThreadedServer, load_backend
+from load_test import wait_ready
+
+
+def version(n: int) -> tuple:
+    """A TXT document whose content and chunk count differ for every `n`."""
+    pages = corpus.document_pages(1000 + n, 2 + n % 4)
+    return f"version_{n}.txt", "\n\n".join(pages).encode("utf-8")
+
+
+def counts(backend, doc_id: str) -> dict:
+    doc = backend.REGISTRY.get(doc_id)
+    return {
+        "registry": doc["num_chunks"] if doc else 0,
+        "store": len(backend.STORE.document_chunks(doc_id)),
+        "bm25": sum(1 for chunk_id in backend.BM25.chunk_numbers if chunk_id.startswith(f"{doc_id}_")),
+    }
+
+
+def assert_consistent(backend, doc_id: str, deleted: bool = False):
+    found = counts(backend, doc_id)
+    if deleted:
+        assert found == {"registry": 0, "store": 0, "bm25": 0}, f"deleted {doc_id} left {found}"
+    else:
+        assert found["registry"] and len(set(found.values())) == 1, f"{doc_id} out of sync: {found}"
+    return found
+
+
+async def upload(http, name_data) -> str:
+    result = (await http.post("/rag/upload", params={"wait": "true"}, files={"file": name_data})).json()
+    assert "error" not in result, result
+    return result["doc_id"]
+
+
+async def reindex(http, doc_id: str, name_data, wait: bool = True) -> dict:
+    response = await http.post(f"/rag/documents/{doc_id}/reindex", params={"wait": str(wait).lower()},
+                               files={"file": name_data})
+    return response.json()
+
+
+async def check(backend, url: str, args) -> list:
+    reports = []
+    serial = 0
+
+    def next_version():
+        nonlocal serial
+        serial += 1
+        return version(serial)
+
+    async with httpx.AsyncClient(base_url=url, timeout=600) as http:
+        ready = await wait_ready(http)
+        assert ready["ready"], ready
+        for round_no in range(args.rounds):
+            # Concurrent re-indexes: each runs against the version the previous one left
+            doc_id = await upload(http, next_version())
+            results = await asyncio.gather(*(reindex(http, doc_id, next_version())
+                                             for _ in range(args.concurrent)))
+            assert all("error" not in r for r in results), results
+            reports.append(("concurrent re-indexes", assert_consistent(backend, doc_id)))
+
+            # A delete that arrives while a re-index is running waits for it
+            queued = await reindex(http, doc_id, next_version(), wait=False)
+            assert "error" not in queued, queued
+            deleted = (await http.delete(f"/rag/documents/{doc_id}")).json()
+            assert deleted.get("status") == "success", deleted
+            job = (await http.get(f"/rag/jobs/{queued['job_id']}")).json()
+            assert job["stage"] == "done", job
+            reports.append(("re-index then delete", assert_consistent(backend, doc_id, deleted=True)))
+
+            # A re-index queued behind a delete must not bring the document back
+            doc_id = await upload(http, next_version())
+            deleted, late = await asyncio.gather(http.delete(f"/rag/documents/{doc_id}"),
+                                                 reindex(http, doc_id, next_version()))
+            assert deleted.json().get("status") == "success", deleted.json()
+            reports.append(("delete racing re-index", assert_consistent(backend, doc_id, deleted=True)))
+            listed = (await http.get("/rag/list")).json()
+            assert all(d["doc_id"] != doc_id for d in listed["documents"]), listed
+            print(f"round {round_no + 1}/{args.rounds}: ok (late re-index: {late.get('error', 'ran first')})",
+                  flush=True)
+    return reports
+
+
+def run_engine(args):
+    backend = load_backend(VECTOR_STORE=args.engine, LLM_HEALTH_INTERVAL=0, SERVER_TIMING=0)
+    backend._embedding_model = FakeEmbeddingModel()
+    server = ThreadedServer(backend.app)
+    try:
+        reports = asyncio.run(check(backend, server.url, args))
+    finally:
+        server.stop()
+    for name, found in reports[:3]:
+        print(f"{args.engine:<7} {name:<24} {found}")
+    print(f"{args.engine}: store, registry and BM25 agree after {args.rounds} rounds")
+
+
+def main(args):
+    failed = []
+    for engine in args.engines:
+        env = {**os.environ, "CHROMA_PATH": tempfile.mkdtemp(prefix=f"zentro_consistency_{engine}_")}
+        code = subprocess.call([sys.executable, os.path.abspath(__file__), "--engine", engine,
+                                "--rounds", str(args.rounds), "--concurrent", str(args.concurrent)], env=env)
+        if code:
+            failed.append(engine)
+    if failed:
+        sys.exit(f"consistency checks failed for {', '.join(failed)}")
+    print("all consistency checks passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engines", nargs="+", choices=["chroma", "local"], default=["chroma", "local"])
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--concurrent", type=int, default=3, help="re-indexes of one document sent at once")
+    parser.add_argument("--engine", choices=["chroma", "local"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.engine:
+        run_engine(args)
+    else:
+        main(args)
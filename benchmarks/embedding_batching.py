@@ -0,0 +1,65 @@
+"""Throughput of the embedding micro-batcher against batch-of-one encoding.
+
+Simulates N users asking at once: each submits a single query to the
+batcher. The fake model charges a fixed per-call overhead plus a small
+per-text cost, which is the shape of a real transformer forward pass.
+Pass --real to use the actual SentenceTransformer instead.
+
+    python benchmarks/embedding_batching.py --clients 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import FakeEmbeddingModel
+from embedding_service import EmbeddingBatcher
+
+
+async def run(batcher, clients):
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(batcher.encode([f"question number {i}"]) for i in range(clients)))
+    wall = time.perf_counter() - t0
+    await batcher.close()
+    assert all(len(r) == 1 for r in results)
+    return wall
+
+
+def main(args):
+    if args.real:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    else:
+        model = FakeEmbeddingModel(cost=args.call_cost, per_item=args.item_cost)
+
+    def encode(texts):
+        return model.encode(texts).tolist()
+
+    pool = ThreadPoolExecutor(max_workers=args.workers)
+    print(f"clients={args.clients} workers={args.workers}")
+    baseline = None
+    for size in [1] + args.batch_sizes:
+        batcher = EmbeddingBatcher(encode, pool, max_batch_size=size, max_wait_ms=args.wait_ms,
+                                   max_concurrent_batches=args.workers)
+        wall = asyncio.run(run(batcher, args.clients))
+        rate = args.clients / wall
+        baseline = baseline or rate
+        print(f"batch_size={size:>4}  batches={batcher.stats['batches']:>4}  "
+              f"wall={wall:.3f}s  {rate:8.1f} texts/s  x{rate / baseline:.1f}")
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[8, 32, 64])
+    parser.add_argument("--wait-ms", type=float, default=5.0)
+    parser.add_argument("--call-cost", type=float, default=0.005, help="fake model seconds per encode call")
+    parser.add_argument("--item-cost", type=float, default=0.0002, help="fake model seconds per text")
+    parser.add_argument("--real", action="store_true", help="use the real SentenceTransformer")
+    main(parser.parse_args())
@@ -0,0 +1,179 @@
+"""Compare embedding engines: load time, memory, throughput, latency and vector agreement.
+
+Each engine runs in its own subprocess, so import cost and RSS are measured
+from a clean interpreter. The same corpus chunks go through every engine, and
+the ONNX vectors are compared with the sentence-transformers ones by cosine
+similarity. Both need the model available locally or from the Hugging Face
+Hub.
+
+    python benchmarks/embedding_engines.py --texts 2000
+    python benchmarks/embedding_engines.py --model ./all-MiniLM-L6-v2 --onnx-file onnx/model.onnx --quantize
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import REPO_ROOT
+
+ENGINES = {
+    "sentence-transformers": {},
+    "onnx-int8": {"engine": "onnx"},
+    "onnx-fp32": {"engine": "onnx", "onnx_file": "onnx/model.onnx", "onnx_quantize": False},
+}
+
+
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def worker(args):
+    """Subprocess side: load one engine, time it, and save its vectors."""
+    config = json.loads(args.worker)
+    baseline = rss_mb()
+    t0 = time.perf_counter()
+    sys.path.insert(0, REPO_ROOT)
+    from embedding_engines import load_engine
+    engine = load_engine(
+        config.get("engine", "sentence-transformers"),
+        args.model,
+        onnx_file=config.get("onnx_file", args.onnx_file),
+        onnx_quantize=config.get("onnx_quantize", args.quantize),
+        onnx_threads=args.threads,
+    ).load()
+    engine.encode(["warm-up"])
+    load_seconds = time.perf_counter() - t0
+    loaded = rss_mb()
+
+    with open(args.texts_file) as f:
+        texts = json.load(f)
+    t0 = time.perf_counter()
+    vectors = np.concatenate([engine.encode(texts[i:i + args.batch]) for i in range(0, len(texts), args.batch)])
+    bulk = time.perf_counter() - t0
+
+    latencies = []
+    for text in texts[:args.queries]:
+        t0 = time.perf_counter()
+        engine.encode([text[:200]])
+        latencies.append(time.perf_counter() - t0)
+    ms = np.asarray(latencies) * 1000
+
+    np.save(args.vectors_file, vectors)
+    print(json.dumps({
+        "load_seconds": round(load_seconds, 2),
+        "torch_imported": "torch" in sys.modules,
+        "rss_after_load_mb": round(loaded, 1),
+        "rss_model_mb": round(loaded - baseline, 1),
+        "peak_rss_mb": round(max(loaded, rss_mb()), 1),
+        "texts_per_second": round(len(texts) / bulk, 1),
+        "query_p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "model_path": getattr(engine, "model_path", None),
+    }))
+
+
+def run_engine(name, config, args, texts_file, vectors_file):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config), "--texts-file", texts_file,
+           "--vectors-file", vectors_file, "--model", args.model, "--onnx-file", args.onnx_file,
+           "--batch", str(args.batch), "--queries", str(args.queries), "--threads", str(args.threads)]
+    if args.quantize:
+        cmd.append("--quantize")
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        stderr = proc.stderr.strip().splitlines()
+        return {"error": stderr[-1] if stderr else f"exited with status {proc.returncode}", "stderr": stderr[-20:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    import corpus
+
+    texts, doc = [], 0
+    while len(texts) < args.texts:
+        texts += [chunk for page in corpus.document_pages(doc, 2) for chunk in page.split("\n\n")]
+        doc += 1
+    texts = texts[:args.texts]
+    results = {"model": args.model, "texts": len(texts), "batch": args.batch, "engines": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        texts_file = os.path.join(tmp, "texts.json")
+        with open(texts_file, "w") as f:
+            json.dump(texts, f)
+        vectors = {}
+        for name in args.engines:
+            vectors_file = os.path.join(tmp, f"{name}.npy")
+            outcome = run_engine(name, ENGINES[name], args, texts_file, vectors_file)
+            results["engines"][name] = outcome
+            if "error" not in outcome:
+                vectors[name] = np.load(vectors_file)
+
+    reference = vectors.get("sentence-transformers")
+    print(f"{len(texts)} texts, batch {args.batch}, model {args.model}\n")
+    print(f"{'engine':<22} {'load s':>7} {'RSS MB':>7} {'texts/s':>8} {'p50 ms':>7} {'p95 ms':>7} "
+          f"{'cos mean':>9} {'cos min':>8}  torch")
+    for name, outcome in results["engines"].items():
+        if "error" in outcome:
+            print(f"{name:<22} error: {outcome['error']}")
+            continue
+        if reference is not None and name != "sentence-transformers":
+            a, b = reference, vectors[name]
+            cos = (a * b).sum(1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+            outcome["cosine_mean"] = round(float(cos.mean()), 5)
+            outcome["cosine_min"] = round(float(cos.min()), 5)
+        print(f"{name:<22} {outcome['load_seconds']:>7} {outcome['rss_after_load_mb']:>7} "
+              f"{outcome['texts_per_second']:>8} {outcome['query_p50_ms']:>7} {outcome['query_p95_ms']:>7} "
+              f"{outcome.get('cosine_mean', '-'):>9} {outcome.get('cosine_min', '-'):>8}  {outcome['torch_imported']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    failures = []
+    for name, outcome in results["engines"].items():
+        if "error" in outcome:
+            failures.append(f"{name} failed: {outcome['error']}")
+            continue
+        if name == "sentence-transformers":
+            continue
+        if reference is None:
+            failures.append(f"{name}: no sentence-transformers vectors to check it against (include that engine)")
+        elif outcome["cosine_min"] < args.min_cosine:
+            failures.append(f"{name} disagrees with the torch engine (cos min {outcome['cosine_min']})")
+        if outcome["torch_imported"]:
+            failures.append(f"{name} imported torch")
+    if failures:
+        sys.exit("\n".join(failures))
+    print("\nall engines agree with the torch engine")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--onnx-file", default="onnx/model_quint8_avx2.onnx", help="file used by onnx-int8")
+    parser.add_argument("--quantize", action="store_true", help="quantize --onnx-file to int8 locally first")
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--texts", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=100, help="single-text encodes timed for latency")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--texts-file", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args)
+    else:
+        main(args)
@@ -0,0 +1,85 @@
+"""Check that the LLM router spreads load, fails over and recovers.
+
+Starts several stub OpenAI-compatible servers on localhost and drives the
+router with concurrent chat completions through three phases:
+
+1. all healthy: requests should split roughly evenly (least outstanding);
+2. one server returns 500s and another is shut down: every request must
+   still succeed, and both bad servers get ejected;
+3. the failing server recovers: a health probe puts it back in rotation.
+
+    python benchmarks/llm_router.py --servers 3 --requests 60 --latency 0.2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from common import REPO_ROOT, StubLLMServer
+
+sys.path.insert(0, REPO_ROOT)
+from llm_router import LLMRouter  # noqa: E402
+
+
+async def fire(router, n, stream=False):
+    async def one(i):
+        if stream:
+            response = await router.chat.completions.create(
+                model="stub", messages=[{"role": "user", "content": f"q{i}"}], stream=True
+            )
+            return "".join([c.choices[0].delta.content or "" async for c in response])
+        response = await router.chat.completions.create(model="stub", messages=[{"role": "user", "content": f"q{i}"}])
+        return response.choices[0].message.content
+
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(n)), return_exceptions=True)
+    return [r for r in results if isinstance(r, Exception)], time.perf_counter() - t0
+
+
+def show(label, router, servers, wall):
+    print(f"\n{label}  wall={wall:.2f}s")
+    for backend, server in zip(router.stats()["backends"], servers):
+        print(f"  {backend['base_url']:<28} healthy={backend['healthy']!s:<5} requests={backend['requests']:<4} "
+              f"errors={backend['errors']:<3} latency={backend['latency_ms']}ms  served={server.requests}")
+
+
+async def main(args):
+    servers = [StubLLMServer(latency=args.latency) for _ in range(args.servers)]
+    router = LLMRouter([s.base_url for s in servers], api_key="stub", eject_after=2, health_interval=0.5)
+    router.start()
+    try:
+        errors, wall = await fire(router, args.requests)
+        show("all healthy", router, servers, wall)
+        assert not errors, errors[0]
+        served = [s.requests for s in servers]
+        assert max(served) - min(served) <= max(2, args.requests // 10), f"uneven split: {served}"
+        assert wall < args.requests * args.latency / args.servers, "requests were serialized"
+
+        servers[0].fail = True
+        if args.servers > 2:
+            servers[-1].stop()
+        errors, wall = await fire(router, args.requests, stream=True)
+        show("one failing, one down (streamed)", router, servers, wall)
+        assert not errors, errors[0]
+        assert not router.backends[0].healthy
+
+        servers[0].fail = False
+        await asyncio.sleep(1.0)
+        before = servers[0].requests
+        errors, wall = await fire(router, args.requests)
+        show("recovered", router, servers, wall)
+        assert not errors, errors[0]
+        assert router.backends[0].healthy and servers[0].requests > before, "recovered server got no traffic"
+    finally:
+        await router.close()
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--servers", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.2)
+    asyncio.run(main(parser.parse_args()))
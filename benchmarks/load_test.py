@@ -0,0 +1,355 @@
+"""End-to-end load test: ingestion throughput, /rag/ask latency percentiles, /rag/list scaling, memory.
+
+Serves the real backend over HTTP from this process (uvicorn in a thread)
+against a synthetic corpus (see corpus.py), with a stub OpenAI-compatible LLM server on localhost. The stub has a fixed
+time to first token and token rate, so LM Studio isn't needed. Embeddings
+come from the deterministic fake model unless --embeddings real is given.
+Phases:
+
+1. ingest: upload the corpus in --list-steps slices with --ingest-clients
+   concurrent uploads, and time /rag/list after each slice;
+2. ask: --clients concurrent users send --requests /rag/ask calls, with the
+   answer cache bypassed so every call runs the full pipeline;
+3. stream (--stream): the same questions through /rag/ask/stream, which
+   measures time to first token.
+
+Results go to --output as JSON. Pass --compare with an earlier file to
+print the change in the headline numbers.
+
+    python benchmarks/load_test.py --docs 200 --clients 16 --requests 200 --output run.json
+    python benchmarks/load_test.py --docs 200 --compare run.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+import numpy as np
+
+import corpus
+from common import REPO_ROOT, FakeEmbeddingModel, StubLLMServer, ThreadedServer, load_backend
+
+# (section, key, lower_is_better) pairs shown by --compare
+HEADLINE = [
+    ("ingest", "docs_per_second", False),
+    ("ingest", "chunks_per_second", False),
+    ("ask", "p50_ms", True),
+    ("ask", "p95_ms", True),
+    ("ask", "p99_ms", True),
+    ("ask", "requests_per_second", False),
+    ("stream", "ttft_p50_ms", True),
+    ("stream", "ttft_p95_ms", True),
+    ("list", "p95_ms", True),
+    ("memory", "peak_rss_mb", True),
+]
+
+
+class MemorySampler:
+    """Tracks this process's peak resident set size, resettable per phase.
+
+    Samples /proc/self/statm in a background thread. Elsewhere, falls back to
+    getrusage, which only knows the peak for the whole process lifetime.
+    """
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def rss(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return usage if sys.platform == "darwin" else usage * 1024
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self.rss())
+
+    def start(self):
+        self._peak = self.rss()
+        self._thread.start()
+
+    def reset(self) -> float:
+        """Peak RSS in MB since the last reset."""
+        peak = max(self._peak, self.rss())
+        self._peak = self.rss()
+        return round(peak / 2**20, 1)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def summarize(latencies) -> dict:
+    if not latencies:
+        return {"count": 0}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(ms),
+        "mean_ms": round(float(ms.mean()), 1),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "max_ms": round(float(ms.max()), 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        return ""
+
+
+async def ingest(http, files, clients):
+    semaphore = asyncio.Semaphore(clients)
+    results = []
+
+    async def upload(name, data):
+        async with semaphore:
+            r = await http.post("/rag/upload", params={"wait": "true"}, files={"file": (name, data)})
+            results.append(r.json())
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(upload(name, data) for name, data in files))
+    return results, time.perf_counter() - t0
+
+
+async def time_list(http, samples):
+    latencies = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        r = await http.get("/rag/list", params={"limit": 100})
+        latencies.append(time.perf_counter() - t0)
+        assert "error" not in r.json(), r.json()
+    return latencies
+
+
+async def run_clients(questions, clients, request):
+    """Send every question through `request` from `clients` concurrent workers."""
+    queue = asyncio.Queue()
+    for q in questions:
+        queue.put_nowait(q)
+    samples, errors = [], []
+
+    async def worker():
+        while not queue.empty():
+            question = queue.get_nowait()
+            try:
+                samples.append(await request(question))
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return samples, errors, time.perf_counter() - t0
+
+
+async def wait_ready(http, timeout: float = 600) -> dict:
+    """Poll /ready until the warm-up is done, so it isn't counted as ingestion time."""
+    deadline = time.perf_counter() + timeout
+    while True:
+        response = await http.get("/ready")
+        if response.status_code == 200 or time.perf_counter() > deadline:
+            return response.json()
+        await asyncio.sleep(0.1)
+
+
+async def main(args):
+    memory = MemorySampler()
+    memory.start()
+    answer = " ".join(f"word{i}" for i in range(args.answer_tokens))
+    llm = StubLLMServer(latency=args.llm_latency, answer=answer, tokens_per_second=args.llm_tokens_per_second)
+    backend = load_backend(LM_STUDIO_BASE_URLS=llm.base_url, LLM_HEALTH_INTERVAL=0)
+    if args.embeddings == "fake":
+        backend._embedding_model = FakeEmbeddingModel(cost=args.embed_cost, per_item=args.embed_per_item)
+
+    if args.corpus:
+        names = sorted(n for n in os.listdir(args.corpus) if n.lower().endswith((".pdf", ".txt")))[:args.docs or None]
+        files = [(n, open(os.path.join(args.corpus, n), "rb").read()) for n in names]
+    else:
+        files = corpus.generate(args.docs, args.pages, args.paragraphs, args.pdf_share, args.seed)
+    questions = corpus.questions(len(files), args.requests, args.seed)
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "config": vars(args),
+    }
+    memory.reset()
+
+    server = ThreadedServer(backend.app)
+    limits = httpx.Limits(max_connections=max(args.clients, args.ingest_clients) + 4)
+    async with httpx.AsyncClient(base_url=server.url, timeout=600, limits=limits) as http:
+        readiness = await wait_ready(http)
+        # Seconds each warm-up component took; the backend was imported before the server started
+        results["startup"] = {name: c["seconds"] for name, c in readiness["components"].items()}
+
+        # 1. Ingestion, timing /rag/list as the index grows
+        uploads, list_steps, seconds = [], [], 0.0
+        steps = max(1, min(args.list_steps, len(files)))
+        for step in range(steps):
+            batch = files[len(files) * step // steps:len(files) * (step + 1) // steps]
+            step_results, step_seconds = await ingest(http, batch, args.ingest_clients)
+            uploads += step_results
+            seconds += step_seconds
+            chunks = sum(r.get("num_chunks", 0) for r in uploads)
+            list_steps.append({"documents": len(uploads), "chunks": chunks,
+                               **summarize(await time_list(http, args.list_samples))})
+            print(f"ingested {len(uploads)}/{len(files)} documents, {chunks} chunks, "
+                  f"/rag/list p95={list_steps[-1]['p95_ms']}ms", flush=True)
+
+        errors = [r["error"] for r in uploads if "error" in r]
+        chunks = sum(r.get("num_chunks", 0) for r in uploads)
+        pages = sum(r.get("num_pages", 0) for r in uploads)
+        total_bytes = sum(len(data) for _, data in files)
+        results["ingest"] = {
+            "documents": len(files),
+            "pages": pages,
+            "chunks": chunks,
+            "megabytes": round(total_bytes / 1e6, 2),
+            "seconds": round(seconds, 2),
+            "docs_per_second": round(len(files) / seconds, 2),
+            "pages_per_second": round(pages / seconds, 2),
+            "chunks_per_second": round(chunks / seconds, 1),
+            "megabytes_per_second": round(total_bytes / 1e6 / seconds, 2),
+            "errors": len(errors),
+            "peak_rss_mb": memory.reset(),
+        }
+        results["list"] = {**list_steps[-1], "steps": list_steps}
+        assert not errors, errors[0]
+
+        # 2. /rag/ask under concurrent clients
+        async def ask(question):
+            t0 = time.perf_counter()
+            r = await http.post("/rag/ask", json={"question": question, "use_cache": args.answer_cache})
+            body = r.json()
+            if "error" in body:
+                raise RuntimeError(body["error"])
+            return time.perf_counter() - t0
+
+        await run_clients(questions[:args.clients], args.clients, ask)  # warm-up
+        latencies, errors, wall = await run_clients(questions, args.clients, ask)
+        results["ask"] = {
+            "clients": args.clients,
+            **summarize(latencies),
+            "requests_per_second": round(len(latencies) / wall, 2),
+            "errors": len(errors),
+            "peak_rss_mb": memory.reset(),
+        }
+        assert not errors, errors[0]
+
+        # 3. Time to first token through the streaming endpoint
+        if args.stream:
+            async def ask_stream(question):
+                t0 = time.perf_counter()
+                first = None
+                async with http.stream("POST", "/rag/ask/stream",
+                                       json={"question": question, "use_cache": args.answer_cache}) as r:
+                    async for line in r.aiter_lines():
+                        if line == "event: token" and first is None:
+                            first = time.perf_counter() - t0
+                        elif line == "event: error":
+                            raise RuntimeError("stream reported an error")
+                return first if first is not None else time.perf_counter() - t0, time.perf_counter() - t0
+
+            samples, errors, wall = await run_clients(questions, args.clients, ask_stream)
+            ttft = summarize([s[0] for s in samples])
+            total = summarize([s[1] for s in samples])
+            results["stream"] = {
+                "clients": args.clients,
+                **{f"ttft_{k}": v for k, v in ttft.items() if k != "count"},
+                **{f"total_{k}": v for k, v in total.items() if k != "count"},
+                "count": total["count"],
+                "errors": len(errors),
+                "peak_rss_mb": memory.reset(),
+            }
+            assert not errors, errors[0]
+
+    server.stop()
+    llm.stop()
+    memory.stop()
+    phases = {s: results[s]["peak_rss_mb"] for s in ("ingest", "ask", "stream") if s in results}
+    results["memory"] = {"peak_rss_mb": max(phases.values()), "per_phase_mb": phases}
+    return results
+
+
+def report(results):
+    ing, ask = results["ingest"], results["ask"]
+    print(f"\ningest  {ing['documents']} docs / {ing['chunks']} chunks in {ing['seconds']}s: "
+          f"{ing['docs_per_second']} docs/s, {ing['chunks_per_second']} chunks/s, {ing['megabytes_per_second']} MB/s")
+    print(f"list    {results['list']['chunks']} chunks: p50={results['list']['p50_ms']}ms "
+          f"p95={results['list']['p95_ms']}ms")
+    print(f"ask     {ask['clients']} clients: p50={ask['p50_ms']}ms p95={ask['p95_ms']}ms p99={ask['p99_ms']}ms "
+          f"({ask['requests_per_second']} req/s)")
+    if "stream" in results:
+        s = results["stream"]
+        print(f"stream  ttft p50={s['ttft_p50_ms']}ms p95={s['ttft_p95_ms']}ms, total p95={s['total_p95_ms']}ms")
+    print(f"memory  peak RSS {results['memory']['peak_rss_mb']} MB {results['memory']['per_phase_mb']}")
+
+
+def compare(results, baseline):
+    print(f"\nvs {baseline['meta'].get('commit') or 'baseline'} ({baseline['meta'].get('started', '?')})")
+    for section, key, lower_is_better in HEADLINE:
+        old = baseline.get(section, {}).get(key)
+        new = results.get(section, {}).get(key)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change > 0 if lower_is_better else change < 0
+        flag = "  <-- worse" if worse and abs(change) >= 10 else ""
+        print(f"  {section + '.' + key:<28} {old:>10} -> {new:>10}  {change:+6.1f}%{flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=4)
+    parser.add_argument("--pdf-share", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", help="directory of PDF/TXT files to ingest instead of a generated corpus")
+    parser.add_argument("--ingest-clients", type=int, default=4)
+    parser.add_argument("--list-steps", type=int, default=4)
+    parser.add_argument("--list-samples", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--stream", action="store_true", help="also measure time to first token")
+    parser.add_argument("--answer-cache", action="store_true", help="let /rag/ask use the semantic answer cache")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--embeddings", choices=["fake", "real"], default="fake")
+    parser.add_argument("--embed-cost", type=float, default=0.005, help="fake model seconds per call")
+    parser.add_argument("--embed-per-item", type=float, default=0.0005, help="fake model seconds per text")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    report(results)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nresults written to {args.output}")
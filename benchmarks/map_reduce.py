@@ -0,0 +1,64 @@
+"""Check that map-reduce document analysis scales with concurrency, not length.
+
+Posts generated documents of growing length to /analyze/document with
+mode=map-reduce against a stub LLM with a fixed latency. Wall time should
+track ceil(sections / concurrency) * latency, and a repeated request should
+only pay for the final call because every section result is cached.
+
+    python benchmarks/map_reduce.py --latency 0.2 --concurrency 8
+"""
+import argparse
+import asyncio
+import math
+import time
+
+import httpx
+
+from common import FakeChatClient, load_backend
+
+
+def make_document(sections: int, section_chars: int) -> str:
+    paragraphs = []
+    for s in range(sections):
+        # Distinct per document size, so runs don't hit each other's cached sections
+        words = [f"clause{sections}_{s}_{i}" for i in range(section_chars // 14)]
+        paragraphs.append(f"Article {s}. " + " ".join(words) + ".")
+    return "\n\n".join(paragraphs)
+
+
+async def main(args):
+    backend = load_backend(ANALYZE_CONCURRENCY=args.concurrency)
+    backend.client = FakeChatClient(latency=args.latency)
+    section_chars = backend.ANALYZE_SECTION_CHARS
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+        async def analyze(text):
+            t0 = time.perf_counter()
+            files = {"file": ("contract.txt", text.encode("utf-8"), "text/plain")}
+            r = await http.post("/analyze/document", files=files, data={"mode": "map-reduce"})
+            return r.json(), time.perf_counter() - t0
+
+        print(f"{'sections':>8} {'calls':>6} {'levels':>6} {'wall':>7} {'expected':>8} {'serial':>7} {'cached':>7}")
+        for sections in args.sections:
+            text = make_document(sections, section_chars - 200)
+            result, wall = await analyze(text)
+            assert "error" not in result, result
+            stats = result["map_reduce"]
+            # One round per batch of sections, one per merge level, plus the final call
+            expected = (math.ceil(stats["sections"] / args.concurrency) + stats["reduce_levels"] + 1) * args.latency
+            serial = (stats["llm_calls"] + 1) * args.latency
+
+            again, cached_wall = await analyze(text)
+            assert again["map_reduce"]["llm_calls"] == 0, again["map_reduce"]
+            print(f"{stats['sections']:>8} {stats['llm_calls'] + 1:>6} {stats['reduce_levels']:>6} "
+                  f"{wall:>6.2f}s {expected:>7.2f}s {serial:>6.2f}s {cached_wall:>6.2f}s")
+            assert wall < serial / 2 or stats["llm_calls"] < 2 * args.concurrency, "section calls were serialized"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--concurrency", type=int, default=8)
+    asyncio.run(main(parser.parse_args()))
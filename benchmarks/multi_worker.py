@@ -0,0 +1,247 @@
+"""Multi-worker test: uvicorn --workers N in front of one vector service.
+
+Starts the vector service (with the fake embedding model) and N uvicorn
+workers as separate processes, then checks what breaks when state is
+per-process:
+
+- uploads are polled through /rag/jobs/{id}, which usually lands on a
+  worker other than the one that accepted the upload;
+- two concurrent uploads of the same file share one job;
+- a repeated question is answered from the shared answer cache;
+- after /rag/clear every worker sees the empty store, and indexing works again.
+
+It also measures /rag/ask throughput against a single-process backend with
+the same settings, and reports each process's RSS. Only the service should
+hold the model. The LLM is a stub server in this process.
+
+    python benchmarks/multi_worker.py --workers 4 --docs 40 --clients 32 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import corpus
+from common import REPO_ROOT, FakeEmbeddingModel, StubLLMServer, load_backend
+from load_test import run_clients, summarize, wait_ready
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+
+def worker_pids(pid: int):
+    """Uvicorn's worker processes under `pid` (skipping multiprocessing's resource tracker)."""
+    found = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parent = int(f.read().rsplit(")", 1)[1].split()[1])
+                with open(f"/proc/{entry}/cmdline", "rb") as f:
+                    spawned = b"spawn_main" in f.read()
+            except (OSError, IndexError, ValueError):
+                continue
+            if parent == pid and spawned:
+                found.append(int(entry))
+    return found
+
+
+def serve(args):
+    """Subprocess side: the vector service, or the single-process baseline."""
+    backend = load_backend()
+    backend._embedding_model = FakeEmbeddingModel(cost=args.embed_cost)
+    if args.role == "service":
+        backend.serve_vector_service(args.socket)
+    else:
+        import uvicorn
+        uvicorn.run(backend.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def start(role: str, args, env, port: int, socket_path: str = ""):
+    script = [sys.executable, os.path.abspath(__file__), "--role", role, "--embed-cost", str(args.embed_cost)]
+    if role == "service":
+        return subprocess.Popen(script + ["--socket", socket_path], env=env, cwd=REPO_ROOT)
+    if role == "single":
+        return subprocess.Popen(script + ["--port", str(port)], env=env, cwd=REPO_ROOT)
+    worker_env = {**env, "VECTOR_SERVICE": socket_path}
+    return subprocess.Popen([sys.executable, "-m", "uvicorn", "backend:app", "--port", str(port),
+                             "--workers", str(args.workers), "--log-level", "warning"],
+                            env=worker_env, cwd=REPO_ROOT)
+
+
+async def wait_listening(http, timeout: float = 120):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            return await wait_ready(http)
+        except httpx.TransportError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def poll_jobs(http, job_ids, timeout: float = 300):
+    """Poll every job until it finishes; a job unknown to the worker that answers is a failure."""
+    pending, results = set(job_ids), {}
+    deadline = time.perf_counter() + timeout
+    while pending and time.perf_counter() < deadline:
+        for job_id in list(pending):
+            status = (await http.get(f"/rag/jobs/{job_id}")).json()
+            assert "stage" in status, status
+            if status["stage"] in ("done", "failed"):
+                results[job_id] = status
+                pending.discard(job_id)
+        await asyncio.sleep(0.05)
+    assert not pending, f"{len(pending)} jobs never finished"
+    return results
+
+
+async def exercise(url: str, files, questions, args) -> dict:
+    limits = httpx.Limits(max_connections=args.clients + 4)
+    # No keep-alive, so requests spread over the workers instead of sticking to one connection
+    async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits,
+                                 headers={"Connection": "close"}) as http:
+        t0 = time.perf_counter()
+        ready = await wait_listening(http)
+        assert ready["ready"], ready
+        ready_s = time.perf_counter() - t0
+
+        # Ingest without waiting, then follow each job from whichever worker answers
+        t0 = time.perf_counter()
+        uploads = await asyncio.gather(*(http.post("/rag/upload", files={"file": (name, data)})
+                                         for name, data in files + files[:1]))
+        accepted = [r.json() for r in uploads]
+        assert all("error" not in r for r in accepted), accepted
+        assert accepted[0]["job_id"] == accepted[-1]["job_id"], "identical uploads got separate jobs"
+        jobs = await poll_jobs(http, {r["job_id"] for r in accepted})
+        ingest_s = time.perf_counter() - t0
+        failed = [j for j in jobs.values() if j["stage"] != "done"]
+        assert not failed, failed
+        listed = (await http.get("/rag/list")).json()
+        assert listed["total"] == len(files), listed
+
+        async def ask(question):
+            t = time.perf_counter()
+            r = await http.post("/rag/ask", json={"question": question, "use_cache": False})
+            body = r.json()
+            if "error" in body:
+                raise RuntimeError(body["error"])
+            return time.perf_counter() - t
+
+        latencies, errors, seconds = await run_clients(questions, args.clients, ask)
+        assert not errors, errors[:5]
+
+        # The answer cache is shared: asking again should hit, whichever worker answers
+        probe = {"question": "Which worker answered this question first?"}
+        first = (await http.post("/rag/ask", json=probe)).json()
+        again = [(await http.post("/rag/ask", json=probe)).json() for _ in range(args.workers * 2)]
+        assert first.get("cached") is False and all(a.get("cached") for a in again), (first, again)
+
+        # After a clear, no worker may keep using the old collection
+        assert "error" not in (await http.post("/rag/clear")).json()
+        totals = [(await http.get("/rag/list")).json()["total"] for _ in range(args.workers * 2)]
+        assert totals == [0] * len(totals), totals
+        empty = (await http.post("/rag/ask", json={"question": questions[1], "use_cache": False})).json()
+        assert "error" not in empty and not empty.get("used_chunks"), empty
+        name, data = files[0]
+        again = (await http.post("/rag/upload", params={"wait": "true"}, files={"file": (name, data)})).json()
+        assert again.get("num_chunks"), again
+        assert (await http.get("/rag/list")).json()["total"] == 1
+
+    return {
+        "ready_s": round(ready_s, 2),
+        "ingest_s": round(ingest_s, 2),
+        "ask": {**summarize(latencies), "requests_per_second": round(len(latencies) / seconds, 1)},
+    }
+
+
+async def run_mode(mode: str, args, files, questions, llm_url: str) -> dict:
+    tmp = tempfile.mkdtemp(prefix=f"zentro_{mode}_")
+    env = {**os.environ, "CHROMA_PATH": os.path.join(tmp, "chroma"), "UPLOAD_DIR": os.path.join(tmp, "uploads"),
+           "LM_STUDIO_BASE_URLS": llm_url, "LLM_HEALTH_INTERVAL": "0", "SERVER_TIMING": "0"}
+    env.pop("VECTOR_SERVICE", None)
+    port = free_port()
+    processes = []
+    try:
+        if mode == "single":
+            processes.append(start("single", args, env, port))
+        else:
+            socket_path = os.path.join(tmp, "vector.sock")
+            processes.append(start("service", args, env, port, socket_path))
+            processes.append(start("workers", args, env, port, socket_path))
+        result = await exercise(f"http://127.0.0.1:{port}", files, questions, args)
+        if mode == "single":
+            result["rss_mb"] = {"backend": rss_mb(processes[0].pid)}
+        else:
+            workers = worker_pids(processes[1].pid)
+            result["rss_mb"] = {"service": rss_mb(processes[0].pid),
+                                **{f"worker {i}": rss_mb(pid) for i, pid in enumerate(workers)}}
+        return result
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def main(args):
+    files = corpus.generate(args.docs, args.pages, 6, 0.3, args.seed)
+    questions = corpus.questions(len(files), args.requests, args.seed)
+    llm = StubLLMServer(latency=args.llm_latency, answer="stub answer " * 20)
+    try:
+        results = {mode: await run_mode(mode, args, files, questions, llm.base_url) for mode in args.modes}
+    finally:
+        llm.stop()
+
+    print(f"\n{args.docs} docs, {args.requests} questions from {args.clients} clients, {os.cpu_count()} CPUs")
+    for mode, r in results.items():
+        ask = r["ask"]
+        label = "single process" if mode == "single" else f"{args.workers} workers + service"
+        print(f"{label:<22} ready {r['ready_s']:>5}s  ingest {r['ingest_s']:>6}s  "
+              f"ask {ask['requests_per_second']:>6} req/s  p50 {ask['p50_ms']:>7}ms  p95 {ask['p95_ms']:>7}ms")
+        print(f"{'':<22} RSS MB {r['rss_mb']}")
+    print("all multi-worker checks passed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=["single", "multi"], default=["single", "multi"])
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embed-cost", type=float, default=0.002, help="seconds of blocking work per encode call")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--role", choices=["service", "single", "workers"], help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.role:
+        serve(args)
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,56 @@
+"""Serial vs process-pool PDF text extraction on a synthetic many-page PDF.
+
+    python benchmarks/pdf_extraction.py --pages 2000 --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from ingestion import open_pages
+
+
+def make_pdf(pages: int, lines_per_page: int = 45) -> bytes:
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        body = "\n".join(
+            f"Section {p}.{i}: clause ID-{p:05d}-{i:02d} covers warranty terms and part numbers."
+            for i in range(lines_per_page)
+        )
+        page.insert_textbox(fitz.Rect(36, 36, 576, 806), body, fontsize=9)
+    return doc.tobytes()
+
+
+def extract(file_bytes, executor=None, workers=0):
+    start = time.perf_counter()
+    _, pages = open_pages(file_bytes, "bench.pdf", executor=executor, workers=workers, parallel_min_pages=1)
+    texts = [text for _, text in pages]
+    return time.perf_counter() - start, texts
+
+
+def main(args):
+    file_bytes = make_pdf(args.pages)
+    print(f"pages={args.pages} size={len(file_bytes) / 1e6:.1f}MB cpus={os.cpu_count()}")
+
+    serial, expected = extract(file_bytes)
+    print(f"serial            {serial:7.3f}s  {args.pages / serial:8.0f} pages/s")
+
+    for workers in args.workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            extract(make_pdf(workers * 2), pool, workers)  # warm up the worker processes
+            wall, texts = extract(file_bytes, pool, workers)
+        assert texts == expected, "parallel extraction changed page order or text"
+        print(f"workers={workers:<2}        {wall:7.3f}s  {args.pages / wall:8.0f} pages/s  x{serial / wall:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    main(parser.parse_args())
@@ -0,0 +1,123 @@
+"""Retrieval latency and recall: dense vs BM25 vs hybrid (reciprocal rank fusion).
+
+Recall@k is measured on the bundled fixture corpus, whose queries mix exact
+identifiers (part numbers, error codes, clause IDs) with natural-language
+questions. Latency is measured on a synthetic corpus of --chunks chunks.
+Pass --real to embed with the actual SentenceTransformer.
+
+    python benchmarks/retrieval.py --chunks 50000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import FakeEmbeddingModel
+from lexical_index import BM25Index, reciprocal_rank_fusion
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "retrieval_corpus.json")
+
+
+class DenseIndex:
+    """Exact cosine search; the vector half of the comparison."""
+
+    def __init__(self, model, ids, texts):
+        self.model = model
+        self.ids = ids
+        self.matrix = np.asarray(model.encode(texts), dtype=np.float32)
+
+    def search(self, query, k):
+        q = np.asarray(self.model.encode([query]), dtype=np.float32)[0]
+        scores = self.matrix @ q
+        top = np.argsort(-scores)[:k]
+        return [self.ids[i] for i in top]
+
+
+def search(mode, dense, bm25, query, k, candidates):
+    if mode == "vector":
+        return dense.search(query, k)
+    if mode == "bm25":
+        return [chunk_id for chunk_id, _ in bm25.search(query, k)]
+    fused = reciprocal_rank_fusion([
+        dense.search(query, candidates),
+        [chunk_id for chunk_id, _ in bm25.search(query, candidates)],
+    ])
+    return fused[:k]
+
+
+def recall(args, model):
+    with open(FIXTURE) as f:
+        fixture = json.load(f)
+    ids = [c["id"] for c in fixture["chunks"]]
+    texts = [c["text"] for c in fixture["chunks"]]
+    dense = DenseIndex(model, ids, texts)
+    bm25 = BM25Index()
+    bm25.add(ids, texts, [c["doc_id"] for c in fixture["chunks"]])
+
+    print(f"recall@{args.k} on {len(ids)} fixture chunks / {len(fixture['queries'])} queries")
+    for mode in ("vector", "bm25", "hybrid"):
+        by_type = {}
+        for q in fixture["queries"]:
+            found = set(search(mode, dense, bm25, q["query"], args.k, args.candidates))
+            hit = len(found & set(q["relevant"])) / len(q["relevant"])
+            by_type.setdefault(q["type"], []).append(hit)
+        overall = statistics.mean(h for hits in by_type.values() for h in hits)
+        parts = "  ".join(f"{t}={statistics.mean(h):.2f}" for t, h in sorted(by_type.items()))
+        print(f"  {mode:<7} overall={overall:.2f}  {parts}")
+
+
+def latency(args, model):
+    rnd = random.Random(0)
+    vocab = [f"term{i}" for i in range(5000)]
+    texts = [
+        " ".join(rnd.choices(vocab, k=60)) + f" PN-{i:06d} E{rnd.randint(1000, 9999)}"
+        for i in range(args.chunks)
+    ]
+    ids = [f"c{i}" for i in range(args.chunks)]
+
+    t0 = time.perf_counter()
+    bm25 = BM25Index()
+    for start in range(0, len(ids), 1000):
+        bm25.add(ids[start:start + 1000], texts[start:start + 1000], ["doc"] * len(ids[start:start + 1000]))
+    build = time.perf_counter() - t0
+    dense = DenseIndex(model, ids, texts)
+
+    queries = [f"PN-{rnd.randrange(args.chunks):06d}" for _ in range(args.queries // 2)]
+    queries += [" ".join(rnd.choices(vocab, k=6)) for _ in range(args.queries - len(queries))]
+    print(f"latency on {args.chunks} synthetic chunks (BM25 build {build:.2f}s, {len(bm25.postings)} terms)")
+    for mode in ("vector", "bm25", "hybrid"):
+        timings = []
+        for q in queries:
+            t0 = time.perf_counter()
+            search(mode, dense, bm25, q, args.k, args.candidates)
+            timings.append((time.perf_counter() - t0) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        print(f"  {mode:<7} p50={statistics.median(timings):7.2f}ms  p95={p95:7.2f}ms")
+
+
+def main(args):
+    if args.real:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    else:
+        model = FakeEmbeddingModel()
+    recall(args, model)
+    latency(args, model)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=2)
+    parser.add_argument("--candidates", type=int, default=10)
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--real", action="store_true", help="use the real SentenceTransformer")
+    main(parser.parse_args())
@@ -0,0 +1,255 @@
+"""Compare vector stores: Chroma vs the built-in memory-mapped store, at several corpus sizes.
+
+For every size and engine, one subprocess builds the store (ingest rate,
+index build time, size on disk). A second, fresh subprocess opens it and
+runs the queries: open time, memory, single-query latency, and recall@k
+against exact search, both unfiltered and filtered to one document. For
+the built-in store it also reports batched search throughput. Memory is
+split into anonymous RSS (heap) and file-backed RSS (mapped pages the
+kernel can drop).
+
+Vectors are synthetic and clustered the way embeddings of a real corpus
+are: each document sits near one of a thousand topic centres, its chunks
+scatter around the document, and queries are noisy copies of stored
+chunks.
+
+    python benchmarks/vector_stores.py --sizes 10000 100000 1000000
+    python benchmarks/vector_stores.py --sizes 1000000 --engines local-float32-ivf local-int8-ivf
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import REPO_ROOT
+
+ENGINES = {
+    "chroma": {"engine": "chroma"},
+    "local-float32": {"engine": "local", "dtype": "float32", "index": "exact"},
+    "local-float32-ivf": {"engine": "local", "dtype": "float32", "index": "ivf"},
+    "local-float16-ivf": {"engine": "local", "dtype": "float16", "index": "ivf"},
+    "local-int8-ivf": {"engine": "local", "dtype": "int8", "index": "ivf"},
+}
+GEN_BATCH = 10000
+
+
+def generate(batch: int, args) -> np.ndarray:
+    """Vectors of chunks [batch * GEN_BATCH, (batch + 1) * GEN_BATCH); the same on every call."""
+    centres = np.random.default_rng(args.seed).normal(size=(args.topics, args.dim)).astype(np.float32)
+    rng = np.random.default_rng([args.seed, batch])
+    chunks = np.arange(batch * GEN_BATCH, min((batch + 1) * GEN_BATCH, args.chunks))
+    docs = chunks // args.doc_size
+    offsets = {int(doc): np.random.default_rng([args.seed, 1, int(doc)]).normal(scale=args.doc_spread, size=args.dim)
+               for doc in np.unique(docs)}
+    topic = (docs * 7919) % args.topics  # one topic per document
+    noise = rng.normal(scale=args.noise, size=(len(chunks), args.dim)).astype(np.float32)
+    return centres[topic] + np.stack([offsets[int(doc)] for doc in docs]).astype(np.float32) + noise
+
+
+def batches(args):
+    for batch in range((args.chunks + GEN_BATCH - 1) // GEN_BATCH):
+        yield batch * GEN_BATCH, generate(batch, args)
+
+
+def chunk_id(i: int, args) -> str:
+    return f"doc{i // args.doc_size}_{i}"
+
+
+def memory_mb() -> dict:
+    found = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                found[line.split(":")[0]] = round(int(line.split()[1]) / 1024, 1)
+    return {"anon": found.get("RssAnon", 0.0), "file": found.get("RssFile", 0.0)}
+
+
+def disk_mb(path: str) -> float:
+    total = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+    return round(total / 1024 / 1024, 1)
+
+
+def open_engine(config: dict, path: str, args):
+    sys.path.insert(0, REPO_ROOT)
+    from vector_store import open_store
+    return open_store(config["engine"], path, dtype=config.get("dtype", "float32"),
+                      index=config.get("index", "exact"), ann_probes=args.probes)
+
+
+def build(config: dict, path: str, args) -> dict:
+    store = open_engine({**config, "index": "exact"}, path, args)  # the IVF index is built once, below
+    t0 = time.perf_counter()
+    for start, vectors in batches(args):
+        for i in range(0, len(vectors), args.write_batch):
+            part = vectors[i:i + args.write_batch]
+            first = start + i
+            store.add(
+                [chunk_id(first + j, args) for j in range(len(part))],
+                [f"chunk {first + j}" for j in range(len(part))],
+                part,
+                [{"doc_id": chunk_id(first + j, args).split("_")[0], "chunk_hash": str(first + j)}
+                 for j in range(len(part))],
+            )
+    ingest = time.perf_counter() - t0
+    result = {"ingest_s": round(ingest, 2), "chunks_per_second": round(args.chunks / ingest)}
+    if config.get("index") == "ivf":
+        t0 = time.perf_counter()
+        store.build_index()
+        result["index_build_s"] = round(time.perf_counter() - t0, 2)
+    store.close()
+    result["disk_mb"] = disk_mb(path)
+    return result
+
+
+def percentiles(samples) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 2), "p95_ms": round(float(np.percentile(ms, 95)), 2)}
+
+
+def search(config: dict, path: str, args, queries_file: str) -> dict:
+    with np.load(queries_file) as data:
+        queries, targets, truth, doc_truth = data["queries"], data["targets"], data["truth"], data["doc_truth"]
+    before = memory_mb()
+    t0 = time.perf_counter()
+    store = open_engine(config, path, args)
+    result = {"open_s": round(time.perf_counter() - t0, 2)}
+
+    def run(doc_ids, expected):
+        latencies, recalls = [], []
+        for query, doc_id, want in zip(queries, doc_ids, expected):
+            t = time.perf_counter()
+            hits = store.query(query.tolist(), args.k, doc_id)
+            latencies.append(time.perf_counter() - t)
+            want = {chunk_id(int(i), args) for i in want}
+            recalls.append(len(want & {hit[0] for hit in hits}) / len(want))
+        return {**percentiles(latencies), "recall": round(float(np.mean(recalls)), 4)}
+
+    result["query"] = run([None] * len(queries), truth)
+    result["filtered"] = run([chunk_id(int(t), args).split("_")[0] for t in targets], doc_truth)
+    if config["engine"] == "local":
+        t0 = time.perf_counter()
+        for start in range(0, len(queries), 32):
+            store.search(queries[start:start + 32], args.k)
+        result["batched_queries_per_second"] = round(len(queries) / (time.perf_counter() - t0), 1)
+        result["index"] = store.stats()["index"]
+    after = memory_mb()
+    result["rss_mb"] = {"anon": round(after["anon"] - before["anon"], 1), "file": after["file"]}
+    return result
+
+
+def make_queries(args, queries_file: str):
+    """Noisy copies of random stored chunks, with exact top-k answers overall and within each chunk's document."""
+    rng = np.random.default_rng(args.seed + 1)
+    targets = np.sort(rng.choice(args.chunks, args.queries, replace=False))
+    rows = {}
+    for batch in sorted(set(targets // GEN_BATCH)):
+        vectors = generate(int(batch), args)
+        for t in targets[targets // GEN_BATCH == batch]:
+            rows[int(t)] = vectors[t - batch * GEN_BATCH]
+    queries = np.stack([rows[int(t)] for t in targets])
+    queries += rng.normal(scale=args.noise, size=queries.shape).astype(np.float32)
+    unit = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    doc_truth = [None] * len(queries)
+    for start, vectors in batches(args):
+        vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        scores = unit @ vectors.T
+        ids = np.broadcast_to(np.arange(start, start + len(vectors)), scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, ids], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :args.k]
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        best_ids = np.take_along_axis(best_ids, keep, axis=1)
+        for q, t in enumerate(targets):
+            first = t // args.doc_size * args.doc_size
+            if start <= first < start + len(vectors):
+                in_doc = np.arange(first, min(first + args.doc_size, args.chunks))
+                doc_scores = unit[q] @ vectors[in_doc - start].T
+                doc_truth[q] = in_doc[np.argsort(-doc_scores)[:args.k]]
+    doc_truth = np.stack([np.pad(d, (0, args.k - len(d)), constant_values=d[0]) for d in doc_truth])
+    np.savez(queries_file, queries=queries, targets=targets, truth=best_ids, doc_truth=doc_truth)
+
+
+def run_worker(role: str, name: str, path: str, args, queries_file: str = "") -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--role", role, "--engine-name", name, "--path", path,
+           "--queries-file", queries_file, "--chunks", str(args.chunks), "--dim", str(args.dim),
+           "--doc-size", str(args.doc_size), "--topics", str(args.topics), "--doc-spread", str(args.doc_spread),
+           "--noise", str(args.noise),
+           "--k", str(args.k), "--probes", str(args.probes), "--write-batch", str(args.write_batch),
+           "--seed", str(args.seed)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(args):
+    results = {"dim": args.dim, "k": args.k, "doc_size": args.doc_size, "sizes": {}}
+    for size in args.sizes:
+        args.chunks = size
+        with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+            queries_file = os.path.join(tmp, "queries.npz")
+            make_queries(args, queries_file)
+            results["sizes"][size] = {}
+            for name in args.engines:
+                path = os.path.join(tmp, name)
+                outcome = run_worker("build", name, path, args)
+                if "error" not in outcome:
+                    outcome.update(run_worker("search", name, path, args, queries_file))
+                results["sizes"][size][name] = outcome
+                shutil.rmtree(path, ignore_errors=True)
+                print(f"{size:>8} {name:<18} {json.dumps(outcome)}", flush=True)
+
+    print(f"\n{args.dim}-dim vectors, {args.doc_size} chunks per document, recall@{args.k} vs exact search")
+    print(f"{'chunks':>8} {'engine':<18} {'ingest/s':>9} {'build s':>8} {'disk MB':>8} {'open s':>7} "
+          f"{'anon MB':>8} {'p50 ms':>7} {'p95 ms':>7} {'recall':>7} {'doc p50':>8} {'doc rec':>8} {'batch q/s':>10}")
+    for size, engines in results["sizes"].items():
+        for name, r in engines.items():
+            if "error" in r:
+                print(f"{size:>8} {name:<18} error: {r['error']}")
+                continue
+            print(f"{size:>8} {name:<18} {r['chunks_per_second']:>9} {r.get('index_build_s', '-'):>8} "
+                  f"{r['disk_mb']:>8} {r['open_s']:>7} {r['rss_mb']['anon']:>8} {r['query']['p50_ms']:>7} "
+                  f"{r['query']['p95_ms']:>7} {r['query']['recall']:>7} {r['filtered']['p50_ms']:>8} "
+                  f"{r['filtered']['recall']:>8} {r.get('batched_queries_per_second', '-'):>10}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--engines", nargs="+", choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--doc-size", type=int, default=50, help="chunks per document")
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--doc-spread", type=float, default=0.5, help="per-dimension spread of documents in a topic")
+    parser.add_argument("--noise", type=float, default=0.5, help="per-dimension spread of chunks in a document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", type=int, default=32, help="IVF lists scanned per query")
+    parser.add_argument("--write-batch", type=int, default=64, help="chunks per add, like INGEST_BATCH_SIZE")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--workdir", help="where the stores are built (default: the temp dir)")
+    parser.add_argument("--output", help="write results as JSON here")
+    parser.add_argument("--role", choices=["build", "search"], help=argparse.SUPPRESS)
+    parser.add_argument("--engine-name", help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--queries-file", help=argparse.SUPPRESS)
+    parser.add_argument("--chunks", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.role == "build":
+        print(json.dumps(build(ENGINES[args.engine_name], args.path, args)))
+    elif args.role == "search":
+        print(json.dumps(search(ENGINES[args.engine_name], args.path, args, args.queries_file)))
+    else:
+        main(args)
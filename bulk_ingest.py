@@ -0,0 +1,107 @@
+"""Bulk-ingest a zip/tar archive or a directory of PDF/TXT files into the knowledge base.
+
+    python bulk_ingest.py docs.zip
+    python bulk_ingest.py ./reports                      # packed into a tar and uploaded
+    python bulk_ingest.py /data/reports --server-side    # read by the backend (see BULK_INGEST_ROOTS)
+
+Talks to the backend's /rag/ingest/bulk endpoint and prints one line per
+file as it finishes. Files that are already indexed are reported as
+duplicates, so running the same import again picks up where it stopped.
+"""
+import argparse
+import json
+import os
+import sys
+import tarfile
+import tempfile
+
+import httpx
+
+DOCUMENT_EXTENSIONS = (".pdf", ".txt")
+
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a streaming text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines():
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def pack_directory(directory: str) -> str:
+    """Tar the PDF/TXT files under `directory` into a temp file and return its path."""
+    fd, path = tempfile.mkstemp(suffix=".tar", prefix="zentro_bulk_")
+    os.close(fd)
+    with tarfile.open(path, "w") as tar:
+        for folder, dirs, files in os.walk(directory):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                if name.lower().endswith(DOCUMENT_EXTENSIONS) and not name.startswith("."):
+                    full = os.path.join(folder, name)
+                    tar.add(full, arcname=os.path.relpath(full, directory))
+    return path
+
+
+def run(args) -> int:
+    packed = None
+    data = {"concurrency": str(args.concurrency)} if args.concurrency else {}
+    try:
+        if args.server_side:
+            data["directory"] = args.path
+            files = None
+        else:
+            path = args.path
+            if os.path.isdir(path):
+                packed = path = pack_directory(path)
+            files = {"file": (os.path.basename(path), open(path, "rb"))}
+
+        results, summary = [], None
+        with httpx.Client(timeout=httpx.Timeout(30, read=None)) as client:
+            with client.stream("POST", f"{args.backend}/rag/ingest/bulk", data=data, files=files) as response:
+                response.raise_for_status()
+                for event, payload in iter_sse(response):
+                    if event == "start":
+                        print(f"Ingesting {payload['total']} documents from a {payload['source']} "
+                              f"({payload['concurrency']} at a time)", flush=True)
+                    elif event in ("result", "error"):
+                        results.append(payload)
+                        if "filename" not in payload:
+                            print(f"error: {payload['error']}", file=sys.stderr)
+                        elif event == "error":
+                            print(f"  failed     {payload['filename']}: {payload['error']}", flush=True)
+                        else:
+                            print(f"  {payload['status']:<10} {payload['filename']} "
+                                  f"({payload.get('num_chunks', 0)} chunks)", flush=True)
+                    elif event == "done":
+                        summary = payload
+        if files:
+            files["file"][1].close()
+    finally:
+        if packed:
+            os.unlink(packed)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "files": results}, f, indent=2)
+    if summary is None:
+        return 1
+    print(f"{summary['indexed']} indexed, {summary['duplicate']} already indexed, {summary['failed']} failed, "
+          f"{summary['chunks']} chunks in {summary['total_ms'] / 1000:.1f} s ({summary['files_per_second']} files/s)")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="zip/tar archive or directory")
+    parser.add_argument("--backend", default=os.getenv("BACKEND_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--server-side", action="store_true",
+                        help="path is a directory on the backend host instead of a local file")
+    parser.add_argument("--concurrency", type=int, help="files in flight (capped by BULK_INGEST_CONCURRENCY)")
+    parser.add_argument("--output", help="write per-file results as JSON here")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,125 @@
+"""Map-reduce analysis of documents that don't fit in a single prompt.
+
+The document is split into sections that are summarized in parallel (map),
+then the section notes are merged in groups that fit the token budget, level
+by level, until one prompt can hold them all (reduce). Every LLM result is
+cached by a hash of its prompt, so asking again about the same file only pays
+for the parts that changed.
+"""
+import asyncio
+import time
+from typing import Callable, List, Optional
+
+from prompt_builder import MESSAGE_OVERHEAD, PromptBuilder, fit_text
+from result_cache import ResultCache, cache_key
+
+MAP_PROMPT = (
+    "You are an AI assistant reading one part of a longer document.\n\n"
+    "USER INSTRUCTION:\n{instruction}\n\n"
+    "Write concise notes on everything in this part that is relevant to the instruction: "
+    "key points, entities, dates and figures. Do not invent anything.\n\n"
+    "DOCUMENT PART:\n"
+)
+REDUCE_PROMPT = (
+    "You are an AI assistant combining notes taken on consecutive parts of a document.\n\n"
+    "USER INSTRUCTION:\n{instruction}\n\n"
+    "Merge the notes below into one set of concise notes, keeping every detail relevant "
+    "to the instruction and removing repetition.\n\n"
+    "NOTES:\n"
+)
+FINAL_PROMPT = (
+    "You are an AI assistant analyzing a document. It was too long to read at once, so "
+    "below are notes taken on each part of it, in order.\n\n"
+    "USER INSTRUCTION:\n{instruction}\n\n"
+    "NOTES:\n"
+)
+NOTE_SEPARATOR = "\n\n"
+
+
+class MapReduceAnalyzer:
+    def __init__(
+        self,
+        chat: Callable,
+        prompts: PromptBuilder,
+        split: Callable[[str], List[str]],
+        cache: ResultCache,
+        concurrency: int = 4,
+    ):
+        self.chat = chat
+        self.prompts = prompts
+        self.split = split
+        self.cache = cache
+        self.concurrency = concurrency
+
+    def _groups(self, notes: List[str], budget: int) -> List[List[str]]:
+        """Consecutive runs of notes that fit in `budget` tokens; every group merges at least two."""
+        count = self.prompts.counter.count
+        groups, current, used = [], [], 0
+        for note in notes:
+            cost = count(note) + count(NOTE_SEPARATOR)
+            if len(current) >= 2 and used + cost > budget:
+                groups.append(current)
+                current, used = [], 0
+            current.append(note)
+            used += cost
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        return groups
+
+    async def run(self, model_name: Optional[str], instruction: str, text: str, on_progress=None):
+        """Map and reduce `text`. Returns (final_messages, stats); the caller makes the final call."""
+        start = time.perf_counter()
+        count = self.prompts.counter.count
+        budget = self.prompts.budget_for(model_name)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        stats = {"sections": 0, "cached": 0, "llm_calls": 0, "reduce_levels": 0}
+
+        async def complete(head: str, body: str) -> str:
+            body, _ = fit_text(body, max(0, budget - count(head) - MESSAGE_OVERHEAD), count)
+            key = cache_key(model_name or "", head, body)
+            cached = self.cache.get(key)
+            if cached is not None:
+                stats["cached"] += 1
+                return cached
+            async with semaphore:
+                result = await self.chat([{"role": "user", "content": head + body}], model_name=model_name)
+            stats["llm_calls"] += 1
+            self.cache.put(key, result)
+            return result
+
+        def report(stage: str, done: int, total: int):
+            if on_progress:
+                on_progress({"stage": stage, "done": done, "total": total})
+
+        async def run_stage(stage: str, head: str, bodies: List[str]) -> List[str]:
+            done = 0
+
+            async def one(body):
+                nonlocal done
+                result = await complete(head, body)
+                done += 1
+                report(stage, done, len(bodies))
+                return result
+
+            return await asyncio.gather(*(one(body) for body in bodies))
+
+        sections = self.split(text)
+        stats["sections"] = len(sections)
+        notes = await run_stage("map", MAP_PROMPT.format(instruction=instruction), sections)
+
+        final_head = FINAL_PROMPT.format(instruction=instruction)
+        reduce_head = REDUCE_PROMPT.format(instruction=instruction)
+        final_room = budget - count(final_head) - MESSAGE_OVERHEAD
+        while len(notes) > 1 and count(NOTE_SEPARATOR.join(notes)) > final_room:
+            stats["reduce_levels"] += 1
+            groups = self._groups(notes, budget - count(reduce_head) - MESSAGE_OVERHEAD)
+            notes = await run_stage(
+                f"reduce-{stats['reduce_levels']}", reduce_head, [NOTE_SEPARATOR.join(g) for g in groups]
+            )
+
+        body, _ = fit_text(NOTE_SEPARATOR.join(notes), max(0, final_room), count)
+        stats["prompt_tokens"] = count(final_head + body) + MESSAGE_OVERHEAD
+        stats["map_reduce_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return [{"role": "user", "content": final_head + body}], stats
@@ -0,0 +1,125 @@
+"""Persistent embedding cache in SQLite.
+
+Vectors are keyed by (model name, chunk hash) and stored as raw float32
+blobs. The cache lives outside the Chroma collection, so it survives
+`/rag/clear` and restarts: re-indexing a known corpus only costs extraction
+plus lookups. Least-recently-used entries are evicted once the stored
+vectors exceed `max_bytes`.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = path
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (model, hash))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings (last_used)")
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        wanted = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(wanted), _MAX_PARAMS):
+                part = wanted[start:start + _MAX_PARAMS]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({marks})",
+                    [self.model_name, *part],
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._touch([h for h, _ in rows])
+            self._db.commit()
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found
+
+    def _touch(self, hashes: List[str]):
+        marks = ",".join("?" * len(hashes))
+        self._db.execute(
+            f"UPDATE embeddings SET last_used = ? WHERE model = ? AND hash IN ({marks})",
+            [time.time(), self.model_name, *hashes],
+        )
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        now = time.time()
+        rows = [
+            (self.model_name, h, np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for h, vec in vectors.items()
+        ]
+        with self._lock:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            # All vectors from one model have the same size
+            self._bytes += (self._db.total_changes - before) * len(rows[0][2])
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        # Evict down to 90% so we don't evict again on the very next insert
+        target = int(self.max_bytes * 0.9)
+        victims = []
+        cursor = self._db.execute("SELECT model, hash, LENGTH(vector) FROM embeddings ORDER BY last_used")
+        for model, h, size in cursor:
+            if self._bytes <= target:
+                break
+            victims.append((model, h))
+            self._bytes -= size
+        cursor.close()
+        self._db.executemany("DELETE FROM embeddings WHERE model = ? AND hash = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "entries": entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
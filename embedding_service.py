@@ -0,0 +1,158 @@
+"""Embedding service: coalesces concurrent encode requests into shared batches.
+
+A transformer forward pass over 32 sentences costs little more than one over a
+single sentence, so instead of every request calling `model.encode` on its own,
+callers enqueue their texts and a background task flushes them together once
+`max_batch_size` texts are waiting or `max_wait_ms` has passed.
+"""
+import asyncio
+import contextvars
+from typing import Callable, List, Optional, Set
+
+SHUTTING_DOWN = "Embedding service is shutting down"
+
+class _Request:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str], future: asyncio.Future):
+        self.texts = texts
+        self.future = future
+
+
+class EmbeddingBatcher:
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], List[List[float]]],
+        executor,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+        max_concurrent_batches: int = 1,
+    ):
+        self.encode_fn = encode_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self.stats = {"requests": 0, "texts": 0, "batches": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self._carry: Optional[_Request] = None
+        self._flushes: Set[asyncio.Task] = set()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._carry = None
+            # Not the calling request's context: batches serve every request, not just the first one
+            self._worker = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def encode(self, texts: List[str]) -> List[List[float]]:
+        """Embed `texts`, sharing the forward pass with any concurrent callers."""
+        if not texts:
+            return []
+        self._ensure_worker()
+        self.stats["requests"] += 1
+        self.stats["texts"] += len(texts)
+
+        # Large inputs are split so one upload can't monopolise a batch
+        futures = []
+        for start in range(0, len(texts), self.max_batch_size):
+            future = self._loop.create_future()
+            self._queue.put_nowait(_Request(texts[start:start + self.max_batch_size], future))
+            futures.append(future)
+
+        vectors: List[List[float]] = []
+        for part in await asyncio.gather(*futures):
+            vectors.extend(part)
+        return vectors
+
+    async def close(self):
+        """Stop batching: batches already at the model finish, requests still waiting fail."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, RuntimeError):
+                pass
+            self._worker = None
+        # An encode running on the executor can't be interrupted, so let it deliver its vectors
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+        waiting = [self._carry] if self._carry is not None else []
+        self._carry = None
+        while self._queue is not None and not self._queue.empty():
+            waiting.append(self._queue.get_nowait())
+        self._fail(waiting, RuntimeError(SHUTTING_DOWN))
+
+    @staticmethod
+    def _fail(requests: List[_Request], error: Exception):
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+    async def _next_request(self, timeout: Optional[float] = None) -> _Request:
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        if timeout is None:
+            return await self._queue.get()
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch: List[_Request] = []
+        try:
+            while True:
+                batch = [await self._next_request()]
+                size = len(batch[0].texts)
+                deadline = loop.time() + self.max_wait
+
+                while size < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = await self._next_request(remaining)
+                    except asyncio.TimeoutError:
+                        break
+                    if size + len(request.texts) > self.max_batch_size:
+                        self._carry = request
+                        break
+                    batch.append(request)
+                    size += len(request.texts)
+
+                await self._slots.acquire()
+                flush = loop.create_task(self._flush(batch))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+                batch = []
+        except asyncio.CancelledError:
+            # Closed while collecting a batch that never reached the model
+            self._fail(batch, RuntimeError(SHUTTING_DOWN))
+            raise
+
+    async def _flush(self, batch: List[_Request]):
+        loop = asyncio.get_running_loop()
+        texts = [text for request in batch for text in request.texts]
+        try:
+            vectors = await loop.run_in_executor(self.executor, self.encode_fn, texts)
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError(SHUTTING_DOWN))
+            raise
+        except Exception as e:
+            self._fail(batch, e)
+            return
+        finally:
+            self._slots.release()
+
+        self.stats["batches"] += 1
+        offset = 0
+        for request in batch:
+            part = vectors[offset:offset + len(request.texts)]
+            offset += len(request.texts)
+            if not request.future.done():
+                request.future.set_result(part)
@@ -0,0 +1,74 @@
+"""Shrinks uploaded images to what the vision model can actually use before they are base64-encoded.
+
+Qwen-VL cuts images into 28x28 patches and caps the patch count, so pixels
+beyond that budget only add upload size and preprocessing time. Images are
+rotated per their EXIF orientation, scaled down to `max_pixels`, and
+re-encoded without metadata as JPEG, or as PNG when that is smaller (flat
+screenshots, diagrams).
+"""
+import io
+import math
+from typing import Tuple
+
+from PIL import Image, ImageOps
+
+# Qwen2/3-VL default max_pixels: 1280 patches of 28x28
+DEFAULT_MAX_PIXELS = 1280 * 28 * 28
+_LOSSLESS_FORMATS = {"PNG", "GIF", "BMP", "TIFF"}
+_METADATA_KEYS = ("exif", "xmp", "icc_profile", "comment")
+
+
+def _encode(image: Image.Image, fmt: str, quality: int) -> bytes:
+    out = io.BytesIO()
+    if fmt == "JPEG":
+        image.save(out, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def preprocess_image(file_bytes: bytes, max_pixels: int = DEFAULT_MAX_PIXELS, quality: int = 85) -> Tuple[bytes, str, dict]:
+    """Returns (image_bytes, mime_type, info).
+
+    The original bytes are kept when they are already small enough, carry no
+    metadata and re-encoding wouldn't make them smaller. Raises if Pillow
+    can't decode the image; callers fall back to sending it unchanged.
+    """
+    with Image.open(io.BytesIO(file_bytes)) as source:
+        source_format = source.format
+        has_metadata = any(key in source.info for key in _METADATA_KEYS)
+        image = ImageOps.exif_transpose(source)
+        original_size = image.size
+        resized = False
+
+        w, h = image.size
+        if w * h > max_pixels:
+            scale = math.sqrt(max_pixels / (w * h))
+            image = image.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+            resized = True
+
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            # JPEG has no alpha; flatten onto white like most viewers would show it
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        candidates = [(_encode(image, "JPEG", quality), "image/jpeg")]
+        if source_format in _LOSSLESS_FORMATS:
+            candidates.append((_encode(image, "PNG", quality), "image/png"))
+        data, mime_type = min(candidates, key=lambda c: len(c[0]))
+
+    if not resized and not has_metadata and len(file_bytes) <= len(data) and source_format in ("JPEG", "PNG"):
+        data, mime_type = file_bytes, f"image/{source_format.lower()}"
+
+    info = {
+        "original_bytes": len(file_bytes),
+        "sent_bytes": len(data),
+        "bytes_saved": len(file_bytes) - len(data),
+        "original_size": list(original_size),
+        "sent_size": list(image.size),
+        "mime_type": mime_type,
+    }
+    return data, mime_type, info
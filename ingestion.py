@@ -0,0 +1,365 @@
+"""Streaming document ingestion: pages -> chunks -> embedding batches -> vector store.
+
+Nothing here holds a whole document. Pages are pulled from the extractor a few
+at a time, paragraphs are packed into chunks as they arrive, and chunks are
+embedded and written in fixed-size batches, so peak memory is bounded by the
+batch size rather than the document size.
+"""
+import asyncio
+import contextlib
+import hashlib
+import io
+import itertools
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+Page = Tuple[int, str]      # (page number, page text)
+Chunk = Tuple[int, str]     # (page the chunk starts on, chunk text)
+
+# TXT files are read in "pages" of about this many characters, cut at a blank line where possible
+TXT_PAGE_CHARS = 64 * 1024
+
+
+def file_hash(file_bytes: bytes) -> str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_hash(text: str) -> str:
+    """Hash of the whitespace-normalized chunk text."""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+def iter_pdf_pages(doc) -> Iterator[Page]:
+    for page_no, page in enumerate(doc):
+        yield page_no, page.get_text()
+
+
+def iter_text_pages(source: Union[bytes, str], page_chars: int = TXT_PAGE_CHARS) -> Iterator[Page]:
+    """Decode a TXT (bytes or a path) a block at a time, as pages cut at paragraph breaks.
+
+    Each cut keeps the paragraph separator at the start of the next page, so
+    joining the pages gives back the whole text. A file with no text is one
+    empty page.
+    """
+    raw = open(source, "rb") if isinstance(source, str) else io.BytesIO(source)
+    page_no, buffer = 0, ""
+    with io.TextIOWrapper(raw, encoding="utf-8", errors="ignore", newline="") as f:
+        for block in iter(lambda: f.read(page_chars), ""):
+            buffer += block
+            while len(buffer) > page_chars:
+                cut = buffer.rfind("\n\n", 0, page_chars)
+                if cut <= 0:
+                    cut = buffer.rfind("\n", 0, page_chars)
+                if cut <= 0:
+                    cut = page_chars
+                yield page_no, buffer[:cut]
+                page_no, buffer = page_no + 1, buffer[cut:]
+    if buffer or page_no == 0:
+        yield page_no, buffer
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    """Process-pool task: text of pages [start, stop) of the PDF at `path`."""
+    import fitz  # PyMuPDF
+    doc = fitz.open(path)
+    try:
+        return [doc[i].get_text() for i in range(start, stop)]
+    finally:
+        doc.close()
+
+
+class ParallelPdfPages:
+    """Extract page ranges on a process pool and yield pages in order.
+
+    Workers open the file by path, so the PDF bytes are never pickled. At
+    most two ranges per worker are in flight, which keeps memory bounded
+    while every worker stays busy. Iterate with `for` from a thread, or with
+    `async for` on the event loop, which awaits the workers instead of
+    holding a thread for the whole extraction.
+    """
+
+    def __init__(self, path: str, page_count: int, executor, workers: int, pages_per_task: int = 16,
+                 delete: bool = False):
+        self.path = path
+        self.page_count = page_count
+        self.executor = executor
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.delete = delete
+
+    def _ranges(self) -> Iterator[Tuple[int, Future]]:
+        """(first page, future) per range in page order; the next range is submitted as the caller moves on."""
+        ranges = iter([(start, min(start + self.pages_per_task, self.page_count))
+                       for start in range(0, self.page_count, self.pages_per_task)])
+        pending = deque()
+
+        def submit_next():
+            r = next(ranges, None)
+            if r is not None:
+                pending.append((r[0], self.executor.submit(extract_page_range, self.path, *r)))
+
+        try:
+            for _ in range(max(1, self.workers) * 2):
+                submit_next()
+            while pending:
+                yield pending.popleft()
+                submit_next()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if self.delete:
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+
+    def __iter__(self) -> Iterator[Page]:
+        with contextlib.closing(self._ranges()) as ranges:
+            for start, future in ranges:
+                for offset, text in enumerate(future.result()):
+                    yield start + offset, text
+
+    async def __aiter__(self) -> AsyncIterator[Page]:
+        with contextlib.closing(self._ranges()) as ranges:
+            for start, future in ranges:
+                for offset, text in enumerate(await asyncio.wrap_future(future)):
+                    yield start + offset, text
+
+
+def open_pages(
+    source: Union[bytes, str],
+    name: str,
+    executor=None,
+    workers: int = 0,
+    parallel_min_pages: int = 64,
+) -> Optional[Tuple[int, Iterator[Page]]]:
+    """Returns (page_count, page iterator), or None for unsupported types.
+
+    `source` is the file's bytes or a path to it. PDFs opened from a path are
+    read by MuPDF on demand rather than copied into memory, and TXT files are
+    decoded a page at a time (see `iter_text_pages`). PDFs with at least
+    `parallel_min_pages` pages are extracted on `executor` (a process pool)
+    when one is given.
+    """
+    from_path = isinstance(source, str)
+    if name.endswith(".txt"):
+        # One cheap pass to count the pages, so progress can report a total
+        page_count = sum(1 for _ in iter_text_pages(source))
+        return page_count, iter_text_pages(source)
+    if name.endswith(".pdf"):
+        # PyMuPDF is imported on the first PDF rather than at server startup
+        import fitz
+        doc = fitz.open(source) if from_path else fitz.open(stream=source, filetype="pdf")
+        page_count = doc.page_count
+        if executor is None or workers < 2 or page_count < parallel_min_pages:
+            return page_count, iter_pdf_pages(doc)
+        doc.close()
+        pages_per_task = max(4, min(64, page_count // (workers * 4) or 1))
+        if from_path:
+            return page_count, ParallelPdfPages(source, page_count, executor, workers, pages_per_task)
+        # Workers share one temp file instead of each receiving a copy of the bytes
+        fd, path = tempfile.mkstemp(suffix=".pdf", prefix="zentro_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(source)
+        return page_count, ParallelPdfPages(path, page_count, executor, workers, pages_per_task, delete=True)
+    return None
+
+
+class ChunkPacker:
+    """Incremental version of the paragraph packer used by `chunk_text`.
+
+    Pages are concatenated exactly like the old whole-document extraction, so
+    a paragraph that runs across a page break is still one paragraph. Chunks
+    never exceed `max_chars`.
+    """
+
+    def __init__(self, max_chars: int = 800):
+        self.max_chars = max_chars
+        self.current = ""
+        self.current_page = 0
+        self.tail = ""          # last paragraph seen, may continue on the next page
+        self.tail_page = 0
+
+    def _cut(self, para: str) -> Tuple[str, str]:
+        """Split an oversized paragraph, preferring a line or word break."""
+        window = para[:self.max_chars]
+        cut = max(window.rfind("\n"), window.rfind(" "))
+        if cut < self.max_chars // 2:
+            cut = self.max_chars
+        return para[:cut], para[cut:]
+
+    def _add(self, page_no: int, para: str) -> List[Chunk]:
+        out = []
+        # A paragraph with no blank lines can be arbitrarily long (many PDFs
+        # have none at all), so cap it instead of emitting a giant chunk.
+        while len(para) > self.max_chars:
+            head, para = self._cut(para)
+            out.extend(self._add(page_no, head))
+        if len(self.current) + len(para) + 2 <= self.max_chars:
+            if not self.current:
+                self.current_page = page_no
+            self.current += ("\n\n" + para) if self.current else para
+            return out
+        if self.current:
+            out.append((self.current_page, self.current))
+        self.current, self.current_page = para, page_no
+        return out
+
+    def feed(self, page_no: int, text: str) -> List[Chunk]:
+        if not self.tail:
+            self.tail_page = page_no
+        paragraphs = (self.tail + text).split("\n\n")
+        self.tail = paragraphs.pop()
+        out = []
+        for i, para in enumerate(paragraphs):
+            out.extend(self._add(self.tail_page if i == 0 else page_no, para))
+        if paragraphs:
+            self.tail_page = page_no
+        # Keep the carried-over paragraph bounded too
+        while len(self.tail) > self.max_chars:
+            head, self.tail = self._cut(self.tail)
+            out.extend(self._add(self.tail_page, head))
+            self.tail_page = page_no
+        return out
+
+    def finish(self) -> List[Chunk]:
+        out = self._add(self.tail_page, self.tail)
+        if self.current:
+            out.append((self.current_page, self.current))
+        self.current = self.tail = ""
+        return out
+
+
+def iter_chunks(pages: Iterable[Page], max_chars: int = 800) -> Iterator[Chunk]:
+    packer = ChunkPacker(max_chars)
+    for page_no, text in pages:
+        yield from packer.feed(page_no, text)
+    yield from packer.finish()
+
+
+async def aiter_in_pool(executor, iterator: Iterator, step: int = 8) -> AsyncIterator:
+    """Drain a blocking iterator on `executor`, `step` items per hop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items = await loop.run_in_executor(executor, lambda: list(itertools.islice(iterator, step)))
+        if not items:
+            return
+        for item in items:
+            yield item
+
+
+async def aiter_pages(executor, pages: Iterable[Page], step: int = 8) -> AsyncIterator[Page]:
+    """Pages from `open_pages` on the event loop: parallel PDF extraction is awaited, other pages are read on `executor`."""
+    if isinstance(pages, ParallelPdfPages):
+        async with contextlib.aclosing(pages.__aiter__()) as parallel:
+            async for page in parallel:
+                yield page
+    else:
+        async for page in aiter_in_pool(executor, pages, step):
+            yield page
+
+
+async def ingest_pages(
+    pages: AsyncIterator[Page],
+    total_pages: int,
+    embed: Optional[Callable[[List[str]], Awaitable[List[List[float]]]]],
+    write: Callable[[int, List[Chunk], Optional[List[List[float]]]], Awaitable[None]],
+    batch_size: int = 64,
+    max_chars: int = 800,
+    on_progress: Optional[Callable[[dict], None]] = None,
+    max_pending_batches: int = 2,
+    page_aligned: bool = False,
+) -> dict:
+    """Chunk, embed and write a stream of pages.
+
+    Extraction runs ahead of embedding by at most `max_pending_batches`
+    batches. `write(first_index, chunks, vectors)` persists one batch; with
+    `embed=None` it receives `vectors=None` and embeds what it needs itself.
+    `on_progress(stats)` is called after every page and every written batch.
+    `stats["page_hashes"]` lists the content hash of every page in order;
+    `extract_seconds` and `chunk_seconds` total the time spent waiting for
+    pages and splitting them.
+
+    With `page_aligned=True` no chunk spans a page break, so editing one page
+    only changes that page's chunks instead of shifting every chunk after it.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, max_pending_batches))
+    stats = {
+        "total_pages": total_pages,
+        "pages_done": 0,
+        "chunks_queued": 0,
+        "chunks_written": 0,
+        "preview": "",
+        "page_hashes": [],
+        "extract_seconds": 0.0,
+        "chunk_seconds": 0.0,
+    }
+
+    def report():
+        if on_progress:
+            on_progress(stats)
+
+    async def produce():
+        try:
+            packer = ChunkPacker(max_chars)
+            batch: List[Chunk] = []
+
+            async def push(chunks):
+                nonlocal batch
+                for chunk in chunks:
+                    if not chunk[1].strip():
+                        continue
+                    batch.append(chunk)
+                    stats["chunks_queued"] += 1
+                    if len(batch) >= batch_size:
+                        await queue.put(batch)
+                        batch = []
+
+            waited_from = time.perf_counter()
+            async for page_no, text in pages:
+                started = time.perf_counter()
+                stats["extract_seconds"] += started - waited_from
+                stats["page_hashes"].append(page_hash(text))
+                if len(stats["preview"]) < 1000:
+                    stats["preview"] = (stats["preview"] + text)[:1000]
+                chunks = packer.feed(page_no, text)
+                if page_aligned:
+                    chunks += packer.finish()
+                stats["chunk_seconds"] += time.perf_counter() - started
+                await push(chunks)
+                stats["pages_done"] += 1
+                report()
+                waited_from = time.perf_counter()
+            await push(packer.finish())
+            if batch:
+                await queue.put(batch)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            vectors = await embed([text for _, text in batch]) if embed else None
+            await write(stats["chunks_written"], batch, vectors)
+            stats["chunks_written"] += len(batch)
+            report()
+    finally:
+        if not producer.done():
+            producer.cancel()
+    await producer
+    return stats
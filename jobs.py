@@ -0,0 +1,238 @@
+"""Background ingestion jobs.
+
+Uploads and re-indexes are queued and processed by a fixed number of worker
+tasks, so the HTTP request returns immediately and clients poll the job for
+progress. Each job `kind` maps to its own handler coroutine. Jobs for the
+same document run one at a time, in the order they were submitted, so a
+re-index never interleaves with another re-index or a delete of that document.
+
+When the queue lives in the vector service, HTTP workers use
+`RemoteJobQueue`, which has the same interface and hands out job snapshots.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+class Job:
+    def __init__(self, filename: str, payload: dict, kind: str = "ingest"):
+        self.id = str(uuid.uuid4())
+        self.filename = filename
+        self.kind = kind
+        self.payload = payload
+        self.stage = "queued"
+        self.error: Optional[str] = None
+        self.doc_id: Optional[str] = None
+        self.result: Optional[dict] = None
+        self.total_pages = 0
+        self.pages_done = 0
+        self.chunks_written = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.stage in ("done", "failed")
+
+    def update(self, stats: dict):
+        """Progress callback for `ingestion.ingest_pages`."""
+        self.total_pages = stats["total_pages"]
+        self.pages_done = stats["pages_done"]
+        self.chunks_written = stats["chunks_written"]
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "file_name": self.filename,
+            "stage": self.stage,
+            "doc_id": self.doc_id,
+            "total_pages": self.total_pages,
+            "pages_done": self.pages_done,
+            "chunks_written": self.chunks_written,
+            "elapsed_s": round(elapsed, 3),
+            "chunks_per_second": round(self.chunks_written / elapsed, 1) if elapsed else 0.0,
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        handlers: Dict[str, Callable[[Job], Awaitable[dict]]],
+        concurrency: int = 2,
+        max_finished: int = 500,
+    ):
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.max_finished = max_finished
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_key: Dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._loop = None
+        self._last_turn: Dict[str, asyncio.Future] = {}  # doc_id -> done future of its latest job
+        self._turns: Dict[str, Tuple[Optional[asyncio.Future], asyncio.Future]] = {}  # job id -> (previous, own)
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or not self._workers:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # A fresh context, so jobs don't add their stage timings to the request that started the workers
+            self._workers = [loop.create_task(self._run(), context=contextvars.Context())
+                             for _ in range(self.concurrency)]
+
+    def _create(self, filename: str, kind: str, doc_id: Optional[str], payload: dict) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = Job(filename, payload, kind)
+        job.doc_id = doc_id
+        if doc_id is not None:
+            # Take a turn now, so jobs for one document run in the order they were submitted
+            done = asyncio.get_running_loop().create_future()
+            self._turns[job.id] = (self._last_turn.get(doc_id), done)
+            self._last_turn[doc_id] = done
+        self.jobs[job.id] = job
+        self._prune()
+        return job
+
+    def submit(self, filename: str, kind: str = "ingest", doc_id: Optional[str] = None, **payload) -> Job:
+        self._ensure_workers()
+        job = self._create(filename, kind, doc_id, payload)
+        self._queue.put_nowait(job)
+        return job
+
+    async def run(self, filename: str, kind: str, doc_id: Optional[str] = None, **payload) -> Job:
+        """Run a job on the caller's task instead of a worker (still after earlier jobs for its document)."""
+        job = self._create(filename, kind, doc_id, payload)
+        await self._execute(job)
+        return job
+
+    def submit_once(self, key: str, filename: str, kind: str = "ingest", doc_id: Optional[str] = None,
+                    **payload) -> Tuple[Job, bool]:
+        """Submit unless an unfinished job with the same `key` exists; returns (job, submitted)."""
+        job = self._by_key.get(key)
+        if job is not None and not job.finished:
+            return job, False
+        job = self.submit(filename, kind, doc_id, **payload)
+        self._by_key = {k: j for k, j in self._by_key.items() if not j.finished}
+        self._by_key[key] = job
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(reversed(self.jobs.values()))
+
+    async def wait(self, job: Job, poll: float = 0.05) -> Job:
+        while not job.finished:
+            await asyncio.sleep(poll)
+        return job
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    @contextlib.asynccontextmanager
+    async def _document_turn(self, job: Job):
+        """Wait until earlier jobs for the job's document have finished, and hold the turn while it runs."""
+        previous, done = self._turns.pop(job.id, (None, None))
+        if done is None:
+            yield
+            return
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            yield
+        finally:
+            if previous is not None and not previous.done():
+                # Cancelled while waiting: the next job still waits for the earlier ones
+                previous.add_done_callback(lambda _: done.set_result(None))
+            else:
+                done.set_result(None)
+                if self._last_turn.get(job.doc_id) is done:
+                    del self._last_turn[job.doc_id]
+
+    async def _execute(self, job: Job):
+        try:
+            async with self._document_turn(job):
+                job.stage = "starting"
+                job.started_at = time.time()
+                job.result = await self.handlers[job.kind](job)
+                job.stage = "done"
+        except asyncio.CancelledError:
+            job.stage, job.error = "failed", "Cancelled"
+            raise
+        except Exception as e:
+            print(f"Ingestion job {job.id} ({job.filename}) failed: {e}", flush=True)
+            job.stage, job.error = "failed", str(e)
+        finally:
+            job.finished_at = time.time()
+            # Drop the upload once the job no longer needs it
+            job.payload = {}
+
+    async def _run(self):
+        while True:
+            await self._execute(await self._queue.get())
+
+
+class RemoteJobQueue:
+    """`JobQueue` interface for a queue in another process.
+
+    `queue` is a blocking proxy for the real queue. Jobs come back as copies;
+    `wait` polls until the job has finished and updates the copy in place.
+    """
+
+    def __init__(self, queue, executor=None):
+        self.queue = queue
+        self.executor = executor
+
+    def submit(self, filename: str, kind: str = "ingest", doc_id: Optional[str] = None, **payload) -> Job:
+        return self.queue.submit(filename, kind, doc_id, **payload)
+
+    def submit_once(self, key: str, filename: str, kind: str = "ingest", doc_id: Optional[str] = None,
+                    **payload) -> Tuple[Job, bool]:
+        return self.queue.submit_once(key, filename, kind, doc_id, **payload)
+
+    async def run(self, filename: str, kind: str, doc_id: Optional[str] = None, **payload) -> Job:
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.queue.run, filename, kind, doc_id, **payload)
+        return await loop.run_in_executor(self.executor, call)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.queue.get(job_id)
+
+    def list(self) -> List[Job]:
+        return self.queue.list()
+
+    async def wait(self, job: Job, poll: float = 0.1) -> Job:
+        loop = asyncio.get_running_loop()
+        while not job.finished:
+            await asyncio.sleep(poll)
+            latest = await loop.run_in_executor(self.executor, self.queue.get, job.id)
+            if latest is None:
+                job.stage, job.error = "failed", "Job is no longer known to the vector service"
+            else:
+                job.__dict__.update(latest.__dict__)
+        return job
+
+    async def close(self):
+        pass
@@ -0,0 +1,219 @@
+"""In-process BM25 inverted index over the stored chunks.
+
+Dense retrieval is weak on exact identifiers (part numbers, clause IDs, error
+codes), so chunks are also indexed lexically. Postings are kept in compact
+`array` columns, deletions are tombstoned and compacted lazily, and the whole
+index is pickled to disk so restarts don't have to rebuild it.
+"""
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+from array import array
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Words plus identifier-like runs such as "ID-00042-07", "E1234" or "3.2.1"
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./:][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./:]")
+
+_FORMAT_VERSION = 1
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        # Also index the parts, so "ID-00042" matches a query for "00042"
+        if not token.isalnum():
+            tokens.extend(part for part in _SPLIT_RE.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.dirty = False
+        self._reset()
+        if path and os.path.exists(path):
+            self._load()
+
+    def _reset(self):
+        self.chunk_ids: List[str] = []              # internal number -> chunk id
+        self.chunk_numbers: Dict[str, int] = {}     # chunk id -> internal number
+        self.doc_lengths = array("I")
+        self.chunk_docs = array("I")                # internal number -> document number
+        self.doc_ids: List[str] = []                # document number -> doc_id
+        self.doc_numbers: Dict[str, int] = {}
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (chunk numbers, term freqs)
+        self.deleted = set()
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids) - len(self.deleted)
+
+    def add(self, chunk_ids: Iterable[str], texts: Iterable[str], doc_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id, text, doc_id in zip(chunk_ids, texts, doc_ids):
+                if chunk_id in self.chunk_numbers:
+                    self._remove_number(self.chunk_numbers[chunk_id])
+                number = len(self.chunk_ids)
+                self.chunk_ids.append(chunk_id)
+                self.chunk_numbers[chunk_id] = number
+                if doc_id not in self.doc_numbers:
+                    self.doc_numbers[doc_id] = len(self.doc_ids)
+                    self.doc_ids.append(doc_id)
+                self.chunk_docs.append(self.doc_numbers[doc_id])
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self.doc_lengths.append(length)
+                self.total_length += length
+                for term, tf in counts.items():
+                    entry = self.postings.get(term)
+                    if entry is None:
+                        entry = self.postings[term] = (array("I"), array("H"))
+                    entry[0].append(number)
+                    entry[1].append(min(tf, 65535))
+            self.dirty = True
+
+    def _remove_number(self, number: int):
+        if number in self.deleted:
+            return
+        self.deleted.add(number)
+        self.total_length -= self.doc_lengths[number]
+        del self.chunk_numbers[self.chunk_ids[number]]
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                number = self.chunk_numbers.get(chunk_id)
+                if number is not None:
+                    self._remove_number(number)
+            self._maybe_compact()
+            self.dirty = True
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            doc_number = self.doc_numbers.get(doc_id)
+            if doc_number is None:
+                return
+            for number, owner in enumerate(self.chunk_docs):
+                if owner == doc_number:
+                    self._remove_number(number)
+            self._maybe_compact()
+            self.dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.dirty = True
+
+    def _maybe_compact(self):
+        # Rebuild postings once a quarter of the entries are tombstones
+        if len(self.deleted) < max(1000, len(self.chunk_ids) // 4):
+            return
+        keep = [n for n in range(len(self.chunk_ids)) if n not in self.deleted]
+        remap = {old: new for new, old in enumerate(keep)}
+        postings = {}
+        for term, (numbers, freqs) in self.postings.items():
+            new_numbers, new_freqs = array("I"), array("H")
+            for n, tf in zip(numbers, freqs):
+                if n in remap:
+                    new_numbers.append(remap[n])
+                    new_freqs.append(tf)
+            if new_numbers:
+                postings[term] = (new_numbers, new_freqs)
+        self.chunk_ids = [self.chunk_ids[n] for n in keep]
+        self.chunk_numbers = {chunk_id: i for i, chunk_id in enumerate(self.chunk_ids)}
+        self.doc_lengths = array("I", (self.doc_lengths[n] for n in keep))
+        self.chunk_docs = array("I", (self.chunk_docs[n] for n in keep))
+        self.postings = postings
+        self.deleted = set()
+
+    def search(self, query: str, k: int = 10, doc_id: Optional[str] = None) -> List[Tuple[str, float]]:
+        with self._lock:
+            live = len(self)
+            if not live:
+                return []
+            doc_filter = None
+            if doc_id is not None:
+                doc_filter = self.doc_numbers.get(doc_id)
+                if doc_filter is None:
+                    return []
+            avgdl = self.total_length / live or 1.0
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                numbers, freqs = entry
+                df = len(numbers)
+                idf = math.log(1 + (live - df + 0.5) / (df + 0.5))
+                for n, tf in zip(numbers, freqs):
+                    if n in self.deleted:
+                        continue
+                    if doc_filter is not None and self.chunk_docs[n] != doc_filter:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[n] / avgdl)
+                    scores[n] += idf * tf * (self.k1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self.chunk_ids[n], score) for n, score in top]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self.dirty:
+                return
+            state = {
+                "version": _FORMAT_VERSION,
+                "chunk_ids": self.chunk_ids,
+                "doc_lengths": self.doc_lengths,
+                "chunk_docs": self.chunk_docs,
+                "doc_ids": self.doc_ids,
+                "postings": self.postings,
+                "deleted": self.deleted,
+                "total_length": self.total_length,
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                state = pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable BM25 index at {self.path}: {e}", flush=True)
+            return
+        if state.get("version") != _FORMAT_VERSION:
+            return
+        self.chunk_ids = state["chunk_ids"]
+        self.doc_lengths = state["doc_lengths"]
+        self.chunk_docs = state["chunk_docs"]
+        self.doc_ids = state["doc_ids"]
+        self.postings = state["postings"]
+        self.deleted = state["deleted"]
+        self.total_length = state["total_length"]
+        self.doc_numbers = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        self.chunk_numbers = {
+            chunk_id: n for n, chunk_id in enumerate(self.chunk_ids) if n not in self.deleted
+        }
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Merge ranked id lists; ids ranked high in any list float to the top."""
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: scores[item], reverse=True)
@@ -0,0 +1,196 @@
+"""Spreads chat completions across several OpenAI-compatible servers (e.g. LM Studio boxes).
+
+Each request goes to the healthy backend with the fewest requests in flight.
+Connection errors, timeouts, 429s and 5xx responses count as failures: the
+request is retried on another backend, and a backend that fails
+`eject_after` times in a row is taken out of rotation until a health probe
+(`GET /models`) succeeds again.
+
+`LLMRouter.chat.completions.create(...)` has the same signature as the
+`AsyncOpenAI` call it wraps, so callers don't need to know about routing.
+The OpenAI SDK takes most of a second to import, so it is imported when the
+first client is created (`connect()` or the first request), not with this module.
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+
+import httpx
+
+
+def retryable_errors() -> tuple:
+    from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+    return APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+
+class Backend:
+    def __init__(self, base_url: str, api_key: str, max_connections: int, timeout: float):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+        self.healthy = True
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.latency_ms = None  # exponentially weighted average
+        self.last_error = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            # One pooled keep-alive connection set per server; the router does the retrying
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                max_retries=0,
+                timeout=self.timeout,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    timeout=self.timeout,
+                ),
+            )
+        return self._client
+
+    def record_success(self, elapsed: float):
+        ms = elapsed * 1000
+        self.latency_ms = ms if self.latency_ms is None else 0.8 * self.latency_ms + 0.2 * ms
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: Exception, eject_after: int):
+        self.errors += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.consecutive_failures >= eject_after and self.healthy:
+            self.healthy = False
+            print(f"LLM backend {self.base_url} ejected after {self.consecutive_failures} failures", flush=True)
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class LLMRouter:
+    def __init__(
+        self,
+        base_urls: List[str],
+        api_key: str,
+        max_attempts: int = 3,
+        eject_after: int = 3,
+        health_interval: float = 10.0,
+        max_connections: int = 32,
+        timeout: float = 300.0,
+    ):
+        if not base_urls:
+            raise ValueError("LLMRouter needs at least one base URL")
+        self.backends = [Backend(url, api_key, max_connections, timeout) for url in base_urls]
+        self.max_attempts = max_attempts
+        self.eject_after = eject_after
+        self.health_interval = health_interval
+        self._next = 0
+        self._health_task: Optional[asyncio.Task] = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _pick(self, exclude) -> Backend:
+        candidates = [b for b in self.backends if b.healthy and b not in exclude]
+        if not candidates:
+            # Everything left is ejected: better to try a sick backend than to fail outright
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+        # Least outstanding requests; rotate the starting point so ties spread evenly
+        self._next = (self._next + 1) % len(self.backends)
+        order = self.backends[self._next:] + self.backends[:self._next]
+        return min((b for b in order if b in candidates), key=lambda b: b.in_flight)
+
+    async def create(self, **kwargs):
+        """Route one `chat.completions.create` call, failing over between backends."""
+        tried = []
+        attempts = max(1, self.max_attempts)
+        for attempt in range(attempts):
+            backend = self._pick(tried)
+            tried.append(backend)
+            backend.in_flight += 1
+            backend.requests += 1
+            start = time.perf_counter()
+            try:
+                response = await backend.client.chat.completions.create(**kwargs)
+            except retryable_errors() as e:
+                backend.in_flight -= 1
+                backend.record_failure(e, self.eject_after)
+                if attempt == attempts - 1:
+                    raise
+                print(f"LLM backend {backend.base_url} failed ({type(e).__name__}), retrying elsewhere", flush=True)
+                continue
+            except BaseException:
+                backend.in_flight -= 1
+                raise
+
+            if kwargs.get("stream"):
+                # The request stays in flight until the stream is drained or closed
+                return self._track_stream(backend, response, start)
+            backend.in_flight -= 1
+            backend.record_success(time.perf_counter() - start)
+            return response
+
+    async def _track_stream(self, backend: Backend, stream, start: float):
+        try:
+            async for chunk in stream:
+                yield chunk
+            backend.record_success(time.perf_counter() - start)
+        except retryable_errors() as e:
+            backend.record_failure(e, self.eject_after)
+            raise
+        finally:
+            backend.in_flight -= 1
+            await stream.close()
+
+    async def probe(self, backend: Backend) -> bool:
+        try:
+            await asyncio.wait_for(backend.client.models.list(), timeout=5)
+        except Exception as e:
+            backend.last_error = f"health probe: {type(e).__name__}: {e}"
+            if backend.healthy:
+                print(f"LLM backend {backend.base_url} failed its health probe, ejecting", flush=True)
+            backend.healthy = False
+            return False
+        if not backend.healthy:
+            print(f"LLM backend {backend.base_url} is healthy again", flush=True)
+        backend.healthy = True
+        backend.consecutive_failures = 0
+        return True
+
+    async def _probe_forever(self):
+        while True:
+            await asyncio.gather(*(self.probe(b) for b in self.backends))
+            await asyncio.sleep(self.health_interval)
+
+    def connect(self):
+        """Import the SDK and create every backend's client now instead of on the first request (blocking)."""
+        for backend in self.backends:
+            backend.client
+
+    def start(self):
+        """Start periodic health probes on the running event loop (a no-op for a single backend)."""
+        if self._health_task is None and len(self.backends) > 1 and self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._probe_forever())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(b._client.close() for b in self.backends if b._client is not None),
+                             return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {"backends": [b.stats() for b in self.backends]}
@@ -0,0 +1,233 @@
+"""Minimal Prometheus instrumentation: histograms, counters, per-request stage timing.
+
+`stage("embed")` times a block, feeds the `zentro_stage_duration_seconds`
+histogram and, inside a request, adds it to that request's timings, which
+`MetricsMiddleware` returns as a `Server-Timing` header. `/metrics` serves
+`render()` in the Prometheus text exposition format.
+"""
+import cProfile
+import io
+import json
+import math
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        with self._lock:
+            series = self._series.setdefault(labelvalues, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labelvalues, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = f'le="{_number(bound)}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {count}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labelvalues, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "zentro_request_duration_seconds", "HTTP request latency until the response completes.",
+    ("method", "route", "status"),
+)
+STAGE_SECONDS = Histogram("zentro_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+LLM_TTFT_SECONDS = Histogram("zentro_llm_time_to_first_token_seconds", "LLM time to first token.", ("model",))
+LLM_SECONDS = Histogram("zentro_llm_duration_seconds", "LLM call duration until the last token.", ("model",))
+LLM_TOKENS_PER_SECOND = Histogram(
+    "zentro_llm_tokens_per_second", "LLM generation speed.", ("model",),
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+LLM_TOKENS = Counter("zentro_llm_completion_tokens_total", "Tokens generated by the LLM.", ("model",))
+
+METRICS = [REQUEST_SECONDS, STAGE_SECONDS, LLM_TTFT_SECONDS, LLM_SECONDS, LLM_TOKENS_PER_SECOND, LLM_TOKENS]
+
+# Stage name -> seconds for the request being served, if any
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_llm(model: str, total: float, tokens: int, ttft: Optional[float] = None):
+    if ttft is not None:
+        LLM_TTFT_SECONDS.observe(ttft, model)
+        record_stage("llm_ttft", ttft)
+    LLM_SECONDS.observe(total, model)
+    record_stage("llm_total", total)
+    if tokens:
+        LLM_TOKENS.inc(tokens, model)
+        # Generation speed excludes the prompt-processing wait before the first token
+        generating = total - (ttft or 0.0)
+        if generating > 0:
+            LLM_TOKENS_PER_SECOND.observe(tokens / generating, model)
+
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request histogram, `Server-Timing` header and opt-in profiling.
+
+    Requests carrying `X-Profile: 1` (or `?profile=1`) are run under cProfile
+    when `profile_dir` is set; the report is written there and its path is
+    returned in `X-Profile-Report`. cProfile only sees the event-loop thread,
+    so work in worker pools shows up as time spent waiting on it, and anything
+    else the loop runs meanwhile (other requests, background jobs) is in the
+    report too. One request is profiled at a time; others asking get a 409.
+    """
+
+    def __init__(self, app, server_timing: bool = True, profile_dir: Optional[str] = None):
+        self.app = app
+        self.server_timing = server_timing
+        self.profile_dir = profile_dir
+        self._profile_lock = threading.Lock()  # cProfile allows one active profiler per thread
+
+    def _wants_profile(self, scope) -> bool:
+        if not self.profile_dir:
+            return False
+        headers = dict(scope.get("headers") or [])
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return headers.get(b"x-profile") == b"1" or query.get("profile", [""])[-1] == "1"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = {"code": 500}
+        profiler = None
+        report_path = None
+        busy = False
+        if self._wants_profile(scope):
+            if self._profile_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+                name = scope["path"].strip("/").replace("/", "_") or "root"
+                report_path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{os.getpid()}")
+            else:
+                busy = True
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                headers = list(message.get("headers", []))
+                if self.server_timing and timings:
+                    headers.append((b"server-timing", format_server_timing(timings).encode("latin-1")))
+                if report_path:
+                    headers.append((b"x-profile-report", f"{report_path}.txt".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if busy:
+                await self._profile_busy(send_wrapper)
+                return
+            if profiler:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler:
+                profiler.disable()
+                self._write_profile(profiler, report_path)
+                self._profile_lock.release()
+            _request_timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], path, str(status["code"]))
+
+    @staticmethod
+    async def _profile_busy(send):
+        body = json.dumps({"error": "Another request is being profiled; retry once it finishes"}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 409,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1"))],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _write_profile(self, profiler: cProfile.Profile, path: str):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler.dump_stats(f"{path}.prof")
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+        with open(f"{path}.txt", "w") as f:
+            f.write(out.getvalue())
+        print(f"Profile written to {path}.txt", flush=True)
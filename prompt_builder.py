@@ -0,0 +1,199 @@
+import math
+import re
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from reranking import pack_chunks
+
+# Tokens a chat template adds around each message (role markers, separators)
+MESSAGE_OVERHEAD = 4
+
+_PIECE_RE = re.compile(r"[A-Za-z]+|[0-9]+|\n+|[^\sA-Za-z0-9]")
+# Places a text may be cut, strongest first: paragraph, line, sentence, word
+_BOUNDARIES = (re.compile(r"\n\s*\n"), re.compile(r"\n"), re.compile(r"(?<=[.!?])\s+"), re.compile(r"\s+"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Offline token estimate that errs on the high side for BPE tokenizers.
+
+    English words cost about one token per four letters, digits one each
+    (Qwen splits numbers into digits) and any other non-space character one
+    each, which keeps CJK text and symbols from being undercounted.
+    """
+    total = 0
+    for piece in _PIECE_RE.findall(text):
+        if piece[0].isalpha() and piece.isascii():
+            total += math.ceil(len(piece) / 4)
+        elif piece[0] == "\n":
+            total += 1
+        else:
+            total += len(piece)
+    return total
+
+
+class TokenCounter:
+    """Counts tokens with a Hugging Face tokenizer if one is configured, else the estimator.
+
+    The tokenizer is loaded lazily and only from local files, so a missing or
+    offline model quietly falls back to `estimate_tokens`.
+    """
+
+    def __init__(self, tokenizer_name: str = ""):
+        self.tokenizer_name = tokenizer_name
+        self._tokenizer = None
+        self._loaded = not tokenizer_name
+        self._lock = threading.Lock()
+
+    @property
+    def source(self) -> str:
+        self._load()
+        return self.tokenizer_name if self._tokenizer is not None else "estimate"
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name, local_files_only=True)
+                print(f"Counting prompt tokens with {self.tokenizer_name}", flush=True)
+            except Exception as e:
+                print(f"Tokenizer {self.tokenizer_name} unavailable ({e}), estimating tokens", flush=True)
+            self._loaded = True
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        self._load()
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False))
+        return estimate_tokens(text)
+
+
+def parse_budgets(spec: str) -> Dict[str, int]:
+    """Parse "model-a=8192,model-b=4096" into a dict."""
+    budgets = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, tokens = item.rsplit("=", 1)
+            budgets[model.strip()] = int(tokens)
+    return budgets
+
+
+def fit_text(text: str, budget: int, count, min_fill: float = 0.5) -> Tuple[str, bool]:
+    """Longest prefix of `text` that fits in `budget` tokens, cut at the strongest boundary possible.
+
+    Returns (text, truncated). Tries paragraph breaks first and only falls
+    back to line, sentence or word breaks when the coarser cut would use less
+    than `min_fill` of the budget.
+    """
+    if count(text) <= budget:
+        return text, False
+    fallback = ""
+    for pattern in _BOUNDARIES:
+        cuts = [m.start() for m in pattern.finditer(text)]
+        # Binary search for the last cut whose prefix still fits
+        lo, hi, best = 0, len(cuts) - 1, None
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            if count(text[:cuts[mid]]) <= budget:
+                best, lo = cuts[mid], mid + 1
+            else:
+                hi = mid - 1
+        if best:
+            prefix = text[:best].rstrip()
+            if count(prefix) >= budget * min_fill:
+                return prefix, True
+            fallback = max(fallback, prefix, key=len)
+    return fallback, True
+
+
+class PromptBuilder:
+    """Splits a model's token budget across the parts of a prompt by priority.
+
+    The question is always sent whole. The instruction comes next and is only
+    cut at a boundary if it alone would overflow. Retrieved chunks are packed
+    whole, best first. History gets up to `history_share` of the budget before
+    the chunks and whatever the chunks leave after; messages are kept whole,
+    newest first.
+    """
+
+    def __init__(self, counter: TokenCounter, default_budget: int, budgets: Optional[Dict[str, int]] = None,
+                 history_share: float = 0.25):
+        self.counter = counter
+        self.default_budget = default_budget
+        self.budgets = budgets or {}
+        self.history_share = history_share
+
+    def budget_for(self, model_name: Optional[str]) -> int:
+        return self.budgets.get(model_name or "", self.default_budget)
+
+    def _history(self, history: Sequence[dict], budget: int) -> Tuple[List[dict], int]:
+        kept, used = [], 0
+        for msg in reversed(history):
+            cost = self.counter.count(msg.get("content", "")) + MESSAGE_OVERHEAD
+            if used + cost > budget:
+                break
+            kept.append({"role": msg["role"], "content": msg.get("content", "")})
+            used += cost
+        kept.reverse()
+        return kept, used
+
+    def rag(self, model_name: Optional[str], instruction: str, question: str, chunks: List[str],
+            history: Sequence[dict] = ()):
+        """Returns (messages, used_chunk_positions, usage)."""
+        budget = self.budget_for(model_name)
+        count = self.counter.count
+        header, question_header = "\n\nCONTEXT CHUNKS:\n", "\n\nUSER QUESTION:\n"
+
+        question_tokens = count(question_header + question) + MESSAGE_OVERHEAD
+        instruction, instruction_cut = fit_text(instruction, max(0, budget - question_tokens - count(header)), count)
+        instruction_tokens = count(instruction + header)
+        remaining = max(0, budget - question_tokens - instruction_tokens)
+
+        # Reserve a share for history, pack chunks into the rest, then let history use what's left
+        history_cost = sum(count(m.get("content", "")) + MESSAGE_OVERHEAD for m in history)
+        reserved = min(history_cost, int(budget * self.history_share), remaining)
+        used_chunks = pack_chunks(chunks, remaining - reserved, size=count, separator_cost=count("\n\n"))
+        context_text = "\n\n".join(chunks[i] for i in used_chunks)
+        chunk_tokens = count(context_text)
+        messages, history_tokens = self._history(history, remaining - chunk_tokens)
+
+        prompt = f"{instruction}{header}{context_text}{question_header}{question}"
+        messages.append({"role": "user", "content": prompt})
+        usage = {
+            "budget": budget,
+            "instruction": instruction_tokens,
+            "chunks": chunk_tokens,
+            "history": history_tokens,
+            "question": question_tokens,
+            "total": instruction_tokens + chunk_tokens + history_tokens + question_tokens,
+            "chunks_dropped": len(chunks) - len(used_chunks),
+            "history_dropped": len(history) - (len(messages) - 1),
+            "instruction_truncated": instruction_cut,
+            "counter": self.counter.source,
+        }
+        return messages, used_chunks, usage
+
+    def document(self, model_name: Optional[str], instruction: str, text: str):
+        """Returns (messages, usage) with the document cut at a boundary to fit the budget."""
+        budget = self.budget_for(model_name)
+        count = self.counter.count
+        head = f"You are an AI assistant analyzing a document.\n\nUSER INSTRUCTION:\n{instruction}\n\n"
+        label = "DOCUMENT CONTENT:\n"
+        fixed = count(head + label) + count(" (truncated)") + MESSAGE_OVERHEAD
+        content, truncated = fit_text(text, max(0, budget - fixed), count)
+        if truncated:
+            label = "DOCUMENT CONTENT (truncated):\n"
+        document_tokens = count(content)
+        usage = {
+            "budget": budget,
+            "instruction": fixed,
+            "document": document_tokens,
+            "total": fixed + document_tokens,
+            "document_truncated": truncated,
+            "counter": self.counter.source,
+        }
+        return [{"role": "user", "content": head + label + content}], usage
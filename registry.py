@@ -0,0 +1,128 @@
+"""Document registry: one SQLite row per indexed document.
+
+Chroma only knows about chunks, so listing documents from it means scanning
+every chunk's metadata. The registry keeps the per-document facts (name,
+content hash, chunk count, size, ingest time) so `/rag/list` and duplicate
+checks cost O(documents) or a single index lookup.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+COLUMNS = ("doc_id", "filename", "file_hash", "num_chunks", "num_pages", "size_bytes", "ingested_at")
+
+
+class DocumentRegistry:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " doc_id TEXT PRIMARY KEY,"
+            " filename TEXT NOT NULL,"
+            " file_hash TEXT,"
+            " num_chunks INTEGER NOT NULL DEFAULT 0,"
+            " num_pages INTEGER NOT NULL DEFAULT 0,"
+            " size_bytes INTEGER NOT NULL DEFAULT 0,"
+            " ingested_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_hash ON documents (file_hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS documents_ingested ON documents (ingested_at)")
+        # Page content hashes let a new version of a document re-embed only what changed
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS document_pages ("
+            " doc_id TEXT NOT NULL,"
+            " page INTEGER NOT NULL,"
+            " page_hash TEXT NOT NULL,"
+            " PRIMARY KEY (doc_id, page))"
+        )
+        self._db.commit()
+
+    def add(
+        self,
+        doc_id: str,
+        filename: str,
+        file_hash: Optional[str],
+        num_chunks: int,
+        num_pages: int = 0,
+        size_bytes: int = 0,
+        ingested_at: Optional[float] = None,
+        page_hashes: Optional[List[str]] = None,
+    ):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, filename, file_hash, num_chunks, num_pages, size_bytes, ingested_at or time.time()),
+            )
+            if page_hashes is not None:
+                self._db.execute("DELETE FROM document_pages WHERE doc_id = ?", (doc_id,))
+                self._db.executemany(
+                    "INSERT INTO document_pages VALUES (?, ?, ?)",
+                    [(doc_id, page, h) for page, h in enumerate(page_hashes)],
+                )
+
+    def get_page_hashes(self, doc_id: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT page_hash FROM document_pages WHERE doc_id = ? ORDER BY page", (doc_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def get(self, doc_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def find_by_hash(self, file_hash: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM documents WHERE file_hash = ? LIMIT 1", (file_hash,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, offset: int = 0, limit: int = 100) -> Tuple[List[dict], int]:
+        with self._lock:
+            total = self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            rows = self._db.execute(
+                "SELECT * FROM documents ORDER BY ingested_at, doc_id LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [dict(row) for row in rows], total
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def delete(self, doc_id: str) -> bool:
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM document_pages WHERE doc_id = ?", (doc_id,))
+            return self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount > 0
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM document_pages")
+            self._db.execute("DELETE FROM documents")
+
+    def backfill(self, metadatas: Iterable[dict]) -> int:
+        """Rebuild rows from Chroma chunk metadata (for collections indexed before the registry existed)."""
+        docs = {}
+        for meta in metadatas:
+            if not meta or "doc_id" not in meta:
+                continue
+            doc = docs.setdefault(meta["doc_id"], {"filename": meta.get("filename", ""), "file_hash": meta.get("file_hash"), "num_chunks": 0})
+            doc["num_chunks"] += 1
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO documents (doc_id, filename, file_hash, num_chunks, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                [(doc_id, d["filename"], d["file_hash"], d["num_chunks"], now) for doc_id, d in docs.items()],
+            )
+        return len(docs)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
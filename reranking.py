@@ -0,0 +1,86 @@
+"""Post-retrieval stages for rag_ask: MMR diversification, reranking, packing.
+
+Candidates arrive over-fetched and ranked by the retriever. MMR picks a
+diverse top-k using the stored chunk embeddings (so two near-identical
+chunks from the same page don't both get in), an optional reranker reorders
+them, and the packer keeps as many as fit the context budget without ever
+cutting a chunk in half.
+"""
+import threading
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr(embeddings: Sequence[Sequence[float]], k: int, lambda_: float = 0.7,
+        relevance: Optional[Sequence[float]] = None) -> List[int]:
+    """Maximal marginal relevance over candidates; returns selected positions in pick order.
+
+    `relevance` defaults to a linear decay over the incoming order, so the
+    retriever's ranking (vector, BM25 or fused) decides what is relevant and
+    the embeddings only decide what is redundant.
+    """
+    n = len(embeddings)
+    if n == 0 or k <= 0:
+        return []
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+    if relevance is None:
+        rel = 1.0 - np.arange(n, dtype=np.float32) / n
+    else:
+        rel = np.asarray(relevance, dtype=np.float32)
+    similarity = vectors @ vectors.T
+
+    selected = [int(np.argmax(rel))]
+    max_sim = similarity[selected[0]].copy()
+    while len(selected) < min(k, n):
+        scores = lambda_ * rel - (1 - lambda_) * max_sim
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        max_sim = np.maximum(max_sim, similarity[best])
+    return selected
+
+
+def cosine_scores(query: Sequence[float], embeddings: Sequence[Sequence[float]]) -> List[float]:
+    q = np.asarray(query, dtype=np.float32)
+    q = q / (np.linalg.norm(q) or 1.0)
+    return (_normalize(np.asarray(embeddings, dtype=np.float32)) @ q).tolist()
+
+
+class CrossEncoderReranker:
+    """Lazily loaded sentence-transformers CrossEncoder."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    print(f"Lazy loading CrossEncoder {self.model_name}...", flush=True)
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return [float(s) for s in self._model.predict([(query, text) for text in texts])]
+
+
+def pack_chunks(chunks: List[str], budget: int, size: Callable[[str], int] = len, separator_cost: int = 2) -> List[int]:
+    """Positions of the chunks, in order, that fit in `budget` whole.
+
+    A chunk that doesn't fit is skipped rather than cut, and smaller chunks
+    further down may still fill the remaining space.
+    """
+    used, picked = 0, []
+    for i, chunk in enumerate(chunks):
+        cost = size(chunk) + (separator_cost if picked else 0)
+        if used + cost <= budget:
+            picked.append(i)
+            used += cost
+    return picked
@@ -0,0 +1,85 @@
+"""Startup lifecycle: timed boot steps and components that load once.
+
+Heavy clients (Chroma, the embedding model, the OpenAI SDK) are opened by
+`Startup.load`, either by the warm-up at boot or by the first request that
+needs them. Concurrent callers share one load, and a failed load is retried
+by the next caller. Every step is timed, so the boot log can show where a
+cold start spent its time and `/ready` can report what is still loading.
+"""
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+
+class Startup:
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self.steps: Dict[str, float] = {}      # step -> seconds, in the order they finished
+        self.components: Dict[str, dict] = {}  # component -> {"state", "seconds", "error"}
+        self.required: List[str] = []          # components /ready waits for
+        self.serving = False
+        self._tasks: Dict[str, asyncio.Future] = {}
+
+    def record(self, step: str, seconds: float):
+        self.steps[step] = seconds
+
+    @contextmanager
+    def timed(self, step: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(step, time.perf_counter() - start)
+
+    def is_loaded(self, name: str) -> bool:
+        return self.components.get(name, {}).get("state") == "ready"
+
+    async def load(self, name: str, pool, func: Callable, *args):
+        """Run blocking `func` on `pool` once; later calls return at once, concurrent ones wait for it."""
+        if self.is_loaded(name):
+            return
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(name)
+        if task is None or task.get_loop() is not loop:
+            task = self._tasks[name] = loop.create_task(self._run(name, pool, func, *args))
+        await asyncio.shield(task)
+
+    async def _run(self, name: str, pool, func: Callable, *args):
+        self.components[name] = {"state": "loading", "seconds": None, "error": None}
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args))
+        except Exception as e:
+            self.components[name] = {"state": "failed", "seconds": None, "error": f"{type(e).__name__}: {e}"}
+            self._tasks.pop(name, None)
+            print(f"Loading {name} failed: {e}", flush=True)
+            raise
+        seconds = time.perf_counter() - start
+        self.components[name] = {"state": "ready", "seconds": round(seconds, 3), "error": None}
+
+    async def warm_up(self, loaders: Dict[str, tuple]):
+        """Load every component in `loaders` ({name: (pool, func)}) concurrently; /ready waits for them."""
+        self.required = list(loaders)
+        for name in loaders:
+            self.components.setdefault(name, {"state": "pending", "seconds": None, "error": None})
+        await asyncio.gather(*(self.load(name, pool, func) for name, (pool, func) in loaders.items()),
+                             return_exceptions=True)
+        self.record("boot to ready", time.perf_counter() - self.started)
+
+    @property
+    def ready(self) -> bool:
+        return self.serving and all(self.is_loaded(name) for name in self.required)
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "components": self.components,
+            "boot_ms": {step: round(seconds * 1000, 1) for step, seconds in self.steps.items()},
+        }
+
+    def report(self) -> str:
+        lines = ["Cold start breakdown (warm-up steps run in parallel):"]
+        lines += [f"  {step:<28} {seconds * 1000:>9.1f} ms" for step, seconds in self.steps.items()]
+        return "\n".join(lines)
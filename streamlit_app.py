@@ -1,7 +1,40 @@
+import json
+from collections import Counter
 import os
+import time
 import requests
 import streamlit as st
 
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a streaming text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line is None:
+            continue
+        if not line:
+            if data:
+                yield event, json.loads("\n".join(data))
+            event, data = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+
+
+def list_documents(backend_url, page_size=1000):
+    """Every indexed document, fetched from /rag/list one page at a time."""
+    docs = []
+    while True:
+        r = requests.get(f"{backend_url}/rag/list", params={"offset": len(docs), "limit": page_size}, timeout=5)
+        r.raise_for_status()
+        page = r.json()
+        if "error" in page:
+            raise RuntimeError(page["error"])
+        docs += page["documents"]
+        if not page["documents"] or len(docs) >= page["total"]:
+            return docs
+
 # ================================
 # CONFIG & STATE
 # ================================
@@ -121,9 +154,12 @@ with st.sidebar:
 
     if st.button("Check Connection"):
         try:
-            r = requests.get(f"{backend_url}/health", timeout=2)
+            r = requests.get(f"{backend_url}/ready", timeout=2)
             if r.status_code == 200:
                 st.success("Connected!")
+            elif r.status_code == 503:
+                loading = [name for name, c in r.json()["components"].items() if c["state"] != "ready"]
+                st.warning(f"Connected, still warming up: {', '.join(loading)}")
             else:
                 st.error(f"Status: {r.status_code}")
         except Exception as e:
@@ -138,18 +174,33 @@ with st.sidebar:
 
     # Fetch docs
     try:
-        r = requests.get(f"{backend_url}/rag/list", timeout=2)
-        if r.status_code == 200:
-            docs = r.json().get("documents", [])
-            
-            # File Selection
+        try:
+            docs = list_documents(backend_url)
+        except (requests.HTTPError, RuntimeError):
+            docs = None
+        if docs is not None:
+            # File Selection; a name indexed more than once gets its doc id appended
             doc_options = {"All Documents": None}
+            names = Counter(d["filename"] for d in docs)
             for d in docs:
-                doc_options[d["filename"]] = d["doc_id"]
+                label = d["filename"] if names[d["filename"]] == 1 else f"{d['filename']} ({d['doc_id'][:8]})"
+                doc_options[label] = d["doc_id"]
             
             selected_name = st.selectbox("Select Document", list(doc_options.keys()))
             st.session_state.current_doc_id = doc_options[selected_name]
 
+            if st.session_state.current_doc_id and st.button("Delete Selected Document"):
+                try:
+                    r_del = requests.delete(f"{backend_url}/rag/documents/{st.session_state.current_doc_id}", timeout=30)
+                    resp_del = r_del.json()
+                    if "error" in resp_del:
+                        st.error(resp_del["error"])
+                    else:
+                        st.session_state.current_doc_id = None
+                        st.rerun()
+                except Exception as e:
+                    st.error(f"Error: {e}")
+
             # Clear Button
             if st.button("Clear Knowledge Base", type="primary"):
                 try:
@@ -239,6 +290,56 @@ with tab_vision:
                 else:
                     st.markdown("### Result")
                     st.markdown(resp["result"])
+                    if resp.get("cached"):
+                        st.caption("Served from cache")
+                    elif resp.get("image", {}).get("bytes_saved", 0) > 0:
+                        info = resp["image"]
+                        st.caption(
+                            f"Sent {info['sent_bytes'] / 1024:.0f} KB instead of {info['original_bytes'] / 1024:.0f} KB "
+                            f"({info['original_size'][0]}×{info['original_size'][1]} → {info['sent_size'][0]}×{info['sent_size'][1]})"
+                        )
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+    with st.expander("🗂️ Batch Analysis"):
+        batch_files = st.file_uploader(
+            "Upload images or a zip of images",
+            type=["png", "jpg", "jpeg", "webp", "zip"],
+            accept_multiple_files=True,
+            key="batch_images",
+        )
+        batch_instruction = st.text_area("Instruction", value="Describe this image in detail.", height=80, key="batch_instr")
+        if st.button("✨ Analyze All", use_container_width=True) and batch_files:
+            files = [("files", (f.name, f.getvalue(), f.type)) for f in batch_files]
+            progress = st.progress(0.0, text="Uploading...")
+            results = st.container()
+            try:
+                with requests.post(
+                    f"{backend_url}/analyze/images/batch",
+                    files=files,
+                    data={"instruction": batch_instruction},
+                    stream=True,
+                    timeout=600,
+                ) as r:
+                    total, finished = 0, 0
+                    for event, data in iter_sse(r):
+                        if event == "start":
+                            total = data["total"]
+                            progress.progress(0.0, text=f"Analyzing {total} images...")
+                        elif event in ("result", "error"):
+                            finished += 1
+                            progress.progress(finished / max(total, 1), text=f"{finished}/{total} done")
+                            with results.container(border=True):
+                                st.markdown(f"**{data.get('filename', '')}**")
+                                if event == "error":
+                                    st.error(data["error"])
+                                else:
+                                    st.markdown(data["result"])
+                        elif event == "done":
+                            progress.progress(1.0, text=(
+                                f"{data['succeeded']}/{data['total']} analyzed in {data['total_ms'] / 1000:.1f} s "
+                                f"({data['images_per_second']} images/s)"
+                            ))
             except Exception as e:
                 st.error(f"Error: {e}")
 
@@ -251,14 +352,18 @@ with tab_docs:
         
         doc_file = st.file_uploader("Upload Document (PDF/TXT)", type=["pdf", "txt"])
         doc_instruction = st.text_area("Instruction", value="Summarize this document and extract key points, entities, and dates.", height=100, key="doc_instr")
+        doc_mode = st.radio(
+            "Mode", ["auto", "single", "map-reduce"], horizontal=True,
+            help="Map-reduce reads long documents section by section instead of cutting them off.",
+        )
         
         if st.button("⚡ Analyze Document", type="primary", use_container_width=True):
             if doc_file:
                 try:
                     files = {"file": (doc_file.name, doc_file.getvalue(), doc_file.type)}
-                    data = {"instruction": doc_instruction}
+                    data = {"instruction": doc_instruction, "mode": doc_mode}
                     with st.spinner("Analyzing..."):
-                        r = requests.post(f"{backend_url}/analyze/document", files=files, data=data, timeout=240)
+                        r = requests.post(f"{backend_url}/analyze/document", files=files, data=data, timeout=600)
                         try:
                             resp = r.json()
                         except ValueError:
@@ -270,6 +375,12 @@ with tab_docs:
                     else:
                         st.markdown("### Result")
                         st.markdown(resp["result"])
+                        stats = resp.get("map_reduce")
+                        if stats:
+                            st.caption(
+                                f"Read in {stats['sections']} sections · {stats['llm_calls']} LLM calls, "
+                                f"{stats['cached']} cached · {stats['map_reduce_ms'] / 1000:.1f} s before the final answer"
+                            )
                 except Exception as e:
                     st.error(f"Error: {e}")
         else:
@@ -288,20 +399,67 @@ with tab_chat:
             if rag_file:
                 try:
                     files = {"file": (rag_file.name, rag_file.getvalue(), rag_file.type)}
-                    with st.spinner("Indexing..."):
-                        r = requests.post(f"{backend_url}/rag/upload", files=files, timeout=240)
-                        resp = r.json()
+                    r = requests.post(f"{backend_url}/rag/upload", files=files, timeout=60)
+                    resp = r.json()
                     
                     if "error" in resp:
                         st.error(resp["error"])
+                    elif resp.get("job_id") is None:
+                        st.info(f"{rag_file.name} is already in the knowledge base.")
                     else:
-                        st.success(f"Indexed {rag_file.name} successfully!")
-                        st.rerun() # Refresh list
+                        # Indexing runs as a background job on the backend; poll its progress
+                        progress = st.progress(0.0, text="Queued...")
+                        while True:
+                            job = requests.get(f"{backend_url}/rag/jobs/{resp['job_id']}", timeout=5).json()
+                            if "error" in job and "stage" not in job:
+                                st.error(job["error"])
+                                break
+                            total = job["total_pages"] or 1
+                            progress.progress(
+                                min(job["pages_done"] / total, 1.0),
+                                text=f"{job['stage'].capitalize()}: page {job['pages_done']}/{job['total_pages']}, "
+                                     f"{job['chunks_written']} chunks ({job['chunks_per_second']} chunks/s)",
+                            )
+                            if job["stage"] == "done":
+                                st.success(f"Indexed {rag_file.name} successfully!")
+                                st.rerun() # Refresh list
+                            if job["stage"] == "failed":
+                                st.error(job["error"])
+                                break
+                            time.sleep(1)
                 except Exception as e:
                     st.error(f"Error: {e}")
             else:
                 st.warning("Select a file first.")
 
+        archive = st.file_uploader("Or a zip/tar archive of PDF/TXT files", type=["zip", "tar", "gz", "tgz"],
+                                   key="rag_bulk")
+        if st.button("Index Archive") and archive:
+            progress = st.progress(0.0, text="Uploading...")
+            failures = st.container()
+            try:
+                files = {"file": (archive.name, archive.getvalue(), archive.type)}
+                with requests.post(f"{backend_url}/rag/ingest/bulk", files=files, stream=True, timeout=3600) as r:
+                    total, finished = 0, 0
+                    for event, data in iter_sse(r):
+                        if event == "start":
+                            total = data["total"]
+                        elif event in ("result", "error"):
+                            if "filename" not in data:
+                                st.error(data["error"])
+                                continue
+                            finished += 1
+                            progress.progress(finished / max(total, 1), text=f"{finished}/{total} files")
+                            if event == "error":
+                                failures.error(f"{data['filename']}: {data['error']}")
+                        elif event == "done":
+                            progress.progress(1.0, text=(
+                                f"{data['indexed']} indexed, {data['duplicate']} already indexed, "
+                                f"{data['failed']} failed in {data['total_ms'] / 1000:.1f} s"
+                            ))
+            except Exception as e:
+                st.error(f"Error: {e}")
+
     st.markdown("---")
 
     # Chat Interface
@@ -317,36 +475,53 @@ with tab_chat:
 
         # Get Answer
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    # Prepare history for backend (exclude current prompt as it's sent in 'question')
-                    # Actually backend expects 'chat_history' + 'question'.
-                    # We send previous messages as history.
-                    history = [
-                        {"role": m["role"], "content": m["content"]} 
-                        for m in st.session_state.messages[:-1]
-                    ]
-                    
-                    payload = {
-                        "question": prompt,
-                        "chat_history": history,
-                        "doc_id": st.session_state.get("current_doc_id")
-                    }
-                    
-                    r = requests.post(f"{backend_url}/rag/ask", json=payload, timeout=120)
-                    try:
-                        resp = r.json()
-                    except ValueError:
-                        answer = f"Error: Backend returned non-JSON response: {r.text[:200]}"
-                        resp = {"error": "Invalid response"}
-                    
-                    if "error" in resp:
-                        answer = f"Error: {resp['error']}"
-                    else:
-                        answer = resp["answer"]
-                    
-                    st.markdown(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                    
-                except Exception as e:
-                    st.error(f"Connection Error: {e}")
+            try:
+                # Prepare history for backend (exclude current prompt as it's sent in 'question')
+                # Actually backend expects 'chat_history' + 'question'.
+                # We send previous messages as history.
+                history = [
+                    {"role": m["role"], "content": m["content"]} 
+                    for m in st.session_state.messages[:-1]
+                ]
+                
+                payload = {
+                    "question": prompt,
+                    "chat_history": history,
+                    "doc_id": st.session_state.get("current_doc_id")
+                }
+                
+                stream_state = {}
+
+                def answer_tokens():
+                    # Tokens are rendered as soon as the backend forwards them
+                    with requests.post(f"{backend_url}/rag/ask/stream", json=payload, stream=True, timeout=120) as r:
+                        for event, data in iter_sse(r):
+                            if event == "token":
+                                yield data["text"]
+                            elif event == "error":
+                                yield f"Error: {data['error']}"
+                            elif event == "done":
+                                stream_state["summary"] = data
+
+                with st.spinner("Thinking..."):
+                    tokens = answer_tokens()
+                    first = next(tokens, "")
+
+                def rest_tokens():
+                    yield first
+                    yield from tokens
+
+                answer = st.write_stream(rest_tokens())
+                summary = stream_state.get("summary")
+                if summary and summary.get("ttft_ms") is not None:
+                    caption = f"First token in {summary['ttft_ms']:.0f} ms · {summary['total_ms'] / 1000:.1f} s total"
+                    usage = summary.get("prompt_tokens")
+                    if summary.get("cached"):
+                        caption = "Answered from cache"
+                    elif usage:
+                        caption += f" · prompt {usage['total']}/{usage['budget']} tokens"
+                    st.caption(caption)
+                st.session_state.messages.append({"role": "assistant", "content": answer})
+                
+            except Exception as e:
+                st.error(f"Connection Error: {e}")
@@ -0,0 +1,28 @@
+"""The checks live in benchmarks/ as standalone scripts; each test runs one in a fresh interpreter.
+
+A separate process per check matters: backend.py reads its configuration at
+import, several checks start services of their own, and every run gets a
+throwaway Chroma and upload directory.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+@pytest.fixture
+def run_check(tmp_path):
+    """Run `benchmarks/<script>` with `args`; fails the test with the script's output if it exits non-zero."""
+
+    def run(script: str, *args, timeout: float = 600) -> str:
+        env = {**os.environ, "CHROMA_PATH": str(tmp_path / "chroma"), "UPLOAD_DIR": str(tmp_path / "uploads")}
+        env.pop("VECTOR_SERVICE", None)
+        proc = subprocess.run([sys.executable, os.path.join(BENCHMARKS, script), *map(str, args)],
+                              cwd=BENCHMARKS, env=env, capture_output=True, text=True, timeout=timeout)
+        assert proc.returncode == 0, f"{script} exited with {proc.returncode}\n{proc.stdout[-3000:]}\n{proc.stderr[-3000:]}"
+        return proc.stdout
+
+    return run
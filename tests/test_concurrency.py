@@ -0,0 +1,4 @@
+def test_requests_overlap_and_health_stays_responsive(run_check):
+    # An encode costs longer than the LLM call, so one on the event loop would stall /health
+    out = run_check("concurrency.py", "--requests", 16, "--latency", 0.4, "--embed-cost", 0.5)
+    assert "errors=0" in out
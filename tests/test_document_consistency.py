@@ -0,0 +1,3 @@
+def test_reindex_and_delete_keep_store_registry_and_bm25_in_sync(run_check):
+    out = run_check("document_consistency.py", "--rounds", 1, "--concurrent", 3)
+    assert "all consistency checks passed" in out
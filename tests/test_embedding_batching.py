@@ -0,0 +1,2 @@
+def test_batcher_returns_every_vector_and_batches(run_check):
+    run_check("embedding_batching.py", "--clients", 64, "--batch-sizes", 8, 32)
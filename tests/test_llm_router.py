@@ -0,0 +1,2 @@
+def test_router_spreads_load_fails_over_and_recovers(run_check):
+    run_check("llm_router.py", "--servers", 3, "--requests", 30, "--latency", 0.2)
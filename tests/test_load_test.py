@@ -0,0 +1,3 @@
+def test_end_to_end_load(run_check):
+    run_check("load_test.py", "--docs", 12, "--pages", 2, "--list-steps", 2, "--list-samples", 3,
+              "--clients", 4, "--requests", 20, "--llm-latency", 0.05, "--stream")
@@ -0,0 +1,2 @@
+def test_map_reduce_scales_with_concurrency(run_check):
+    run_check("map_reduce.py", "--sections", 4, 16, "--latency", 0.2)
@@ -0,0 +1,3 @@
+def test_workers_share_jobs_cache_and_store(run_check):
+    out = run_check("multi_worker.py", "--workers", 2, "--docs", 4, "--pages", 2, "--clients", 4, "--requests", 20)
+    assert "all multi-worker checks passed" in out
@@ -0,0 +1,2 @@
+def test_parallel_extraction_matches_serial(run_check):
+    run_check("pdf_extraction.py", "--pages", 150, "--workers", 2)
@@ -0,0 +1,280 @@
+"""Upload spooling and bulk sources.
+
+Uploads are copied to disk in fixed-size chunks and hashed on the way, so a
+document is never held in memory whole. The ingest job then opens it by path.
+Bulk ingestion walks a zip/tar archive or a server-side directory and yields
+one spooled file per PDF/TXT inside it, one at a time. Image batches list the
+images among spooled uploads and zips, and read each one only when it is
+analyzed.
+
+Everything here blocks; callers run it on a worker pool.
+"""
+import hashlib
+import os
+import tarfile
+import tempfile
+import zipfile
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+DOCUMENT_EXTENSIONS = (".pdf", ".txt")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".bmp")
+SPOOL_PREFIX = "upload-"
+
+
+class SpooledFile:
+    """A document on disk. `owned` files are spool copies and are deleted by `remove()`."""
+
+    def __init__(self, path: str, name: str, size: int, sha256: str, owned: bool = True):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.sha256 = sha256
+        self.owned = owned
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def remove(self):
+        if self.owned:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.owned = False
+
+
+class SpoolWriter:
+    """Writes a file to `directory` chunk by chunk, hashing as it goes."""
+
+    def __init__(self, directory: str, name: str):
+        os.makedirs(directory, exist_ok=True)
+        suffix = os.path.splitext(name)[1].lower()
+        fd, self.path = tempfile.mkstemp(prefix=SPOOL_PREFIX, suffix=suffix, dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._hash = hashlib.sha256()
+        self.name = name
+        self.size = 0
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self._hash.update(data)
+        self.size += len(data)
+
+    def close(self) -> SpooledFile:
+        self._file.close()
+        return SpooledFile(self.path, self.name, self.size, self._hash.hexdigest())
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+def spool_fileobj(fileobj: BinaryIO, directory: str, name: str, chunk_size: int = 1 << 20,
+                  max_bytes: Optional[int] = None, too_large: str = "File is too large") -> SpooledFile:
+    """Copy `fileobj` to a spool file; past `max_bytes` the copy is dropped and ValueError(too_large) raised."""
+    writer = SpoolWriter(directory, name)
+    try:
+        while True:
+            data = fileobj.read(chunk_size)
+            if not data:
+                break
+            if max_bytes is not None and writer.size + len(data) > max_bytes:
+                raise ValueError(too_large)
+            writer.write(data)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+def hash_path(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(chunk_size), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def clear_spool(directory: str) -> int:
+    """Delete spool files left behind by a previous run (jobs don't survive restarts)."""
+    removed = 0
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.startswith(SPOOL_PREFIX):
+                try:
+                    os.unlink(os.path.join(directory, name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def _is_document(name: str) -> bool:
+    base = os.path.basename(name)
+    return bool(base) and not base.startswith(".") and base.lower().endswith(DOCUMENT_EXTENSIONS)
+
+
+def resolve_directory(directory: str, allowed_roots: List[str]) -> str:
+    """Real path of `directory`, which must lie inside one of `allowed_roots`."""
+    if not allowed_roots:
+        raise ValueError("Directory ingestion is disabled; set BULK_INGEST_ROOTS to allow it.")
+    path = os.path.realpath(directory)
+    for root in allowed_roots:
+        root = os.path.realpath(root)
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            if not os.path.isdir(path):
+                raise ValueError(f"Not a directory: {directory}")
+            return path
+    raise ValueError(f"Directory is outside BULK_INGEST_ROOTS: {directory}")
+
+
+class BulkSource:
+    """The PDF/TXT documents inside an archive or directory.
+
+    `names` lists them up front; `iter_files()` then yields
+    `(name, SpooledFile or None, error)` per document, in the same order.
+    Archive members are spooled to `spool_dir`, at most `max_file_bytes` each
+    and `max_total_bytes` for the whole archive; a member over either limit
+    is reported as an error and the rest keep going. Directory files are used
+    in place and never deleted. Symlinks leading out of the directory are
+    skipped.
+    """
+
+    def __init__(self, path: str, spool_dir: str, max_files: int, chunk_size: int = 1 << 20,
+                 max_file_bytes: Optional[int] = None, max_total_bytes: Optional[int] = None):
+        self.path = path
+        self.spool_dir = spool_dir
+        self.chunk_size = chunk_size
+        self.max_file_bytes = max_file_bytes
+        self.max_total_bytes = max_total_bytes
+        self._archive = None
+        if os.path.isdir(path):
+            self.kind = "directory"
+            self._entries = self._walk()
+        elif zipfile.is_zipfile(path):
+            self.kind = "zip"
+            self._archive = zipfile.ZipFile(path)
+            self._entries = [(m.filename, m) for m in self._archive.infolist()
+                             if not m.is_dir() and _is_document(m.filename)]
+        elif tarfile.is_tarfile(path):
+            self.kind = "tar"
+            self._archive = tarfile.open(path)
+            self._entries = [(m.name, m) for m in self._archive.getmembers() if m.isfile() and _is_document(m.name)]
+        else:
+            raise ValueError("Expected a zip or tar archive, or a directory.")
+        if len(self._entries) > max_files:
+            self.close()
+            raise ValueError(f"Bulk ingest exceeds {max_files} documents ({len(self._entries)} found)")
+
+    def _walk(self) -> List[Tuple[str, str]]:
+        root = os.path.realpath(self.path)
+        entries = []
+        for folder, dirs, files in os.walk(root):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(files):
+                full = os.path.join(folder, name)
+                real = os.path.realpath(full)
+                if _is_document(name) and real.startswith(root + os.sep) and os.path.isfile(real):
+                    entries.append((os.path.relpath(full, root), real))
+        return entries
+
+    @property
+    def names(self) -> List[str]:
+        return [name for name, _ in self._entries]
+
+    def _open(self, entry) -> Optional[BinaryIO]:
+        if self.kind == "zip":
+            return self._archive.open(entry)
+        return self._archive.extractfile(entry)
+
+    def _member_limit(self, name: str, spooled: int) -> Tuple[Optional[int], str]:
+        """Bytes the member `name` may take after `spooled` bytes of the archive, and the error past that."""
+        limit, error = None, ""
+        if self.max_file_bytes is not None:
+            limit, error = self.max_file_bytes, f"{name} is larger than {self.max_file_bytes // (1024 * 1024)} MB"
+        if self.max_total_bytes is not None and (limit is None or self.max_total_bytes - spooled < limit):
+            limit = max(0, self.max_total_bytes - spooled)
+            error = f"Archive exceeds {self.max_total_bytes // (1024 * 1024)} MB uncompressed; {name} was skipped"
+        return limit, error
+
+    def iter_files(self) -> Iterator[Tuple[str, Optional[SpooledFile], Optional[str]]]:
+        spooled_bytes = 0
+        for name, entry in self._entries:
+            try:
+                if self.kind == "directory":
+                    size = os.path.getsize(entry)
+                    spooled = SpooledFile(entry, name, size, hash_path(entry, self.chunk_size), owned=False)
+                else:
+                    # Checked against the declared size first, then again while copying in case it lies
+                    limit, too_large = self._member_limit(name, spooled_bytes)
+                    declared = entry.file_size if self.kind == "zip" else entry.size
+                    if limit is not None and declared > limit:
+                        raise ValueError(too_large)
+                    with self._open(entry) as member:
+                        spooled = spool_fileobj(member, self.spool_dir, name, self.chunk_size, limit, too_large)
+                    spooled_bytes += spooled.size
+            except Exception as e:
+                yield name, None, str(e)
+                continue
+            yield name, spooled, None
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+class BatchImage:
+    """One image of a batch: a spooled upload, or a member of a spooled zip."""
+
+    def __init__(self, name: str, path: str, size: int, member: Optional[zipfile.ZipInfo] = None):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.member = member
+
+    def read(self) -> bytes:
+        if self.member is None:
+            with open(self.path, "rb") as f:
+                return f.read()
+        # Opened per image, so only the images being analyzed are in memory
+        with zipfile.ZipFile(self.path) as archive, archive.open(self.member) as f:
+            return f.read()
+
+
+def batch_images(uploads: List[SpooledFile], max_files: int, max_image_bytes: int,
+                 max_total_bytes: int) -> List[BatchImage]:
+    """The images among `uploads`, expanding zips into their image members (nothing is read yet).
+
+    Zip members are limited by their declared uncompressed size, which
+    zipfile also enforces while reading.
+    """
+    images: List[BatchImage] = []
+    total = 0
+
+    def accept(image: BatchImage):
+        nonlocal total
+        if len(images) >= max_files:
+            raise ValueError(f"Batch exceeds {max_files} images")
+        if image.size > max_image_bytes:
+            raise ValueError(f"{image.name} is larger than {max_image_bytes // (1024 * 1024)} MB")
+        total += image.size
+        if total > max_total_bytes:
+            raise ValueError(f"Batch exceeds {max_total_bytes // (1024 * 1024)} MB of images")
+        images.append(image)
+
+    for upload in uploads:
+        if not upload.name.lower().endswith(".zip"):
+            accept(BatchImage(upload.name, upload.path, upload.size))
+            continue
+        with zipfile.ZipFile(upload.path) as archive:
+            for member in archive.infolist():
+                base = os.path.basename(member.filename)
+                if member.is_dir() or base.startswith(".") or not base.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                accept(BatchImage(member.filename, upload.path, member.file_size, member))
+    return images
@@ -0,0 +1,220 @@
+"""Calls into another local process over a Unix socket.
+
+With several uvicorn workers, one process (the vector service) owns the
+embedding model, the vector store, BM25, the registry, the caches and the
+ingest jobs. The HTTP workers reach those objects through `RemoteObject`
+proxies, so a method call like `REGISTRY.list(0, 100)` becomes one round trip
+to the service and the model is loaded once.
+
+The wire format is a length-prefixed pickle in both directions. Requests are
+`(object name, attribute, args, kwargs)`, and replies are `(ok, value)` where a
+failed call carries the exception. Pickle trusts its peer, so the socket is
+created mode 0600 and is meant for processes of the same user only.
+
+`ServiceServer` handles each connection on its own thread, like the worker
+pools do in-process. Coroutine results, and every call to objects listed in
+`on_loop`, run on the service's event loop instead.
+"""
+import asyncio
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+from typing import Iterable, Optional
+
+_HEADER = struct.Struct("!Q")
+
+
+class ServiceError(RuntimeError):
+    """A remote call failed with an exception that couldn't be sent back as-is."""
+
+
+def _send(sock: socket.socket, obj):
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while size:
+        n = sock.recv_into(view[-size:], size)
+        if not n:
+            raise ConnectionError("vector service closed the connection")
+        size -= n
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return pickle.loads(_recv_exact(sock, size))
+
+
+class ServiceServer:
+    """Serves the attributes of `root` (e.g. a module) over a Unix socket.
+
+    A request for `(name, attr)` calls `getattr(getattr(root, name), attr)`,
+    looked up at call time, so rebinding a global (like the store once it is
+    opened) is seen by every worker. An empty `name` addresses `root` itself.
+    Attributes that aren't callable are returned as values.
+    """
+
+    def __init__(self, path: str, root, loop: asyncio.AbstractEventLoop, on_loop: Iterable[str] = ()):
+        self.path = path
+        self.root = root
+        self.loop = loop
+        self.on_loop = set(on_loop)
+        self._sock: Optional[socket.socket] = None
+        self._connections = set()
+        self._lock = threading.Lock()
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # left by a previous run
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o177)
+        try:
+            sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        sock.listen(128)
+        self._sock = sock
+        threading.Thread(target=self._accept, name="service-accept", daemon=True).start()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        with self._lock:
+            for conn in list(self._connections):
+                conn.close()
+
+    def _accept(self):
+        while self._sock is not None:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._connections.add(conn)
+            threading.Thread(target=self._serve, args=(conn,), name="service-conn", daemon=True).start()
+
+    def _serve(self, conn: socket.socket):
+        try:
+            while True:
+                try:
+                    name, attr, args, kwargs = _recv(conn)
+                except (ConnectionError, OSError):
+                    return
+                try:
+                    reply = (True, self._dispatch(name, attr, args, kwargs))
+                except Exception as e:
+                    reply = (False, e)
+                try:
+                    _send(conn, reply)
+                except (pickle.PicklingError, TypeError, AttributeError) as e:
+                    _send(conn, (False, ServiceError(f"{type(reply[1]).__name__}: {reply[1]} ({e})")))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def _dispatch(self, name: str, attr: str, args, kwargs):
+        if name in self.on_loop:
+            return asyncio.run_coroutine_threadsafe(self._call_async(name, attr, args, kwargs), self.loop).result()
+        result = self._call(name, attr, args, kwargs)
+        if asyncio.iscoroutine(result):
+            result = asyncio.run_coroutine_threadsafe(result, self.loop).result()
+        return result
+
+    async def _call_async(self, name: str, attr: str, args, kwargs):
+        result = self._call(name, attr, args, kwargs)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    def _call(self, name: str, attr: str, args, kwargs):
+        target = getattr(getattr(self.root, name) if name else self.root, attr)
+        return target(*args, **kwargs) if callable(target) else target
+
+
+class ServiceClient:
+    """Blocking client with one connection per thread, opened on first use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def call(self, name: str, attr: str, *args, **kwargs):
+        sock = self._connection()
+        try:
+            _send(sock, (name, attr, args, kwargs))
+            ok, value = _recv(sock)
+        except BaseException:
+            # The stream may be mid-message; the next call reconnects
+            self._local.sock = None
+            sock.close()
+            raise
+        if not ok:
+            raise value
+        return value
+
+    def wait(self, timeout: float = 60.0, poll: float = 0.1):
+        """Block until the service accepts connections."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._connection()
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise ConnectionError(f"vector service at {self.path} did not start within {timeout:.0f}s")
+                time.sleep(poll)
+
+
+class RemoteObject:
+    """Stands in for the service object `name`: every attribute is a blocking call to it.
+
+    Like the local objects it replaces, it is called from worker pool threads
+    (`run_in_pool(VECTOR_POOL, REGISTRY.list, ...)`), never on the event loop.
+    """
+
+    def __init__(self, client: ServiceClient, name: str):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, attr: str):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+
+        def call(*args, **kwargs):
+            return self._client.call(self._name, attr, *args, **kwargs)
+
+        call.__name__ = f"{self._name}.{attr}"
+        return call
+
+    def __repr__(self):
+        return f"<RemoteObject {self._name} at {self._client.path}>"
@@ -0,0 +1,642 @@
+"""Vector stores behind retrieval: Chroma, or a built-in memory-mapped index.
+
+A store keeps chunks (id, text, embedding, metadata) and answers what the
+RAG pipeline asks of it: the nearest chunks to a question, optionally within
+one document; chunks by id; a document's chunks; stored vectors by chunk hash
+(so known chunks aren't embedded again); and a full scan for rebuilding BM25
+and the registry.
+
+- `ChromaStore` wraps a Chroma persistent collection.
+- `LocalStore` keeps vectors in a memory-mapped matrix on disk, as float32,
+  float16 or int8 with a per-row scale. Texts and metadata live in SQLite,
+  so RSS only holds the pages a query touches. Search is exact, batched
+  NumPy over blocks of rows. Once the store is large, an IVF index (k-means
+  lists) narrows each query to the rows in its closest lists. Every
+  document is a partition, so a query filtered to one doc_id scores only
+  that document's rows.
+"""
+import json
+import math
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (chunk id, text, embedding)
+Chunk = Tuple[str, str, np.ndarray]
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+class ChromaStore:
+    name = "chroma"
+
+    def __init__(self, path: str, collection: str = "zentro_docs"):
+        import chromadb
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection_name = collection
+        self._collection = self._client.get_or_create_collection(name=collection)
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def add(self, ids: List[str], documents: List[str], embeddings, metadatas: List[dict]):
+        self._collection.add(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        for start in range(0, len(ids), 1000):
+            self._collection.update(ids=ids[start:start + 1000], metadatas=metadatas[start:start + 1000])
+
+    def delete(self, ids: List[str]):
+        for start in range(0, len(ids), 1000):
+            self._collection.delete(ids=ids[start:start + 1000])
+
+    def delete_document(self, doc_id: str):
+        self._collection.delete(where={"doc_id": doc_id})
+
+    def get(self, ids: List[str]) -> List[Chunk]:
+        if not ids:
+            return []
+        data = self._collection.get(ids=ids, include=["documents", "embeddings"])
+        return list(zip(data["ids"], data["documents"], data["embeddings"]))
+
+    def document_chunks(self, doc_id: str) -> List[Tuple[str, dict]]:
+        data = self._collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+        return [(chunk_id, meta or {}) for chunk_id, meta in zip(data["ids"], data["metadatas"] or [])]
+
+    def vectors_by_hash(self, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        if not hashes:
+            return {}
+        data = self._collection.get(
+            where={"chunk_hash": {"$in": list(set(hashes))}},
+            include=["embeddings", "metadatas"],
+        )
+        found = {}
+        for meta, vector in zip(data["metadatas"] or [], data["embeddings"] if data["embeddings"] is not None else []):
+            if meta and meta.get("chunk_hash"):
+                found[meta["chunk_hash"]] = list(vector)
+        return found
+
+    def query(self, vector, k: int, doc_id: Optional[str] = None) -> List[Chunk]:
+        results = self._collection.query(
+            query_embeddings=[vector],
+            n_results=k,
+            where={"doc_id": doc_id} if doc_id else None,
+            include=["documents", "embeddings"],
+        )
+        if not results["documents"] or not results["documents"][0]:
+            return []
+        return list(zip(results["ids"][0], results["documents"][0], results["embeddings"][0]))
+
+    def scan(self, batch_size: int = 5000) -> Iterator[List[Tuple[str, str, dict]]]:
+        """Every chunk as batches of (id, text, metadata)."""
+        offset = 0
+        while True:
+            data = self._collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+            if not data["ids"]:
+                return
+            yield list(zip(data["ids"], data["documents"], [meta or {} for meta in data["metadatas"]]))
+            offset += len(data["ids"])
+
+    def reset(self):
+        self._client.delete_collection(self._collection_name)
+        self._collection = self._client.get_or_create_collection(name=self._collection_name)
+
+    def stats(self) -> dict:
+        return {"engine": self.name, "chunks": self.count()}
+
+    def close(self):
+        pass
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _nearest(x: np.ndarray, centroids: np.ndarray, block: int = 4096) -> np.ndarray:
+    return np.concatenate([np.argmax(x[i:i + block] @ centroids.T, axis=1) for i in range(0, len(x), block)])
+
+
+def _kmeans(x: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Spherical k-means on unit rows; returns unit centroids."""
+    centroids = x[rng.choice(len(x), k, replace=False)]
+    for _ in range(iterations):
+        assign = _nearest(x, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, x)
+        empty = np.bincount(assign, minlength=k) == 0
+        sums[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]  # reseed empty lists
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted lists over the rows below `indexed_upto`: list i holds rows[offsets[i]:offsets[i + 1]]."""
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, rows: np.ndarray, indexed_upto: int):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.indexed_upto = indexed_upto
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        probes = min(probes, len(self.centroids))
+        closest = np.argpartition(-(self.centroids @ query), probes - 1)[:probes]
+        return np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in closest])
+
+    def save(self, path: str):
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, centroids=self.centroids, offsets=self.offsets, rows=self.rows,
+                 indexed_upto=np.int64(self.indexed_upto))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            return cls(data["centroids"], data["offsets"], data["rows"], int(data["indexed_upto"]))
+
+
+class LocalStore:
+    """Memory-mapped vector store with exact search, an optional IVF index and per-document partitions.
+
+    Row i of `vectors-<generation>.bin` is the vector of the chunk whose SQLite
+    `row` is i; `scales-<generation>.bin` holds each row's (scale, norm).
+    Deleted rows are skipped until a compaction rewrites the files in
+    doc_id order, which also makes every partition contiguous. Compaction
+    bumps the generation, so a reader never sees renumbered rows. SQLite is
+    the source of truth: vectors are written before their rows are
+    committed, so a crash leaves at most unreferenced vector rows.
+
+    `index` is "exact", "ivf", or "auto" (IVF once `ann_min_chunks` chunks are
+    stored). The IVF index is built in the background and persisted; rows
+    added after it was built are scanned exactly until the next rebuild.
+    Queries filtered to a document always scan that partition exactly.
+    """
+
+    name = "local"
+
+    def __init__(self, path: str, dtype: str = "float32", index: str = "auto", ann_min_chunks: int = 50000,
+                 ann_probes: int = 32, block_rows: int = 16384, compact_ratio: float = 0.25):
+        if dtype not in _DTYPES:
+            raise ValueError(f"Unknown VECTOR_DTYPE: {dtype} (use float32, float16 or int8)")
+        if index not in ("auto", "exact", "ivf"):
+            raise ValueError(f"Unknown VECTOR_INDEX: {index} (use auto, exact or ivf)")
+        self.path = path
+        self.index = index
+        self.ann_min_chunks = ann_min_chunks if index == "auto" else 1024
+        self.ann_probes = ann_probes
+        self.block_rows = block_rows
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        self._building = False
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(path, "chunks.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " row INTEGER PRIMARY KEY,"
+            " id TEXT NOT NULL UNIQUE,"
+            " doc_id TEXT NOT NULL,"
+            " chunk_hash TEXT,"
+            " document TEXT NOT NULL,"
+            " metadata TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_hash ON chunks (chunk_hash)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+        settings = dict(self._db.execute("SELECT key, value FROM settings").fetchall())
+        stored = settings.get("dtype")
+        if stored and stored != dtype and settings.get("dim"):
+            print(f"Local vector store at {path} holds {stored} vectors; ignoring VECTOR_DTYPE={dtype}", flush=True)
+            dtype = stored
+        self.dtype = dtype
+        self.dim: Optional[int] = int(settings["dim"]) if settings.get("dim") else None
+        self._generation = int(settings.get("generation", 0))
+        self._load(int(settings.get("next_row", 0)))
+
+    # -- files and in-memory state -------------------------------------------------
+
+    def _file(self, kind: str, generation: Optional[int] = None) -> str:
+        generation = self._generation if generation is None else generation
+        suffix = "npz" if kind == "ivf" else "bin"
+        return os.path.join(self.path, f"{kind}-{generation}.{suffix}")
+
+    def _open_maps(self, capacity: int):
+        for kind, width, dtype in (("vectors", self.dim, _DTYPES[self.dtype]), ("scales", 2, np.float32)):
+            path = self._file(kind)
+            size = capacity * width * np.dtype(dtype).itemsize
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        self._vectors = np.memmap(self._file("vectors"), dtype=_DTYPES[self.dtype], mode="r+",
+                                  shape=(capacity, self.dim))
+        self._scales = np.memmap(self._file("scales"), dtype=np.float32, mode="r+", shape=(capacity, 2))
+        self._capacity = capacity
+
+    def _load(self, next_row: int):
+        self._vectors = self._scales = None
+        self._capacity = 0
+        self._ivf: Optional[IVFIndex] = None
+        self._partitions: Dict[str, np.ndarray] = {}
+        # Rows come back grouped by document, so partitions are cut from one pass
+        row_numbers, bounds, current, start = array("q"), [], None, 0
+        for row, doc_id in self._db.execute("SELECT row, doc_id FROM chunks ORDER BY doc_id, row"):
+            if doc_id != current:
+                if current is not None:
+                    bounds.append((current, start, len(row_numbers)))
+                current, start = doc_id, len(row_numbers)
+            row_numbers.append(row)
+        if current is not None:
+            bounds.append((current, start, len(row_numbers)))
+        rows = np.frombuffer(row_numbers, dtype=np.int64) if row_numbers else np.zeros(0, dtype=np.int64)
+        for doc_id, first, last in bounds:
+            self._partitions[doc_id] = rows[first:last]
+        self._live = len(rows)
+        self._rows = max(next_row, int(rows.max()) + 1 if len(rows) else 0)
+        self._alive = np.zeros(0, dtype=bool)
+        if self.dim is not None:
+            itemsize = np.dtype(_DTYPES[self.dtype]).itemsize
+            on_disk = os.path.getsize(self._file("vectors")) if os.path.exists(self._file("vectors")) else 0
+            if self.index != "exact" and os.path.exists(self._file("ivf")):
+                self._ivf = IVFIndex.load(self._file("ivf"))
+                self._rows = max(self._rows, self._ivf.indexed_upto)
+            self._open_maps(max(self._rows, on_disk // (self.dim * itemsize), 1024))
+            self._alive = np.zeros(self._capacity, dtype=bool)
+            self._alive[rows] = True
+        self._remove_stale_files()
+
+    def _remove_stale_files(self):
+        current = {os.path.basename(self._file(kind)) for kind in ("vectors", "scales", "ivf")}
+        for name in os.listdir(self.path):
+            if name.startswith(("vectors-", "scales-", "ivf-")) and name not in current:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, self._capacity * 2, 1024)
+        self._open_maps(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive  # replaced, not resized, so running searches keep a consistent view
+
+    def _set(self, key: str, value):
+        self._db.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", (key, str(value)))
+
+    # -- encoding --------------------------------------------------------------------
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Stored rows plus (scale, norm) per row; norms are of what is stored, so scores stay consistent."""
+        if self.dtype == "int8":
+            peak = np.abs(vectors).max(axis=1)
+            scale = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+            stored = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+        else:
+            scale = np.ones(len(vectors), dtype=np.float32)
+            stored = vectors.astype(_DTYPES[self.dtype])
+        norms = np.linalg.norm(stored.astype(np.float32) * scale[:, None], axis=1)
+        return stored, np.stack([scale, norms], axis=1).astype(np.float32)
+
+    @staticmethod
+    def _decode(vectors, scales, rows) -> np.ndarray:
+        return vectors[rows].astype(np.float32) * scales[rows, 0][:, None]
+
+    # -- writes ----------------------------------------------------------------------
+
+    def count(self) -> int:
+        return self._live
+
+    def add(self, ids: List[str], documents: List[str], embeddings, metadatas: List[dict]):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if not len(ids):
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with self._db:
+                    self._set("dim", self.dim)
+                    self._set("dtype", self.dtype)
+                self._open_maps(1024)
+                self._alive = np.zeros(self._capacity, dtype=bool)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} doesn't match the store's {self.dim}")
+            start = self._rows
+            self._ensure_capacity(start + len(ids))
+            stored, scales = self._encode(vectors)
+            self._vectors[start:start + len(ids)] = stored
+            self._scales[start:start + len(ids)] = scales
+            self._vectors.flush()
+            self._scales.flush()
+            rows = np.arange(start, start + len(ids), dtype=np.int64)
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (int(row), chunk_id, meta["doc_id"], meta.get("chunk_hash"), text, json.dumps(meta))
+                        for row, chunk_id, text, meta in zip(rows, ids, documents, metadatas)
+                    ],
+                )
+                self._set("next_row", start + len(ids))
+            self._rows = start + len(ids)
+            self._alive[rows] = True
+            self._live += len(ids)
+            doc_ids = np.asarray([meta["doc_id"] for meta in metadatas])
+            for doc_id in dict.fromkeys(doc_ids.tolist()):
+                new = rows[doc_ids == doc_id]
+                old = self._partitions.get(doc_id)
+                self._partitions[doc_id] = new if old is None else np.concatenate([old, new])
+        self._maybe_build_index()
+
+    def update_metadata(self, ids: List[str], metadatas: List[dict]):
+        """Replace chunk metadata; a chunk keeps the doc_id it was added with."""
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE chunks SET chunk_hash = ?, metadata = ? WHERE id = ?",
+                [(meta.get("chunk_hash"), json.dumps(meta), chunk_id) for chunk_id, meta in zip(ids, metadatas)],
+            )
+
+    def _drop_rows(self, rows: np.ndarray, doc_ids: List[str]):
+        self._alive[rows] = False
+        self._live -= len(rows)
+        for doc_id in set(doc_ids):
+            remaining = np.setdiff1d(self._partitions.get(doc_id, rows[:0]), rows, assume_unique=True)
+            if len(remaining):
+                self._partitions[doc_id] = remaining
+            else:
+                self._partitions.pop(doc_id, None)
+        if self._rows - self._live > max(self.block_rows, self.compact_ratio * self._rows):
+            self.compact()
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            found = []
+            for start in range(0, len(ids), _MAX_PARAMS):
+                part = ids[start:start + _MAX_PARAMS]
+                marks = ",".join("?" * len(part))
+                found += self._db.execute(f"SELECT row, doc_id FROM chunks WHERE id IN ({marks})", part).fetchall()
+                with self._db:
+                    self._db.execute(f"DELETE FROM chunks WHERE id IN ({marks})", part)
+            if found:
+                self._drop_rows(np.asarray([row for row, _ in found], dtype=np.int64), [d for _, d in found])
+
+    def delete_document(self, doc_id: str):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+            rows = self._partitions.get(doc_id)
+            if rows is not None:
+                self._drop_rows(rows, [doc_id])
+
+    def compact(self):
+        """Rewrite the live rows in doc_id order under a new generation (blocking)."""
+        with self._lock:
+            if self.dim is None:
+                return
+            old_rows = np.fromiter(
+                (row for (row,) in self._db.execute("SELECT row FROM chunks ORDER BY doc_id, row")), dtype=np.int64
+            )
+            old_vectors, old_scales = self._vectors, self._scales
+            self._generation += 1
+            self._open_maps(max(len(old_rows), 1024))
+            for start in range(0, len(old_rows), self.block_rows):
+                part = old_rows[start:start + self.block_rows]
+                self._vectors[start:start + len(part)] = old_vectors[part]
+                self._scales[start:start + len(part)] = old_scales[part]
+            self._vectors.flush()
+            self._scales.flush()
+            with self._db:
+                # Two passes, so the new row numbers never collide with old ones
+                self._db.execute("UPDATE chunks SET row = -1 - row")
+                self._db.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?",
+                    [(new, -1 - int(old)) for new, old in enumerate(old_rows)],
+                )
+                self._set("generation", self._generation)
+                self._set("next_row", len(old_rows))
+            self._load(len(old_rows))
+        self._maybe_build_index()
+
+    def reset(self):
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM chunks")
+                self._db.execute("DELETE FROM settings")
+                self._generation += 1
+                self._set("generation", self._generation)
+            self.dim = None
+            self._load(0)
+
+    # -- reads -----------------------------------------------------------------------
+
+    def _rows_for(self, where: str, values: Sequence) -> List[tuple]:
+        found = []
+        values = list(values)
+        for start in range(0, len(values), _MAX_PARAMS):
+            part = values[start:start + _MAX_PARAMS]
+            marks = ",".join("?" * len(part))
+            found += self._db.execute(where.format(marks=marks), part).fetchall()
+        return found
+
+    def get(self, ids: List[str]) -> List[Chunk]:
+        with self._lock:
+            found = self._rows_for("SELECT row, id, document FROM chunks WHERE id IN ({marks})", ids)
+            if not found:
+                return []
+            vectors = self._decode(self._vectors, self._scales, np.asarray([row for row, _, _ in found]))
+        return [(chunk_id, text, vector) for (_, chunk_id, text), vector in zip(found, vectors)]
+
+    def document_chunks(self, doc_id: str) -> List[Tuple[str, dict]]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, metadata FROM chunks WHERE doc_id = ? ORDER BY row", (doc_id,))
+            return [(chunk_id, json.loads(meta)) for chunk_id, meta in rows.fetchall()]
+
+    def vectors_by_hash(self, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        with self._lock:
+            found = self._rows_for("SELECT chunk_hash, row FROM chunks WHERE chunk_hash IN ({marks})", set(hashes))
+            if not found:
+                return {}
+            vectors = self._decode(self._vectors, self._scales, np.asarray([row for _, row in found]))
+        return {h: vector.tolist() for (h, _), vector in zip(found, vectors)}
+
+    def scan(self, batch_size: int = 5000) -> Iterator[List[Tuple[str, str, dict]]]:
+        """Every chunk as batches of (id, text, metadata), in row order."""
+        last = -1
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT row, id, document, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?",
+                    (last, batch_size),
+                ).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [(chunk_id, text, json.loads(meta)) for _, chunk_id, text, meta in rows]
+
+    def _top_k(self, vectors, scales, alive, queries: np.ndarray, k: int, rows: Optional[np.ndarray] = None,
+               limit: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k (scores, rows) per query over `rows`, or over every live row below `limit`."""
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        total = len(rows) if rows is not None else limit
+        for start in range(0, total, self.block_rows):
+            if rows is not None:
+                block = rows[start:start + self.block_rows]
+                data, weights = vectors[block], scales[block]
+                dead = None
+            else:
+                block = np.arange(start, min(start + self.block_rows, limit), dtype=np.int64)
+                data, weights = vectors[start:start + len(block)], scales[start:start + len(block)]
+                dead = ~alive[start:start + len(block)]
+            norms = weights[:, 1]
+            weight = np.divide(weights[:, 0], norms, out=np.zeros_like(norms), where=norms > 0)
+            scores = (queries @ data.astype(np.float32, copy=False).T) * weight
+            if dead is not None and dead.any():
+                scores[:, dead] = -np.inf
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(block, scores.shape)], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def search(self, queries, k: int, doc_id: Optional[str] = None) -> List[List[Tuple[str, str, np.ndarray, float]]]:
+        """Batched nearest-chunk search by cosine similarity: [(id, text, embedding, score), ...] per query."""
+        queries = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        while True:
+            with self._lock:
+                if self.dim is None or not self._live or k <= 0:
+                    return [[] for _ in queries]
+                generation, vectors, scales, alive = self._generation, self._vectors, self._scales, self._alive
+                limit, ivf = self._rows, self._ivf
+                partition = self._partitions.get(doc_id) if doc_id else None
+            if doc_id and partition is None:
+                return [[] for _ in queries]
+
+            hits = []
+            if doc_id:
+                scores, rows = self._top_k(vectors, scales, alive, queries, k, rows=partition)
+                hits = list(zip(scores, rows))
+            elif ivf is not None:
+                tail = np.arange(ivf.indexed_upto, limit, dtype=np.int64)
+                for query in queries:
+                    candidates = np.concatenate([ivf.candidates(query, self.ann_probes), tail])
+                    candidates = candidates[alive[candidates]]
+                    scores, rows = self._top_k(vectors, scales, alive, query[None], k, rows=candidates)
+                    hits.append((scores[0], rows[0]))
+            else:
+                scores, rows = self._top_k(vectors, scales, alive, queries, k, limit=limit)
+                hits = list(zip(scores, rows))
+
+            with self._lock:
+                if generation != self._generation:
+                    continue  # a compaction renumbered the rows while we searched
+                wanted = {int(row) for scores, rows in hits for score, row in zip(scores, rows) if score > -np.inf}
+                texts = {row: (chunk_id, text) for row, chunk_id, text in
+                         self._rows_for("SELECT row, id, document FROM chunks WHERE row IN ({marks})", wanted)}
+            results = []
+            for scores, rows in hits:
+                keep = [(float(score), int(row)) for score, row in zip(scores, rows) if int(row) in texts]
+                embeddings = self._decode(vectors, scales, np.asarray([row for _, row in keep], dtype=np.int64))
+                results.append([(*texts[row], embedding, score) for (score, row), embedding in zip(keep, embeddings)])
+            return results
+
+    def query(self, vector, k: int, doc_id: Optional[str] = None) -> List[Chunk]:
+        return [(chunk_id, text, embedding) for chunk_id, text, embedding, _ in self.search([vector], k, doc_id)[0]]
+
+    # -- approximate index -----------------------------------------------------------
+
+    def _maybe_build_index(self):
+        """Start a background IVF build when the store outgrows exact search or the index goes stale."""
+        if self.index == "exact" or self._live < self.ann_min_chunks:
+            return
+        with self._lock:
+            ivf = self._ivf
+            stale = ivf is None or (self._rows - ivf.indexed_upto) > 0.2 * max(ivf.indexed_upto, 1)
+            if not stale or self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, name="vector-index", daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            self.build_index()
+        except Exception as e:
+            print(f"Building the vector index failed: {e}", flush=True)
+        finally:
+            self._building = False
+
+    def build_index(self, lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> Optional[IVFIndex]:
+        """Train k-means lists on a sample and assign every live row to one (blocking)."""
+        with self._lock:
+            if self.dim is None or not self._live:
+                return None
+            generation, vectors, scales, limit = self._generation, self._vectors, self._scales, self._rows
+            rows = np.flatnonzero(self._alive[:limit]).astype(np.int64)
+        lists = lists or int(min(max(math.sqrt(len(rows)), 16), 4096))
+        lists = min(lists, len(rows))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(rows, min(len(rows), lists * 32), replace=False))
+        centroids = _kmeans(_normalize(self._decode(vectors, scales, sample)), lists, iterations, rng)
+        assign = np.concatenate([
+            _nearest(_normalize(self._decode(vectors, scales, rows[i:i + self.block_rows])), centroids)
+            for i in range(0, len(rows), self.block_rows)
+        ])
+        order = np.argsort(assign, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=lists))]).astype(np.int64)
+        ivf = IVFIndex(centroids.astype(np.float32), offsets, rows[order], limit)
+        with self._lock:
+            if generation != self._generation:
+                return None  # compacted or cleared meanwhile; the next write starts another build
+            ivf.save(self._file("ivf"))
+            self._ivf = ivf
+        return ivf
+
+    # -- misc ------------------------------------------------------------------------
+
+    def stats(self) -> dict:
+        with self._lock:
+            ivf = self._ivf
+            on_disk = sum(os.path.getsize(self._file(kind)) for kind in ("vectors", "scales", "ivf")
+                          if os.path.exists(self._file(kind)))
+            return {
+                "engine": self.name,
+                "chunks": self._live,
+                "documents": len(self._partitions),
+                "dim": self.dim,
+                "dtype": self.dtype,
+                "deleted_rows": self._rows - self._live,
+                "vector_bytes": on_disk,
+                "index": "ivf" if ivf is not None else "exact",
+                "ivf_lists": len(ivf.centroids) if ivf is not None else None,
+                "ivf_unindexed_rows": self._rows - ivf.indexed_upto if ivf is not None else None,
+                "ann_probes": self.ann_probes,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._scales.flush()
+            self._db.close()
+
+
+def open_store(engine: str, path: str, **options):
+    """Open the store named by VECTOR_STORE; `options` configure the local engine (Chroma ignores them)."""
+    if engine == "chroma":
+        return ChromaStore(path)
+    if engine == "local":
+        return LocalStore(path, **options)
+    raise ValueError(f"Unknown VECTOR_STORE: {engine} (use 'chroma' or 'local')")